@@ -0,0 +1,144 @@
+import bisect
+import json
+import os
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+CATALOG_NAME = "catalog.json"
+CATALOG_VERSION = 1
+
+# Bucket key per GFS period, entries in the same bucket count as one
+_PERIODS = {
+    "hourly": lambda t: t.strftime("%Y-%m-%dT%H"),
+    "daily": lambda t: t.strftime("%Y-%m-%d"),
+    "weekly": lambda t: "%d-W%02d" % t.isocalendar()[:2],
+    "monthly": lambda t: t.strftime("%Y-%m"),
+}
+
+
+@dataclass(frozen=True)
+class RetentionPolicy:
+    """
+    Grandfather-father-son retention: the newest `last` backups are kept, plus the
+    newest backup of each of the latest `hourly` hours, `daily` days, `weekly`
+    ISO weeks and `monthly` months.
+    """
+
+    last: int = 10
+    hourly: int = 0
+    daily: int = 0
+    weekly: int = 0
+    monthly: int = 0
+
+    @classmethod
+    def from_env(
+        cls, last: int | None = None, prefix: str = "BACKUP_"
+    ) -> "RetentionPolicy":
+        """
+        Read <prefix>KEEP_LAST/HOURLY/DAILY/WEEKLY/MONTHLY, falling back to the
+        global BACKUP_KEEP_* settings.
+        """
+
+        def keep(period: str, default: str) -> int:
+            fallback = os.getenv(f"BACKUP_KEEP_{period}", default)
+            return int(os.getenv(f"{prefix}KEEP_{period}", fallback))
+
+        return cls(
+            last=last if last is not None else keep("LAST", "10"),
+            hourly=keep("HOURLY", "0"),
+            daily=keep("DAILY", "0"),
+            weekly=keep("WEEKLY", "0"),
+            monthly=keep("MONTHLY", "0"),
+        )
+
+    def select(self, entries: list[dict]) -> set[str]:
+        """
+        Names of the entries to keep.
+
+        Arguments:
+            entries (list[dict]): Catalog entries, oldest first.
+        """
+        newest_first = entries[::-1]
+        keep = {entry["name"] for entry in newest_first[: self.last]}
+
+        for period, bucket_of in _PERIODS.items():
+            limit = getattr(self, period)
+            buckets = set()
+
+            for entry in newest_first:
+                if len(buckets) >= limit:
+                    break
+                bucket = bucket_of(datetime.fromisoformat(entry["created"]))
+                if bucket not in buckets:
+                    buckets.add(bucket)
+                    keep.add(entry["name"])
+
+        return keep
+
+
+class Catalog:
+    """
+    Index of the backups stored in one remote directory, kept sorted by creation
+    time so the latest backup is the last entry.
+
+    Entry: {"name", "size", "sha256", "created" (ISO 8601, UTC), "kind"}
+    """
+
+    def __init__(self, entries: list[dict] | None = None):
+        self.entries = sorted(entries or [], key=lambda e: e["created"])
+
+    @staticmethod
+    def entry(
+        name: str,
+        size: int,
+        sha256: str | None,
+        kind: str,
+        created: datetime | None = None,
+    ) -> dict:
+        created = created or datetime.now(timezone.utc)
+        return {
+            "name": name,
+            "size": size,
+            "sha256": sha256,
+            "created": created.astimezone(timezone.utc).isoformat(),
+            "kind": kind,
+        }
+
+    def add(self, entry: dict):
+        self.remove({entry["name"]})
+        keys = [e["created"] for e in self.entries]
+        self.entries.insert(bisect.bisect_right(keys, entry["created"]), entry)
+
+    def remove(self, names: set[str]):
+        self.entries = [e for e in self.entries if e["name"] not in names]
+
+    def latest(self, kind: str | None = None) -> dict | None:
+        for entry in reversed(self.entries):
+            if kind is None or entry["kind"] == kind:
+                return entry
+        return None
+
+    def prune(self, policy: RetentionPolicy) -> list[dict]:
+        """
+        Drop the entries the policy does not keep.
+
+        Returns:
+            list[dict]: The removed entries, oldest first.
+        """
+        keep = policy.select(self.entries)
+        removed = [e for e in self.entries if e["name"] not in keep]
+        self.entries = [e for e in self.entries if e["name"] in keep]
+        return removed
+
+    def dumps(self) -> str:
+        return json.dumps(
+            {"version": CATALOG_VERSION, "backups": self.entries},
+            separators=(",", ":"),
+        )
+
+    @classmethod
+    def loads(cls, data: str | bytes) -> "Catalog":
+        catalog = json.loads(data)
+        if catalog.get("version") != CATALOG_VERSION:
+            raise RuntimeError(f"Unsupported catalog version: {catalog.get('version')}")
+        return cls(catalog["backups"])
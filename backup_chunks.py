@@ -0,0 +1,144 @@
+import hashlib
+import io
+import json
+import tarfile
+from pathlib import Path
+
+CHUNK_SIZE = 4 * 1024 * 1024
+MANIFEST_VERSION = 1
+
+
+class ChunkWriter:
+    """
+    Split streams into fixed-size, content-addressed chunks.
+    Only chunks missing from `known` are written to `chunk_dir`.
+    """
+
+    def __init__(self, chunk_dir: Path, known: set[str], chunk_size=CHUNK_SIZE):
+        self.chunk_dir = Path(chunk_dir)
+        self.chunk_dir.mkdir(parents=True, exist_ok=True)
+        self.known = set(known)
+        self.chunk_size = chunk_size
+
+        self.bytes_total = 0
+        self.bytes_new = 0
+
+    def write_stream(self, fileobj) -> list[str]:
+        digests = []
+
+        while True:
+            data = fileobj.read(self.chunk_size)
+            if not data:
+                break
+
+            # Pipes can return short reads, top up to a full chunk
+            while len(data) < self.chunk_size:
+                more = fileobj.read(self.chunk_size - len(data))
+                if not more:
+                    break
+                data += more
+
+            digest = hashlib.sha256(data).hexdigest()
+            digests.append(digest)
+            self.bytes_total += len(data)
+
+            if digest not in self.known:
+                (self.chunk_dir / digest).write_bytes(data)
+                self.known.add(digest)
+                self.bytes_new += len(data)
+
+        return digests
+
+
+class ChunkReader(io.RawIOBase):
+    """
+    Sequential file-like view over a list of chunks, verifying each chunk hash.
+    """
+
+    def __init__(self, chunk_dir: Path, digests: list[str]):
+        self.chunk_dir = Path(chunk_dir)
+        self.pending = list(reversed(digests))
+        self.buffer = b""
+
+    def readable(self):
+        return True
+
+    def _load_next(self) -> bool:
+        if not self.pending:
+            return False
+
+        digest = self.pending.pop()
+        data = (self.chunk_dir / digest).read_bytes()
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise RuntimeError(f"Corrupted chunk: {digest}")
+
+        self.buffer = data
+        return True
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            out = [self.buffer]
+            while self._load_next():
+                out.append(self.buffer)
+            self.buffer = b""
+            return b"".join(out)
+
+        if not self.buffer and not self._load_next():
+            return b""
+
+        out, self.buffer = self.buffer[:size], self.buffer[size:]
+        return out
+
+
+def member_to_entry(member: tarfile.TarInfo, name: str) -> dict:
+    return {
+        "name": name,
+        "type": member.type.decode(),
+        "mode": member.mode,
+        "uid": member.uid,
+        "gid": member.gid,
+        "uname": member.uname,
+        "gname": member.gname,
+        "mtime": member.mtime,
+        "size": member.size if member.isreg() else 0,
+        "linkname": member.linkname,
+        "chunks": [],
+    }
+
+
+def entry_to_member(entry: dict) -> tarfile.TarInfo:
+    member = tarfile.TarInfo(entry["name"])
+    member.type = entry["type"].encode()
+    member.mode = entry["mode"]
+    member.uid = entry["uid"]
+    member.gid = entry["gid"]
+    member.uname = entry["uname"]
+    member.gname = entry["gname"]
+    member.mtime = entry["mtime"]
+    member.size = entry["size"]
+    member.linkname = entry["linkname"]
+    return member
+
+
+def referenced_chunks(manifest: dict) -> set[str]:
+    chunks = set(manifest["db"]["chunks"])
+    for entry in manifest["media"]:
+        chunks.update(entry["chunks"])
+    return chunks
+
+
+def write_manifest(path: Path, manifest: dict):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, separators=(",", ":"))
+
+
+def read_manifest(path_or_file) -> dict:
+    if isinstance(path_or_file, (str, Path)):
+        with open(path_or_file, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    else:
+        manifest = json.load(path_or_file)
+
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise RuntimeError(f"Unsupported manifest version: {manifest.get('version')}")
+    return manifest
@@ -0,0 +1,294 @@
+import gzip
+import hashlib
+import os
+import shutil
+import subprocess
+import tarfile
+import threading
+from contextlib import contextmanager, suppress
+from dataclasses import dataclass
+from pathlib import Path
+from tempfile import TemporaryFile
+from typing import BinaryIO
+
+from dotenv import load_dotenv
+
+from backup_profile import blocked, trace
+from seekable_archive import SeekableTarFile
+
+load_dotenv()
+
+DEFAULT_CODEC = os.getenv("BACKUP_CODEC", "gzip").lower()
+CODEC_THREADS = int(os.getenv("BACKUP_CODEC_THREADS", "0")) or os.cpu_count() or 1
+
+# sha256sum-compatible sidecar stored next to each archive
+CHECKSUM_SUFFIX = ".sha256"
+PUMP_BUFFER_SIZE = 1024 * 1024
+
+
+@dataclass(frozen=True)
+class Codec:
+    name: str
+    suffix: str
+    # External (multi-threaded) compressor; None means tarfile handles it in-process
+    compress_cmd: list[str] | None = None
+    decompress_cmd: list[str] | None = None
+    # tarfile mode used when there is no external command
+    tar_mode: str = "gz"
+    # Independently compressed frames + trailing member index (seekable_archive)
+    seekable: bool = False
+
+    @property
+    def parallel(self) -> bool:
+        return self.compress_cmd is not None or self.seekable
+
+
+CODECS = {
+    # Single core, python-only. Legacy default.
+    "gzip": Codec(name="gzip", suffix=".tar.gz"),
+    # Block-parallel gzip, still readable by `tar -xzf`
+    "pigz": Codec(
+        name="pigz",
+        suffix=".tar.gz",
+        compress_cmd=["pigz", "-c", "-p", str(CODEC_THREADS)],
+        decompress_cmd=["pigz", "-dc", "-p", str(CODEC_THREADS)],
+    ),
+    "zstd": Codec(
+        name="zstd",
+        suffix=".tar.zst",
+        compress_cmd=["zstd", "-q", "-c", "-3", f"-T{CODEC_THREADS}"],
+        decompress_cmd=["zstd", "-q", "-dc", f"-T{CODEC_THREADS}"],
+    ),
+    "none": Codec(name="none", suffix=".tar", tar_mode=""),
+    # Framed multi-member gzip with an index, for selective restores (--only)
+    "seekable": Codec(name="seekable", suffix=".tar.gz", seekable=True),
+}
+
+
+def get_codec(name: str | None = None) -> Codec:
+    name = (name or DEFAULT_CODEC).lower()
+    try:
+        return CODECS[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown backup codec: {name} (expected one of {', '.join(CODECS)})"
+        )
+
+
+def codec_for_archive(archive_path: Path | str) -> Codec:
+    """
+    Pick a codec able to read an existing archive, based on its suffix.
+    .tar.gz archives are read with pigz when it is installed.
+    """
+    name = Path(archive_path).name
+
+    if name.endswith(".tar.zst"):
+        return CODECS["zstd"]
+    if name.endswith(".tar.gz"):
+        return CODECS["pigz"] if shutil.which("pigz") else CODECS["gzip"]
+    if name.endswith(".tar"):
+        return CODECS["none"]
+
+    raise ValueError(f"Unrecognized archive format: {name}")
+
+
+def _require(cmd: list[str]):
+    if shutil.which(cmd[0]) is None:
+        raise RuntimeError(f"Compressor not found on PATH: {cmd[0]}")
+
+
+def _check(returncode: int, err, cmd: list[str]):
+    if returncode != 0:
+        err.seek(0)
+        raise RuntimeError(
+            f"Command failed:\n{' '.join(cmd)}\n\n{err.read().decode(errors='replace')}"
+        )
+
+
+class _HashingWriter:
+    """
+    Write-only file wrapper computing the SHA-256 of everything written through it,
+    so the archive checksum comes for free while the archive is created.
+    """
+
+    def __init__(self, out: BinaryIO):
+        self.out = out
+        self.sha = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data) -> int:
+        self.sha.update(data)
+        self.size += len(data)
+        return self.out.write(data)
+
+    def tell(self) -> int:
+        return self.size
+
+    def flush(self):
+        self.out.flush()
+
+    def hexdigest(self) -> str:
+        return self.sha.hexdigest()
+
+
+def write_checksum_file(archive_path: Path | str, digest: str):
+    archive_path = Path(archive_path)
+    Path(f"{archive_path}{CHECKSUM_SUFFIX}").write_text(
+        f"{digest}  {archive_path.name}\n", encoding="utf-8"
+    )
+
+
+def read_checksum_file(archive_path: Path | str) -> str | None:
+    """
+    Digest from the sidecar written with the archive, None when there is none or
+    the archive was modified after it.
+    """
+    archive_path = Path(archive_path)
+    sidecar = Path(f"{archive_path}{CHECKSUM_SUFFIX}")
+    try:
+        if sidecar.stat().st_mtime < archive_path.stat().st_mtime:
+            return None
+        return sidecar.read_text(encoding="utf-8").split()[0]
+    except (FileNotFoundError, IndexError):
+        return None
+
+
+@contextmanager
+def open_archive_writer(target: Path | str | BinaryIO, codec: Codec):
+    """
+    Open a tar archive for writing, compressed with the given codec.
+    Archives written to a path get a SHA-256 sidecar (CHECKSUM_SUFFIX), hashed from
+    the compressed bytes as they are written.
+
+    Arguments:
+        target (Path | str | BinaryIO): Destination archive path, or an open binary
+            file / pipe the compressed archive is streamed into.
+        codec (Codec): Compression codec.
+
+    Yields:
+        tarfile.TarFile: Archive to add members to.
+    """
+    if not isinstance(target, (str, Path)):
+        with _open_writer(target, codec) as tar:
+            yield tar
+        return
+
+    Path(f"{target}{CHECKSUM_SUFFIX}").unlink(missing_ok=True)
+
+    with open(target, "wb") as f:
+        out = _HashingWriter(f)
+        with _open_writer(out, codec, name=str(target)) as tar:
+            yield tar
+
+    write_checksum_file(target, out.hexdigest())
+
+
+@contextmanager
+def _open_writer(out: BinaryIO, codec: Codec, name: str | None = None):
+    if codec.seekable:
+        with SeekableTarFile(out, threads=CODEC_THREADS) as tar:
+            yield tar
+        return
+
+    if codec.compress_cmd is None:
+        with tarfile.open(name, f"w|{codec.tar_mode}", fileobj=out) as tar:
+            yield tar
+        return
+
+    _require(codec.compress_cmd)
+
+    # Plain files and pipes get the compressor output directly, anything else
+    # (the hashing wrapper) through a pump thread
+    direct = hasattr(out, "fileno")
+
+    with TemporaryFile() as err, trace(codec.compress_cmd[0], cat="subprocess"):
+        proc = subprocess.Popen(
+            codec.compress_cmd,
+            stdin=subprocess.PIPE,
+            stdout=out if direct else subprocess.PIPE,
+            stderr=err,
+        )
+        pump = None if direct else _Pump(proc.stdout, out)
+        try:
+            with tarfile.open(fileobj=proc.stdin, mode="w|") as tar:
+                yield tar
+        finally:
+            with suppress(BrokenPipeError):
+                proc.stdin.close()
+            with blocked(f"{codec.compress_cmd[0]} (wait)", codec.compress_cmd):
+                if pump is not None:
+                    pump.join()
+                returncode = proc.wait()
+
+            # A failed write or compressor explains a BrokenPipeError above
+            if pump is not None:
+                pump.check()
+            _check(returncode, err, codec.compress_cmd)
+
+
+class _Pump(threading.Thread):
+    """
+    Copy a compressor's output into `out` on a background thread.
+    """
+
+    def __init__(self, src: BinaryIO, out: BinaryIO):
+        super().__init__(daemon=True)
+        self.src = src
+        self.out = out
+        self.error = None
+        self.start()
+
+    def run(self):
+        try:
+            while chunk := self.src.read(PUMP_BUFFER_SIZE):
+                self.out.write(chunk)
+        except BaseException as e:
+            self.error = e
+        finally:
+            # Unblocks the compressor (EPIPE) if writing failed
+            self.src.close()
+
+    def check(self):
+        if self.error is not None:
+            raise self.error
+
+
+@contextmanager
+def open_archive_reader(archive_path: Path | str, codec: Codec | None = None):
+    """
+    Open a tar archive for sequential reading, decompressing with the given codec
+    (or the one matching the archive suffix).
+
+    Yields:
+        tarfile.TarFile: Stream-mode archive (members must be read in order).
+    """
+    codec = codec or codec_for_archive(archive_path)
+
+    if codec.decompress_cmd is None:
+        # GzipFile, unlike tarfile's "r|gz", reads multi-member (framed) gzip
+        opener = gzip.open if codec.tar_mode == "gz" else open
+        with opener(archive_path, "rb") as src:
+            with tarfile.open(fileobj=src, mode="r|") as tar:
+                yield tar
+        return
+
+    _require(codec.decompress_cmd)
+
+    with open(archive_path, "rb") as src, TemporaryFile() as err, trace(
+        codec.decompress_cmd[0], cat="subprocess"
+    ):
+        proc = subprocess.Popen(
+            codec.decompress_cmd, stdin=src, stdout=subprocess.PIPE, stderr=err
+        )
+        try:
+            with tarfile.open(fileobj=proc.stdout, mode="r|") as tar:
+                yield tar
+            # Drain trailing padding so the decompressor can exit cleanly
+            while proc.stdout.read(1024 * 1024):
+                pass
+        finally:
+            proc.stdout.close()
+            with blocked(f"{codec.decompress_cmd[0]} (wait)", codec.decompress_cmd):
+                returncode = proc.wait()
+
+        _check(returncode, err, codec.decompress_cmd)
@@ -0,0 +1,291 @@
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from queue import Full, Queue
+from typing import BinaryIO, Iterable, Iterator
+
+from dotenv import load_dotenv
+
+from backup_catalog import CATALOG_NAME, Catalog, RetentionPolicy
+from backup_codecs import CHECKSUM_SUFFIX, write_checksum_file
+from backup_helper import HASH_BUFFER_SIZE, PARTIAL_SUFFIX, BackupHelperSFTP
+from backup_metrics import stage
+from discord_notifications import notify_on_failure
+
+load_dotenv()
+
+# Chunks buffered per destination while fanning out; the slowest destination
+# sets the pace once its queue is full
+FAN_OUT_QUEUE_DEPTH = 16
+
+_END = object()
+
+
+@dataclass(frozen=True)
+class Destination:
+    name: str
+    kind: str  # "sftp" | "local"
+    directory: str
+    retention: RetentionPolicy
+    host: str | None = None
+    port: int | None = None
+    username: str | None = None
+    password: str | None = None
+
+    def open(self):
+        if self.kind == "local":
+            return LocalBackupTarget(retention=self.retention)
+
+        return BackupHelperSFTP(
+            host=self.host,
+            port=self.port,
+            username=self.username,
+            password=self.password,
+            retention=self.retention,
+        )
+
+
+def load_destinations(default_dir: Path | str) -> list[Destination]:
+    """
+    Destinations listed in BACKUP_DESTINATIONS (comma separated names), each
+    configured with DEST_<NAME>_TYPE (sftp | local), _DIR, _HOST, _PORT,
+    _USERNAME, _PASSWORD and optionally its own _KEEP_* retention.
+    Without BACKUP_DESTINATIONS, the FTP_* server is the only destination.
+
+    Arguments:
+        default_dir (Path | str): Remote directory for SFTP destinations without
+            a DEST_<NAME>_DIR.
+    """
+    default_dir = Path(default_dir).as_posix()
+    names = [
+        name.strip()
+        for name in os.getenv("BACKUP_DESTINATIONS", "").split(",")
+        if name.strip()
+    ]
+
+    if not names:
+        return [Destination("default", "sftp", default_dir, RetentionPolicy.from_env())]
+
+    destinations = []
+    for name in names:
+        prefix = f"DEST_{name.upper()}_"
+
+        kind = os.getenv(f"{prefix}TYPE", "sftp").lower()
+        if kind not in ("sftp", "local"):
+            raise ValueError(f"{prefix}TYPE must be 'sftp' or 'local', got '{kind}'")
+
+        directory = os.getenv(f"{prefix}DIR")
+        if kind == "local" and not directory:
+            raise ValueError(f"{prefix}DIR is required for a local destination")
+
+        host = os.getenv(f"{prefix}HOST")
+        if kind == "sftp" and not host:
+            raise ValueError(f"{prefix}HOST is required for an SFTP destination")
+
+        destinations.append(
+            Destination(
+                name=name,
+                kind=kind,
+                directory=directory or default_dir,
+                retention=RetentionPolicy.from_env(prefix=prefix),
+                host=host,
+                port=int(os.getenv(f"{prefix}PORT", "22")),
+                username=os.getenv(f"{prefix}USERNAME"),
+                password=os.getenv(f"{prefix}PASSWORD"),
+            )
+        )
+
+    return destinations
+
+
+class LocalBackupTarget:
+    """
+    Backup destination on a local (or mounted) directory, with the same partial
+    file, checksum sidecar, catalog and retention handling as BackupHelperSFTP.
+    """
+
+    def __init__(self, retention: RetentionPolicy | None = None):
+        self.retention = retention or RetentionPolicy.from_env()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @notify_on_failure
+    def upload_backup(
+        self,
+        local_archive: Path | str | BinaryIO | Iterable[bytes],
+        remote_dir: Path | str,
+        remote_name: str | None = None,
+    ):
+        """
+        Copy a backup archive into the target directory and enforce retention.
+
+        Arguments:
+            local_archive (Path | str | BinaryIO | Iterable[bytes]): Path to the
+                local backup archive, or a file-like / iterator producing its bytes.
+            remote_dir (Path | str): Target directory.
+            remote_name (str | None): File name, required for streamed sources.
+        """
+        if isinstance(local_archive, (str, Path)):
+            local_archive = Path(local_archive)
+            if not local_archive.is_file():
+                raise FileNotFoundError(local_archive)
+            remote_name = remote_name or local_archive.name
+            local_archive = _read_chunks(local_archive)
+        elif remote_name is None:
+            raise ValueError("remote_name is required when uploading from a stream")
+        elif hasattr(local_archive, "read"):
+            source = local_archive
+            local_archive = iter(lambda: source.read(HASH_BUFFER_SIZE), b"")
+
+        target_dir = Path(remote_dir)
+        target_dir.mkdir(parents=True, exist_ok=True)
+
+        target_path = target_dir / remote_name
+        partial_path = target_dir / f"{remote_name}{PARTIAL_SUFFIX}"
+        if target_path.exists():
+            raise RuntimeError(f"Backup already exists: {target_path}")
+
+        print(f"Copying backup: {remote_name} -> {target_dir}")
+        with stage("upload", target=str(target_dir)) as span:
+            sha = hashlib.sha256()
+            try:
+                with open(partial_path, "wb") as f:
+                    for chunk in local_archive:
+                        sha.update(chunk)
+                        f.write(chunk)
+                    f.flush()
+                    os.fsync(f.fileno())
+            except BaseException:
+                partial_path.unlink(missing_ok=True)
+                raise
+
+            digest = sha.hexdigest()
+            write_checksum_file(target_path, digest)
+            os.replace(partial_path, target_path)
+            size = span["bytes_out"] = target_path.stat().st_size
+
+        with stage("retention", target=str(target_dir)):
+            catalog = self._load_catalog(target_dir)
+            catalog.add(Catalog.entry(remote_name, size, digest, "archive"))
+            self._enforce_retention(target_dir, catalog)
+
+    def _load_catalog(self, target_dir: Path) -> Catalog:
+        try:
+            return Catalog.loads(
+                (target_dir / CATALOG_NAME).read_text(encoding="utf-8")
+            )
+        except FileNotFoundError:
+            return Catalog()
+
+    def _enforce_retention(self, target_dir: Path, catalog: Catalog):
+        for entry in catalog.prune(self.retention):
+            print(f"Deleting old backup: {entry['name']}")
+            (target_dir / entry["name"]).unlink(missing_ok=True)
+            (target_dir / f"{entry['name']}{CHECKSUM_SUFFIX}").unlink(missing_ok=True)
+
+        tmp = target_dir / f"{CATALOG_NAME}{PARTIAL_SUFFIX}"
+        tmp.write_text(catalog.dumps(), encoding="utf-8")
+        os.replace(tmp, target_dir / CATALOG_NAME)
+
+    def close(self):
+        pass
+
+
+def _read_chunks(path: Path) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_BUFFER_SIZE):
+            yield chunk
+
+
+def fan_out_upload(
+    source: Path | str | Iterable[bytes],
+    destinations: list[Destination],
+    remote_name: str | None = None,
+) -> dict[str, str | None]:
+    """
+    Upload one archive to every destination at the same time. The source is read
+    once and each chunk is handed to one bounded queue per destination. A failing
+    destination is dropped without stopping the others. With a single destination
+    the source is passed through as is (resumable upload for files).
+
+    Arguments:
+        source (Path | str | Iterable[bytes]): Local archive or a chunk iterator.
+        destinations (list[Destination]): Where to upload.
+        remote_name (str | None): File name, required for streamed sources.
+
+    Returns:
+        dict[str, str | None]: Destination name -> error message, None on success.
+    """
+    if isinstance(source, (str, Path)):
+        source = Path(source)
+        if not source.is_file():
+            raise FileNotFoundError(source)
+        remote_name = remote_name or source.name
+        if len(destinations) > 1:
+            source = _read_chunks(source)
+
+    queues = [Queue(maxsize=FAN_OUT_QUEUE_DEPTH) for _ in destinations]
+    alive = [True] * len(destinations)
+
+    def consume(index: int) -> Iterator[bytes]:
+        while (item := queues[index].get()) is not _END:
+            if isinstance(item, BaseException):
+                # The source failed: make the destination discard its partial copy
+                raise RuntimeError("Archive source failed") from item
+            yield item
+
+    def upload(index: int, destination: Destination):
+        try:
+            with destination.open() as target:
+                target.upload_backup(
+                    local_archive=source if len(destinations) == 1 else consume(index),
+                    remote_dir=destination.directory,
+                    remote_name=remote_name,
+                )
+        finally:
+            alive[index] = False
+
+    def put(index: int, item):
+        while alive[index]:
+            try:
+                queues[index].put(item, timeout=0.5)
+                return
+            except Full:
+                pass
+
+    source_error = None
+    with ThreadPoolExecutor(max_workers=len(destinations)) as pool:
+        futures = [pool.submit(upload, i, d) for i, d in enumerate(destinations)]
+
+        if len(destinations) > 1:
+            end = _END
+            try:
+                for chunk in source:
+                    for index in range(len(destinations)):
+                        put(index, chunk)
+                    if not any(alive):
+                        break
+            except BaseException as e:
+                source_error = end = e
+            finally:
+                for index in range(len(destinations)):
+                    put(index, end)
+
+        results = {}
+        for destination, future in zip(destinations, futures):
+            try:
+                future.result()
+                results[destination.name] = None
+            except Exception as e:
+                results[destination.name] = str(e)
+
+    if source_error is not None:
+        raise source_error
+
+    return results
@@ -1,39 +1,257 @@
+import atexit
+import hashlib
+import json
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
 from pathlib import Path
+from queue import Empty, Queue
+from typing import BinaryIO, Iterable
 
 import paramiko
 from dotenv import load_dotenv
 
+from backup_catalog import CATALOG_NAME, Catalog, RetentionPolicy
+from backup_chunks import read_manifest, referenced_chunks
+from backup_codecs import CHECKSUM_SUFFIX, read_checksum_file
+from backup_metrics import stage
 from discord_notifications import notify_on_failure
+from seekable_archive import SeekableArchive
 
 load_dotenv()
 
+# Uploads are written under this suffix and renamed once complete
+PARTIAL_SUFFIX = ".part"
+# Local transfer progress, used to resume after a disconnect
+STATE_SUFFIX = ".transfer.json"
 
-class BackupHelperSFTP:
-    def __init__(self, retention_limit: int = 10):
-        self.FTP_HOST = os.getenv("FTP_HOST")
-        self.FTP_PORT = int(os.getenv("FTP_PORT", "22"))
-        self.FTP_USERNAME = os.getenv("FTP_USERNAME")
-        self.FTP_PASSWORD = os.getenv("FTP_PASSWORD")
+HASH_BUFFER_SIZE = 1024 * 1024
 
-        self.retention_limit = retention_limit
+# Local copies of the remote catalogs, refreshed only when the remote one changes
+CATALOG_CACHE_DIR = Path(os.getenv("BACKUP_CATALOG_CACHE", "./backups/.catalog"))
 
-        self.ssh_client = None
-        self.sftp = None
+# Seconds between SSH keepalives; a session idle for longer is probed before reuse
+SFTP_KEEPALIVE = int(os.getenv("SFTP_KEEPALIVE", "30"))
 
-    def _init_connection(self):
-        if self.sftp:
-            return
 
+class SFTPSession:
+    """
+    One SSH transport to a server, shared by every BackupHelperSFTP in the process
+    so upload, retention, listing and download reuse a warm connection. Sends
+    keepalives, reconnects a dead or unresponsive session, and pools the SFTP
+    channels opened on the transport. A channel is used by one helper (or one
+    transfer worker) at a time, paramiko's SFTPClient is not thread-safe.
+    """
+
+    def __init__(self, host: str, port: int, username: str, password: str):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+
+        self.ssh_client = None
+        self.idle_channels = []
+        self.last_used = 0.0
+        self.lock = threading.Lock()
+
+    def _connect(self):
         self.ssh_client = paramiko.SSHClient()
         self.ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
         self.ssh_client.connect(
-            hostname=self.FTP_HOST,
-            port=self.FTP_PORT,
-            username=self.FTP_USERNAME,
-            password=self.FTP_PASSWORD,
+            hostname=self.host,
+            port=self.port,
+            username=self.username,
+            password=self.password,
         )
-        self.sftp = self.ssh_client.open_sftp()
+        self.ssh_client.get_transport().set_keepalive(SFTP_KEEPALIVE)
+
+    def _transport(self) -> paramiko.Transport | None:
+        return self.ssh_client.get_transport() if self.ssh_client else None
+
+    def _is_alive(self) -> bool:
+        transport = self._transport()
+        if transport is None or not transport.is_active():
+            return False
+
+        if time.monotonic() - self.last_used < SFTP_KEEPALIVE:
+            return True
+
+        # Idle long enough for the server or a NAT to have dropped it silently
+        try:
+            transport.open_session(timeout=SFTP_KEEPALIVE).close()
+            return True
+        except (paramiko.SSHException, EOFError, OSError):
+            return False
+
+    def _disconnect(self):
+        for channel in self.idle_channels:
+            channel.close()
+        self.idle_channels = []
+
+        if self.ssh_client:
+            self.ssh_client.close()
+            self.ssh_client = None
+
+    def _owns(self, channel: paramiko.SFTPClient) -> bool:
+        transport = channel.get_channel().get_transport()
+        return transport is not None and transport is self._transport()
+
+    def acquire(
+        self, current: paramiko.SFTPClient | None = None
+    ) -> paramiko.SFTPClient:
+        """
+        Check out an SFTP channel, reconnecting first if needed. `current` is the
+        channel the caller already holds, kept while the session is unchanged.
+        """
+        with self.lock:
+            if not self._is_alive():
+                self._disconnect()
+                self._connect()
+            self.last_used = time.monotonic()
+
+            if current is not None and self._owns(current):
+                return current
+            if self.idle_channels:
+                return self.idle_channels.pop()
+            transport = self._transport()
+
+        return paramiko.SFTPClient.from_transport(transport)
+
+    def release(self, channel: paramiko.SFTPClient):
+        """
+        Return a checked out channel to the pool.
+        """
+        with self.lock:
+            if self._owns(channel):
+                self.idle_channels.append(channel)
+                return
+
+        channel.close()
+
+    def reconnect(self):
+        with self.lock:
+            self._disconnect()
+            self._connect()
+
+    @contextmanager
+    def channels(self, count: int):
+        """
+        Yield `count` SFTP channels on the session's transport. They go back to the
+        pool, unless the block failed (the transport may be broken).
+        """
+        with self.lock:
+            transport = self._transport()
+            channels = self.idle_channels[:count]
+            self.idle_channels = self.idle_channels[count:]
+
+        try:
+            while len(channels) < count:
+                channels.append(paramiko.SFTPClient.from_transport(transport))
+            yield channels
+        except BaseException:
+            for channel in channels:
+                try:
+                    channel.close()
+                except Exception:
+                    pass
+            raise
+
+        for channel in channels:
+            self.release(channel)
+
+    def close(self):
+        with self.lock:
+            self._disconnect()
+
+
+_sessions: dict[tuple, SFTPSession] = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(host: str, port: int, username: str, password: str) -> SFTPSession:
+    """
+    Pooled session for a server, created on first use.
+    """
+    with _sessions_lock:
+        key = (host, port, username)
+        if key not in _sessions:
+            _sessions[key] = SFTPSession(host, port, username, password)
+        return _sessions[key]
+
+
+def close_sessions():
+    """
+    Close every pooled connection (also runs at interpreter exit).
+    """
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+
+    for session in sessions:
+        session.close()
+
+
+atexit.register(close_sessions)
+
+
+class BackupHelperSFTP:
+    def __init__(
+        self,
+        retention_limit: int | None = None,
+        host: str | None = None,
+        port: int | None = None,
+        username: str | None = None,
+        password: str | None = None,
+        retention: RetentionPolicy | None = None,
+    ):
+        # Connection defaults to the FTP_* settings
+        self.FTP_HOST = host or os.getenv("FTP_HOST")
+        self.FTP_PORT = port or int(os.getenv("FTP_PORT", "22"))
+        self.FTP_USERNAME = username or os.getenv("FTP_USERNAME")
+        self.FTP_PASSWORD = password or os.getenv("FTP_PASSWORD")
+
+        # Keep the newest `retention_limit` (BACKUP_KEEP_LAST) plus GFS buckets
+        self.retention = retention or RetentionPolicy.from_env(last=retention_limit)
+
+        # Chunked transfers: parallel SFTP channels, block size, reconnect attempts
+        self.channels = int(os.getenv("SFTP_CHANNELS", "4"))
+        self.block_size = int(os.getenv("SFTP_BLOCK_SIZE", str(8 * 1024 * 1024)))
+        self.max_retries = int(os.getenv("SFTP_MAX_RETRIES", "3"))
+        # Hash check of uploads: "server" (check-file only), "full" (stream the
+        # file back when the server cannot hash it) or "off"
+        verify = os.getenv("SFTP_VERIFY", "server").lower()
+        self.verify = {"true": "server", "false": "off"}.get(verify, verify)
+        if self.verify not in ("server", "full", "off"):
+            raise ValueError(f"Invalid SFTP_VERIFY: {verify} (server, full or off)")
+
+        self.session = None
+        self.ssh_client = None
+        self.sftp = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _init_connection(self):
+        # Pooled: only the first helper in the process pays for the handshake
+        if self.session is None:
+            self.session = get_session(
+                self.FTP_HOST, self.FTP_PORT, self.FTP_USERNAME, self.FTP_PASSWORD
+            )
+
+        self.sftp = self.session.acquire(self.sftp)
+        self.ssh_client = self.session.ssh_client
+
+    def connect(self):
+        """
+        Open the pooled connection ahead of use (the daemon keeps it warm).
+        """
+        self._init_connection()
 
     def _ensure_remote_dir(self, remote_dir: Path):
         remote_dir = Path(str(remote_dir).strip("/"))
@@ -44,31 +262,44 @@ class BackupHelperSFTP:
             try:
                 self.sftp.stat(current)
             except FileNotFoundError:
-                self.sftp.mkdir(current)
+                try:
+                    self.sftp.mkdir(current)
+                except OSError:
+                    # Created meanwhile by another upload (fan-out to sibling dirs)
+                    self.sftp.stat(current)
 
     @notify_on_failure
     def upload_backup(
         self,
-        local_archive: Path | str,
+        local_archive: Path | str | BinaryIO | Iterable[bytes],
         remote_dir: Path | str,
+        remote_name: str | None = None,
     ):
         """
         Upload a single backup archive and enforce retention.
+        The archive is written under a temporary name and renamed once complete.
 
         Arguments:
-            local_archive (Path | str): Path to the local backup archive.
+            local_archive (Path | str | BinaryIO | Iterable[bytes]): Path to the local
+                backup archive, or a file-like / iterator producing its bytes.
             remote_dir (Path | str): Path to the remote backup directory.
+            remote_name (str | None): Remote file name, required for streamed sources.
         """
         self._init_connection()
 
-        local_archive = Path(local_archive)
-        if not local_archive.is_file():
-            raise FileNotFoundError(local_archive)
+        if isinstance(local_archive, (str, Path)):
+            local_archive = Path(local_archive)
+            if not local_archive.is_file():
+                raise FileNotFoundError(local_archive)
+            remote_name = remote_name or local_archive.name
+        elif remote_name is None:
+            raise ValueError("remote_name is required when uploading from a stream")
 
         remote_dir = Path(remote_dir)
         self._ensure_remote_dir(remote_dir)
 
-        remote_path = (remote_dir / local_archive.name).as_posix()
+        remote_path = (remote_dir / remote_name).as_posix()
+        partial_path = f"{remote_path}{PARTIAL_SUFFIX}"
 
         # Do not overwrite backups silently
         try:
@@ -77,30 +308,372 @@ class BackupHelperSFTP:
         except FileNotFoundError:
             pass
 
-        print(f"Uploading backup: {local_archive.name}")
-        self.sftp.put(local_archive.as_posix(), remote_path)
+        print(f"Uploading backup: {remote_name}")
+        with stage("upload", target=self.FTP_HOST) as span:
+            if isinstance(local_archive, Path):
+                # Resumable: the .part file and local state survive a failed attempt
+                digest = self._put_resumable(local_archive, partial_path)
+            else:
+                if hasattr(local_archive, "read"):
+                    source = local_archive
+                    local_archive = iter(lambda: source.read(HASH_BUFFER_SIZE), b"")
+                try:
+                    digest = self._put_iter(local_archive, partial_path)
+                except BaseException:
+                    self._remove_quietly(partial_path)
+                    raise
 
-        self._enforce_retention(remote_dir)
+            self._write_checksum(remote_path, digest)
+            self.sftp.posix_rename(partial_path, remote_path)
+            size = span["bytes_out"] = self.sftp.stat(remote_path).st_size
 
-    def _enforce_retention(self, remote_dir: Path):
+        with stage("retention", target=self.FTP_HOST):
+            catalog = self._load_catalog(remote_dir)
+            catalog.add(Catalog.entry(remote_name, size, digest, "archive"))
+            self._enforce_retention(remote_dir, catalog)
+
+    def _put_iter(self, chunks: Iterable[bytes], remote_path: str) -> str:
+        """
+        Upload a stream that cannot be rewound (no resume), hashing it on the way.
+
+        Returns:
+            str: SHA-256 hex digest of the uploaded bytes.
+        """
+        sha = hashlib.sha256()
+        size = 0
+
+        with self.sftp.open(remote_path, "wb") as f:
+            f.set_pipelined(True)
+            for chunk in chunks:
+                sha.update(chunk)
+                size += len(chunk)
+                f.write(chunk)
+
+        digest = sha.hexdigest()
+        if self.sftp.stat(remote_path).st_size != size:
+            raise RuntimeError(f"Upload size mismatch: {remote_path}")
+        # The digest was computed inline: no re-download unless SFTP_VERIFY=full
+        if not self._verify_upload(remote_path, digest):
+            raise RuntimeError(f"Upload checksum mismatch: {remote_path}")
+
+        return digest
+
+    def _put_resumable(self, local_path: Path, remote_path: str) -> str:
+        """
+        Upload a local file in blocks over several SFTP channels, resuming the blocks
+        already written (this run or a previous one) after a disconnect.
+
+        Returns:
+            str: SHA-256 hex digest of the file, verified against the remote copy.
+        """
+        size = local_path.stat().st_size
+        state_path = local_path.with_name(local_path.name + STATE_SUFFIX)
+        state = {"remote": remote_path, "size": size, "block_size": self.block_size}
+        done = self._load_transfer_state(state_path, state)
+
+        try:
+            if self.sftp.stat(remote_path).st_size > size:
+                done = set()
+        except FileNotFoundError:
+            done = set()
+
+        if not done:
+            self.sftp.open(remote_path, "wb").close()
+        else:
+            print(f"    Resuming upload ({len(done)} blocks already sent)")
+
+        def put_block(sftp: paramiko.SFTPClient, offset: int, length: int):
+            with open(local_path, "rb") as f:
+                f.seek(offset)
+                data = f.read(length)
+            # Closing the handle waits for every pipelined write to be acknowledged
+            with sftp.open(remote_path, "r+b") as rf:
+                rf.set_pipelined(True)
+                rf.seek(offset)
+                rf.write(data)
+
+        self._transfer_blocks(size, done, put_block, state_path, state)
+
+        # Archives created by OutlineBackup were hashed while being written
+        digest = read_checksum_file(local_path) or _file_sha256(local_path)
+        if self.sftp.stat(remote_path).st_size != size:
+            raise RuntimeError(f"Upload size mismatch: {remote_path}")
+        if not self._verify_upload(remote_path, digest):
+            # Start over next time, the remote copy cannot be trusted
+            state_path.unlink(missing_ok=True)
+            raise RuntimeError(f"Upload checksum mismatch: {remote_path}")
+
+        state_path.unlink(missing_ok=True)
+        return digest
+
+    def _transfer_blocks(self, size, done: set[int], transfer, state_path, state):
+        """
+        Run `transfer(sftp, offset, length)` for every block not in `done`, spread
+        over several channels of the same SSH transport. On a dropped connection,
+        reconnect and continue with the remaining blocks.
+        """
+        n_blocks = max(1, -(-size // self.block_size))
+        lock = threading.Lock()
+        attempt = 0
+
+        def mark_done(index: int):
+            with lock:
+                done.add(index)
+                self._save_transfer_state(state_path, state, done)
+
+        while True:
+            pending = Queue()
+            for index in range(n_blocks):
+                if index not in done:
+                    pending.put(index)
+            if pending.empty():
+                return
+
+            def worker(sftp: paramiko.SFTPClient):
+                while True:
+                    try:
+                        index = pending.get_nowait()
+                    except Empty:
+                        return
+                    offset = index * self.block_size
+                    transfer(sftp, offset, min(self.block_size, size - offset))
+                    mark_done(index)
+
+            try:
+                n_channels = min(self.channels, pending.qsize())
+                with self.session.channels(n_channels) as channels:
+                    with ThreadPoolExecutor(max_workers=n_channels) as pool:
+                        for future in [pool.submit(worker, c) for c in channels]:
+                            future.result()
+                return
+            except (FileNotFoundError, PermissionError):
+                raise
+            except (paramiko.SSHException, EOFError, OSError) as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                print(f"    Transfer interrupted ({e}), reconnecting...")
+                self._reconnect()
+
+    def _reconnect(self):
+        self.session.reconnect()
+        self.sftp = None
+        self._init_connection()
+
+    @staticmethod
+    def _load_transfer_state(state_path: Path, expected: dict) -> set[int]:
+        try:
+            state = json.loads(state_path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, json.JSONDecodeError):
+            return set()
+
+        # A different target or block layout means nothing can be reused
+        if any(state.get(k) != v for k, v in expected.items()):
+            return set()
+
+        return set(state.get("done", []))
+
+    @staticmethod
+    def _save_transfer_state(state_path: Path, state: dict, done: set[int]):
+        tmp = state_path.with_name(state_path.name + ".tmp")
+        tmp.write_text(json.dumps({**state, "done": sorted(done)}), encoding="utf-8")
+        os.replace(tmp, state_path)
+
+    def _remote_sha256(self, remote_path: str, stream: bool = True) -> str | None:
         """
-        Keep only the newest N backups in the remote directory.
+        SHA-256 of a remote file. Uses the server-side `check-file` extension when
+        available, otherwise streams the file back and hashes it locally.
 
         Arguments:
-            remote_dir (Path): Path to the remote directory containing backups.
+            remote_path (str): Remote file.
+            stream (bool): Fall back to streaming; if False, None is returned when
+                the server cannot hash the file.
         """
+        with self.sftp.open(remote_path, "rb") as f:
+            try:
+                return f.check("sha256").hex()
+            except (IOError, OSError, paramiko.SSHException):
+                if not stream:
+                    return None
 
-        files = self.sftp.listdir_attr(remote_dir.as_posix())
-        files.sort(key=lambda x: x.st_mtime, reverse=True)
+            f.prefetch()
+            sha = hashlib.sha256()
+            while chunk := f.read(HASH_BUFFER_SIZE):
+                sha.update(chunk)
+            return sha.hexdigest()
+
+    def _verify_upload(self, remote_path: str, digest: str) -> bool:
+        """
+        Compare an uploaded file with its digest as SFTP_VERIFY asks. By default
+        only servers with `check-file` are asked; elsewhere the size check and the
+        checksum sidecar have to do, `--verify` re-hashes on demand.
+
+        Returns:
+            bool: False when the remote copy does not match.
+        """
+        if self.verify == "off":
+            return True
+
+        remote = self._remote_sha256(remote_path, stream=self.verify == "full")
+        return remote is None or remote == digest
+
+    def _write_checksum(self, remote_path: str, digest: str):
+        name = remote_path.rsplit("/", maxsplit=1)[-1]
+        with self.sftp.open(f"{remote_path}{CHECKSUM_SUFFIX}", "w") as f:
+            f.write(f"{digest}  {name}\n")
+
+    def _read_checksum(self, remote_path: str) -> str | None:
+        try:
+            with self.sftp.open(f"{remote_path}{CHECKSUM_SUFFIX}", "r") as f:
+                return f.read().decode().split()[0]
+        except (FileNotFoundError, IndexError):
+            return None
+
+    def _remove_quietly(self, remote_path: str):
+        try:
+            self.sftp.remove(remote_path)
+        except (IOError, OSError):
+            pass
 
-        if len(files) <= self.retention_limit:
+    def _remove_many(self, remote_paths: list[str]):
+        """
+        Delete files in one batch: the removals are spread over the session's
+        channels so their round trips overlap. Missing files are ignored.
+        """
+        if not remote_paths:
             return
 
-        # Get the oldest files to delete it
-        for file_attr in files[self.retention_limit :]:
-            file_path = (remote_dir / file_attr.filename).as_posix()
-            print(f"Deleting old backup: {file_attr.filename}")
-            self.sftp.remove(file_path)
+        pending = Queue()
+        for remote_path in remote_paths:
+            pending.put(remote_path)
+
+        def worker(sftp: paramiko.SFTPClient):
+            while True:
+                try:
+                    remote_path = pending.get_nowait()
+                except Empty:
+                    return
+                try:
+                    sftp.remove(remote_path)
+                except FileNotFoundError:
+                    pass
+
+        n_channels = min(self.channels, len(remote_paths))
+        with self.session.channels(n_channels) as channels:
+            with ThreadPoolExecutor(max_workers=n_channels) as pool:
+                for future in [pool.submit(worker, c) for c in channels]:
+                    future.result()
+
+    def _list_backups(self, remote_dir: Path) -> list[paramiko.SFTPAttributes]:
+        """
+        Completed backups in the remote directory (in-progress uploads, checksum
+        sidecars and the catalog excluded).
+        """
+        files = self.sftp.listdir_attr(remote_dir.as_posix())
+        return [
+            f
+            for f in files
+            if not f.filename.endswith((PARTIAL_SUFFIX, CHECKSUM_SUFFIX))
+            and f.filename != CATALOG_NAME
+        ]
+
+    def _catalog_cache_path(self, remote_dir: Path) -> Path:
+        slug = remote_dir.as_posix().strip("/").replace("/", "_")
+        return CATALOG_CACHE_DIR / f"{self.FTP_HOST}_{self.FTP_PORT}_{slug}.json"
+
+    @staticmethod
+    def _cache_catalog(cache_path: Path, stamp: list, data: str):
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = cache_path.with_name(cache_path.name + ".tmp")
+        tmp.write_text(json.dumps({"stamp": stamp, "catalog": data}), encoding="utf-8")
+        os.replace(tmp, cache_path)
+
+    def _load_catalog(self, remote_dir: Path) -> Catalog:
+        """
+        Catalog of a remote directory. The local cached copy is used while the
+        remote file is unchanged (one stat instead of a download).
+        """
+        remote_path = (remote_dir / CATALOG_NAME).as_posix()
+        try:
+            attr = self.sftp.stat(remote_path)
+        except FileNotFoundError:
+            return self._build_catalog(remote_dir)
+
+        cache_path = self._catalog_cache_path(remote_dir)
+        stamp = [attr.st_mtime, attr.st_size]
+        try:
+            cached = json.loads(cache_path.read_text(encoding="utf-8"))
+            if cached["stamp"] == stamp:
+                return Catalog.loads(cached["catalog"])
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            pass
+
+        with self.sftp.open(remote_path, "r") as f:
+            data = f.read().decode()
+        self._cache_catalog(cache_path, stamp, data)
+
+        return Catalog.loads(data)
+
+    def _save_catalog(self, remote_dir: Path, catalog: Catalog):
+        remote_path = (remote_dir / CATALOG_NAME).as_posix()
+        data = catalog.dumps()
+
+        # Readers never see a half-written catalog
+        with self.sftp.open(f"{remote_path}{PARTIAL_SUFFIX}", "w") as f:
+            f.write(data)
+        self.sftp.posix_rename(f"{remote_path}{PARTIAL_SUFFIX}", remote_path)
+
+        attr = self.sftp.stat(remote_path)
+        self._cache_catalog(
+            self._catalog_cache_path(remote_dir), [attr.st_mtime, attr.st_size], data
+        )
+
+    def _build_catalog(self, remote_dir: Path) -> Catalog:
+        """
+        Index a directory without a catalog once, from a listing (backups uploaded
+        before the catalog existed).
+        """
+        catalog = Catalog()
+        try:
+            files = self._list_backups(remote_dir)
+        except FileNotFoundError:
+            return catalog
+
+        print(f"Building backup catalog: {remote_dir.as_posix()}")
+        for file_attr in files:
+            remote_path = (remote_dir / file_attr.filename).as_posix()
+            catalog.add(
+                Catalog.entry(
+                    file_attr.filename,
+                    file_attr.st_size,
+                    self._read_checksum(remote_path),
+                    "dedup" if file_attr.filename.endswith(".json") else "archive",
+                    created=datetime.fromtimestamp(file_attr.st_mtime, timezone.utc),
+                )
+            )
+
+        self._save_catalog(remote_dir, catalog)
+        return catalog
+
+    def _enforce_retention(self, remote_dir: Path, catalog: Catalog):
+        """
+        Apply the retention policy to the catalog, delete the dropped backups in
+        one batch and save the catalog.
+
+        Arguments:
+            remote_dir (Path): Path to the remote directory containing backups.
+            catalog (Catalog): Catalog of that directory.
+        """
+        removed = catalog.prune(self.retention)
+
+        remote_paths = []
+        for entry in removed:
+            print(f"Deleting old backup: {entry['name']}")
+            remote_path = (remote_dir / entry["name"]).as_posix()
+            remote_paths += [remote_path, f"{remote_path}{CHECKSUM_SUFFIX}"]
+
+        self._remove_many(remote_paths)
+        self._save_catalog(remote_dir, catalog)
 
     @notify_on_failure
     def download_backup(
@@ -126,27 +699,329 @@ class BackupHelperSFTP:
         local_path = local_dir / remote_archive.name
 
         print(f"Downloading backup: {remote_archive.name}")
-        self.sftp.get(remote_archive.as_posix(), local_path.as_posix())
+        with stage("download", target=self.FTP_HOST) as span:
+            self._get_resumable(remote_archive.as_posix(), local_path)
+            span["bytes_out"] = local_path.stat().st_size
 
         return local_path
 
+    @notify_on_failure
+    def open_seekable_backup(self, remote_dir: Path | str) -> SeekableArchive:
+        """
+        Open the latest remote archive for ranged reads, without downloading it.
+        Only works for archives written with the seekable codec.
+
+        Arguments:
+            remote_dir (Path | str): Path to the remote backup directory.
+        """
+        self._init_connection()
+
+        remote_archive = self._get_latest_backup(remote_dir)
+        print(f"Reading backup index: {remote_archive.name}")
+
+        f = self.sftp.open(remote_archive.as_posix(), "rb")
+
+        def read_range(offset: int, length: int) -> bytes:
+            # readv pipelines the read requests for the whole range
+            return b"".join(f.readv([(offset, length)]))
+
+        return SeekableArchive(read_range, f.stat().st_size)
+
+    @notify_on_failure
+    def verify_backup(self, remote_dir: Path | str) -> str:
+        """
+        Check the latest remote archive against the checksum recorded when it was
+        uploaded. The server hashes it (`check-file`) when supported, otherwise the
+        archive is streamed back and hashed without being stored.
+
+        Arguments:
+            remote_dir (Path | str): Path to the remote backup directory.
+
+        Returns:
+            str: The verified SHA-256 hex digest.
+        """
+        self._init_connection()
+
+        remote_dir = Path(remote_dir)
+        latest = self._load_catalog(remote_dir).latest()
+        if latest is None:
+            raise FileNotFoundError(
+                f"No backups found in remote directory: {remote_dir}"
+            )
+
+        remote_path = (remote_dir / latest["name"]).as_posix()
+        expected = latest["sha256"] or self._read_checksum(remote_path)
+        if expected is None:
+            raise RuntimeError(f"No checksum recorded for backup: {remote_path}")
+
+        print(f"Verifying backup: {latest['name']}")
+        if self._remote_sha256(remote_path) != expected:
+            raise RuntimeError(f"Backup checksum mismatch: {remote_path}")
+
+        print("Backup verified.")
+        return expected
+
+    def _get_resumable(self, remote_path: str, local_path: Path):
+        """
+        Download a remote file in blocks over several SFTP channels into a local .part
+        file, resuming the blocks already fetched after a disconnect. The result is
+        hashed while it is downloaded and checked against the checksum sidecar
+        written at upload time.
+        """
+        size = self.sftp.stat(remote_path).st_size
+        partial_path = local_path.with_name(local_path.name + PARTIAL_SUFFIX)
+        state_path = local_path.with_name(local_path.name + STATE_SUFFIX)
+        state = {"remote": remote_path, "size": size, "block_size": self.block_size}
+
+        done = self._load_transfer_state(state_path, state)
+        if not partial_path.is_file():
+            done = set()
+        if not done:
+            with open(partial_path, "wb") as f:
+                f.truncate(size)
+        else:
+            print(f"    Resuming download ({len(done)} blocks already fetched)")
+
+        expected = self._read_checksum(remote_path)
+        hasher = _BlockHasher(
+            partial_path, self.block_size, max_buffered=self.channels * self.block_size
+        )
+        for index in done:
+            hasher.add(index)
+
+        def get_block(sftp: paramiko.SFTPClient, offset: int, length: int):
+            with sftp.open(remote_path, "rb") as rf:
+                # readv pipelines the read requests for the whole block
+                data = b"".join(rf.readv([(offset, length)]))
+            if len(data) != length:
+                raise EOFError(f"Short read at offset {offset}: {remote_path}")
+            with open(partial_path, "r+b") as f:
+                f.seek(offset)
+                f.write(data)
+            hasher.add(offset // self.block_size, data)
+
+        self._transfer_blocks(size, done, get_block, state_path, state)
+
+        if expected is not None and hasher.hexdigest(size) != expected:
+            partial_path.unlink(missing_ok=True)
+            state_path.unlink(missing_ok=True)
+            raise RuntimeError(f"Download checksum mismatch: {remote_path}")
+
+        os.replace(partial_path, local_path)
+        state_path.unlink(missing_ok=True)
+
     def _get_latest_backup(self, remote_dir: Path | str) -> Path:
         remote_dir = Path(remote_dir)
-        files = self.sftp.listdir_attr(remote_dir.as_posix())
-        if not files:
+        latest = self._load_catalog(remote_dir).latest()
+        if latest is None:
             raise FileNotFoundError(
                 f"No backups found in remote directory: {remote_dir}"
             )
 
-        # Sort by modification time descending
-        files.sort(key=lambda x: x.st_mtime, reverse=True)
-        latest_file = files[0]
-        return remote_dir / latest_file.filename
+        return remote_dir / latest["name"]
+
+    def list_remote_chunks(self, remote_dir: Path | str) -> set[str]:
+        """
+        Digests of the chunks already stored in a remote dedup store.
+
+        Arguments:
+            remote_dir (Path | str): Path to the remote dedup store.
+        """
+        self._init_connection()
+
+        try:
+            chunks = self.sftp.listdir((Path(remote_dir) / "chunks").as_posix())
+            return {c for c in chunks if not c.endswith(PARTIAL_SUFFIX)}
+        except FileNotFoundError:
+            return set()
+
+    @notify_on_failure
+    def upload_dedup_backup(self, local_dir: Path | str, remote_dir: Path | str):
+        """
+        Upload the new chunks and the manifest of a dedup backup, then enforce
+        retention. The manifest goes last so it never references missing chunks.
+
+        Arguments:
+            local_dir (Path | str): Directory with manifest.json and chunks/.
+            remote_dir (Path | str): Path to the remote dedup store.
+        """
+        self._init_connection()
+
+        local_dir = Path(local_dir)
+        manifest = local_dir / "manifest.json"
+        if not manifest.is_file():
+            raise FileNotFoundError(manifest)
+
+        remote_dir = Path(remote_dir)
+        self._ensure_remote_dir(remote_dir / "chunks")
+        self._ensure_remote_dir(remote_dir / "manifests")
+
+        chunks = sorted((local_dir / "chunks").glob("*"))
+        print(f"Uploading {len(chunks)} new chunks")
+        for chunk in chunks:
+            remote_chunk = (remote_dir / "chunks" / chunk.name).as_posix()
+            # Write under a temp name so an interrupted upload is never trusted
+            self.sftp.put(chunk.as_posix(), f"{remote_chunk}{PARTIAL_SUFFIX}")
+            self.sftp.posix_rename(f"{remote_chunk}{PARTIAL_SUFFIX}", remote_chunk)
+
+        remote_manifest = (
+            remote_dir / "manifests" / f"{local_dir.name}.json"
+        ).as_posix()
+        print(f"Uploading manifest: {local_dir.name}.json")
+        self.sftp.put(manifest.as_posix(), f"{remote_manifest}{PARTIAL_SUFFIX}")
+        self.sftp.posix_rename(f"{remote_manifest}{PARTIAL_SUFFIX}", remote_manifest)
+
+        catalog = self._load_catalog(remote_dir / "manifests")
+        catalog.add(
+            Catalog.entry(
+                f"{local_dir.name}.json",
+                manifest.stat().st_size,
+                _file_sha256(manifest),
+                "dedup",
+            )
+        )
+        self._enforce_dedup_retention(remote_dir, catalog)
+
+    def _enforce_dedup_retention(self, remote_dir: Path, catalog: Catalog):
+        """
+        Apply the retention policy to the manifests, then delete chunks no kept
+        manifest uses.
+
+        Arguments:
+            remote_dir (Path): Path to the remote dedup store.
+            catalog (Catalog): Catalog of the manifests directory.
+        """
+        manifests_dir = remote_dir / "manifests"
+
+        removed = catalog.prune(self.retention)
+        for entry in removed:
+            print(f"Deleting old manifest: {entry['name']}")
+        self._remove_many([(manifests_dir / e["name"]).as_posix() for e in removed])
+        self._save_catalog(manifests_dir, catalog)
+
+        in_use = set()
+        for entry in catalog.entries:
+            with self.sftp.open((manifests_dir / entry["name"]).as_posix()) as f:
+                in_use |= referenced_chunks(read_manifest(f))
+
+        chunks_dir = remote_dir / "chunks"
+        orphaned = [
+            c for c in self.sftp.listdir(chunks_dir.as_posix()) if c not in in_use
+        ]
+        if orphaned:
+            print(f"Deleting {len(orphaned)} unreferenced chunks")
+        self._remove_many([(chunks_dir / chunk).as_posix() for chunk in orphaned])
+
+    @notify_on_failure
+    def download_dedup_backup(self, remote_dir: Path | str, local_dir: Path | str):
+        """
+        Download the latest dedup manifest and the chunks it references.
+
+        Arguments:
+            remote_dir (Path | str): Path to the remote dedup store.
+            local_dir (Path | str): Local directory; chunks go to local_dir/chunks.
+
+        Returns:
+            Path: The local path to the downloaded manifest.
+        """
+        self._init_connection()
+
+        remote_dir = Path(remote_dir)
+        remote_manifest = self._get_latest_backup(remote_dir / "manifests")
+
+        local_dir = Path(local_dir)
+        chunk_dir = local_dir / "chunks"
+        chunk_dir.mkdir(parents=True, exist_ok=True)
+
+        local_manifest = local_dir / remote_manifest.name
+        print(f"Downloading manifest: {remote_manifest.name}")
+        self.sftp.get(remote_manifest.as_posix(), local_manifest.as_posix())
+
+        needed = referenced_chunks(read_manifest(local_manifest))
+        missing = [c for c in needed if not (chunk_dir / c).is_file()]
+        print(f"Downloading {len(missing)} chunks")
+        for chunk in missing:
+            self.sftp.get(
+                (remote_dir / "chunks" / chunk).as_posix(),
+                (chunk_dir / chunk).as_posix(),
+            )
+
+        return local_manifest
 
     def close(self):
+        """
+        Release the connection. The pooled session stays open for the next helper
+        until close_sessions() or interpreter exit.
+        """
         if self.sftp:
-            self.sftp.close()
-            self.sftp = None
-        if self.ssh_client:
-            self.ssh_client.close()
-            self.ssh_client = None
+            self.session.release(self.sftp)
+        self.session = None
+        self.ssh_client = None
+        self.sftp = None
+
+
+class _BlockHasher:
+    """
+    SHA-256 of a file transferred in blocks that complete out of order. A block is
+    hashed once every block before it is in; blocks that arrive early are kept in
+    memory (up to `max_buffered` bytes) or read back from `path` when their turn
+    comes, as are blocks fetched by an earlier attempt.
+    """
+
+    def __init__(self, path: Path, block_size: int, max_buffered: int):
+        self.path = path
+        self.block_size = block_size
+        self.max_buffered = max_buffered
+
+        self.sha = hashlib.sha256()
+        self.next = 0
+        self.early = {}  # block index -> data, None when it is only on disk
+        self.buffered = 0
+        self.lock = threading.Lock()
+
+    def add(self, index: int, data: bytes | None = None):
+        with self.lock:
+            if index < self.next or index in self.early:
+                return  # Fetched again after a reconnect
+
+            if index != self.next:
+                if data is not None and self.buffered + len(data) <= self.max_buffered:
+                    self.buffered += len(data)
+                else:
+                    data = None
+                self.early[index] = data
+                return
+
+            self.sha.update(data if data is not None else self._read(index))
+            self.next += 1
+
+            while self.next in self.early:
+                data = self.early.pop(self.next)
+                if data is None:
+                    data = self._read(self.next)
+                else:
+                    self.buffered -= len(data)
+                self.sha.update(data)
+                self.next += 1
+
+    def _read(self, index: int) -> bytes:
+        with open(self.path, "rb") as f:
+            f.seek(index * self.block_size)
+            return f.read(self.block_size)
+
+    def hexdigest(self, size: int) -> str:
+        # Anything not reported through add() is read back from disk
+        n_blocks = max(1, -(-size // self.block_size))
+        with self.lock:
+            while self.next < n_blocks:
+                self.sha.update(self._read(self.next))
+                self.next += 1
+            return self.sha.hexdigest()
+
+
+def _file_sha256(path: Path) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_BUFFER_SIZE):
+            sha.update(chunk)
+    return sha.hexdigest()
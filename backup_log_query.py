@@ -0,0 +1,271 @@
+import gzip
+import json
+import os
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from backup_logger import ARCHIVE_SUFFIX, INDEX_SUFFIX, LOCAL_TZ, LOG_DIR
+
+INDEX_VERSION = 1
+# Lines per index block: a query reads whole blocks overlapping its window
+INDEX_STRIDE = 64
+
+
+def _index_path(log_file: Path) -> Path:
+    return log_file.with_name(f"{log_file.name}{INDEX_SUFFIX}")
+
+
+def _load_index(log_file: Path) -> dict | None:
+    try:
+        with open(_index_path(log_file), "r", encoding="utf-8") as f:
+            index = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+    return index if index.get("version") == INDEX_VERSION else None
+
+
+def update_index(log_file: Path) -> dict:
+    """
+    Sparse timestamp index of a daily log file, brought up to date with the lines
+    appended since it was last written. Lines are grouped in blocks of
+    INDEX_STRIDE; each block keeps its byte range and the lowest / highest
+    timestamp in it, so out-of-order entries (overlapping runs) are still found.
+
+    Index: {"version", "size", "blocks": [[offset, length, lines, min_ts, max_ts]]}
+    `size` is the indexed prefix of the file, always ending at a complete line.
+
+    Arguments:
+        log_file (Path): Daily .jsonl log file.
+
+    Returns:
+        dict: The index.
+    """
+    size = log_file.stat().st_size
+    index = _load_index(log_file)
+
+    # A file that shrank was rewritten: start over
+    if index is None or index["size"] > size:
+        index = {"version": INDEX_VERSION, "size": 0, "blocks": []}
+
+    if index["size"] == size:
+        return index
+
+    blocks = index["blocks"]
+    offset = index["size"]
+    # Refill a trailing block that was still short
+    if blocks and blocks[-1][2] < INDEX_STRIDE:
+        offset = blocks.pop()[0]
+
+    block = None
+    with open(log_file, "rb") as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                # Being appended right now, indexed next time
+                break
+
+            if block is None:
+                block = [offset, 0, 0, None, None]
+            offset += len(line)
+            block[1] += len(line)
+            block[2] += 1
+
+            try:
+                ts = float(json.loads(line)["timestamp"])
+            except (ValueError, KeyError, TypeError):
+                # Corrupted lines stay in the block and are counted by readers
+                ts = None
+            if ts is not None:
+                block[3] = ts if block[3] is None else min(block[3], ts)
+                block[4] = ts if block[4] is None else max(block[4], ts)
+
+            if block[2] == INDEX_STRIDE:
+                blocks.append(block)
+                block = None
+
+    if block is not None:
+        blocks.append(block)
+    index["size"] = offset
+
+    tmp = _index_path(log_file).with_suffix(f".{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(index, f, separators=(",", ":"))
+    os.replace(tmp, _index_path(log_file))
+
+    return index
+
+
+def _parse_lines(lines, start: float, end: float, entries: list) -> int:
+    corrupted = 0
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+
+        try:
+            entry = json.loads(line)
+            ts = float(entry["timestamp"])
+        except (ValueError, KeyError, TypeError):
+            corrupted += 1
+            continue
+
+        if start <= ts < end:
+            entries.append(entry)
+
+    return corrupted
+
+
+def _read_window(log_file: Path, start: float, end: float, entries: list) -> int:
+    index = update_index(log_file)
+    corrupted = 0
+
+    with open(log_file, "rb") as f:
+        for offset, length, _, min_ts, max_ts in index["blocks"]:
+            # Blocks of corrupted lines only (no timestamps) are read for the count
+            if min_ts is not None and (max_ts < start or min_ts >= end):
+                continue
+            f.seek(offset)
+            corrupted += _parse_lines(f.read(length).splitlines(), start, end, entries)
+
+    return corrupted
+
+
+def query_logs(
+    start: datetime, end: datetime, log_dir: Path | None = None
+) -> tuple[list[dict], int]:
+    """
+    Log entries with start <= timestamp < end, across the daily files and the
+    compressed archive of older days. Only the days overlapping the window (and
+    the day after it) are opened and, in live files, only the index blocks
+    overlapping it are read.
+
+    Arguments:
+        start (datetime): Window start (timezone aware).
+        end (datetime): Window end, excluded.
+        log_dir (Path | None): Log directory, defaults to LOG_DIR.
+
+    Returns:
+        tuple[list[dict], int]: Entries sorted by timestamp, and the number of
+            corrupted lines in the blocks that were read.
+    """
+    log_dir = log_dir or LOG_DIR
+    start_ts, end_ts = start.timestamp(), end.timestamp()
+
+    entries = []
+    corrupted = 0
+
+    day = start.astimezone(LOCAL_TZ).date()
+    # A run crossing midnight can be filed under the next day
+    last_day = end.astimezone(LOCAL_TZ).date() + timedelta(days=1)
+    while day <= last_day:
+        log_file = log_dir / f"{day.isoformat()}.jsonl"
+        archived = log_dir / f"{log_file.name}{ARCHIVE_SUFFIX}"
+
+        # Both exist when a compressed day got a late entry
+        if archived.exists():
+            with gzip.open(archived, "rb") as f:
+                corrupted += _parse_lines(f, start_ts, end_ts, entries)
+        if log_file.exists():
+            corrupted += _read_window(log_file, start_ts, end_ts, entries)
+
+        day += timedelta(days=1)
+
+    entries.sort(key=lambda e: e["timestamp"])
+    return entries, corrupted
+
+
+def _percentile(sorted_values: list[float], percent: float) -> float | None:
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * percent // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def summarize(entries: list[dict]) -> dict:
+    """
+    Aggregates of a set of runs: counts, success rate, duration percentiles and,
+    per stage, total bytes and duration percentiles. Slots the scheduler skipped
+    ("missed", "overlap" entries) are counted apart, not as runs.
+
+    Returns:
+        dict: {"total", "success", "failures", "missed", "overlap",
+            "success_rate", "duration_p50", "duration_p95", "duration_max",
+            "stages": {name: {...}}}
+    """
+    missed = sum(1 for e in entries if e["status"] == "missed")
+    overlap = sum(1 for e in entries if e["status"] == "overlap")
+    entries = [e for e in entries if e["status"] in ("success", "failure")]
+
+    total = len(entries)
+    success = sum(1 for e in entries if e["status"] == "success")
+    durations = sorted(e["duration"] for e in entries)
+
+    stages = {}
+    for entry in entries:
+        for span in entry.get("stages") or []:
+            stage = stages.setdefault(
+                span["name"],
+                {"runs": 0, "bytes_in": 0, "bytes_out": 0, "durations": []},
+            )
+            stage["runs"] += 1
+            stage["bytes_in"] += span.get("bytes_in") or 0
+            stage["bytes_out"] += span.get("bytes_out") or 0
+            stage["durations"].append(span["duration"])
+
+    for stage in stages.values():
+        stage_durations = sorted(stage.pop("durations"))
+        seconds = sum(stage_durations)
+        stage["duration_p50"] = _percentile(stage_durations, 50)
+        stage["duration_p95"] = _percentile(stage_durations, 95)
+        stage["duration_max"] = stage_durations[-1]
+        processed = stage["bytes_in"] or stage["bytes_out"]
+        stage["mb_per_s"] = round(processed / seconds / 1e6, 3) if seconds else None
+
+    return {
+        "total": total,
+        "success": success,
+        "failures": total - success,
+        "missed": missed,
+        "overlap": overlap,
+        "success_rate": round(success / total, 4) if total else None,
+        "duration_p50": _percentile(durations, 50),
+        "duration_p95": _percentile(durations, 95),
+        "duration_max": durations[-1] if durations else None,
+        "stages": stages,
+    }
+
+
+def rolling_aggregates(
+    start: datetime,
+    end: datetime,
+    window: timedelta,
+    step: timedelta,
+    log_dir: Path | None = None,
+) -> list[dict]:
+    """
+    Summaries (see summarize) of the trailing `window` at every `step` from
+    `start` to `end`, e.g. the 7-day success rate day by day over a quarter.
+    The logs are read once for the whole range.
+
+    Returns:
+        list[dict]: One summary per point, with its "end" timestamp added.
+    """
+    entries, _ = query_logs(start - window, end, log_dir)
+    timestamps = [e["timestamp"] for e in entries]
+
+    points = []
+    point = start
+    while point <= end:
+        lo = bisect_left(timestamps, (point - window).timestamp())
+        hi = bisect_left(timestamps, point.timestamp())
+        summary = summarize(entries[lo:hi])
+        summary["end"] = point.timestamp()
+        points.append(summary)
+        point += step
+
+    return points
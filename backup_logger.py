@@ -1,28 +1,80 @@
+import gzip
 import json
 import os
 from datetime import datetime, timedelta
 from pathlib import Path
 from zoneinfo import ZoneInfo
 
+from dotenv import load_dotenv
+
+load_dotenv()
+
 LOG_DIR = Path("./logs")
 LOG_DIR.mkdir(exist_ok=True)
 LOCAL_TZ = ZoneInfo("America/Hermosillo")  # Sonora = no DST
 
+# Days older than the cleanup age are gzipped next to the live files
+ARCHIVE_SUFFIX = ".gz"
+# Sparse timestamp index of a daily file (see backup_log_query)
+INDEX_SUFFIX = ".idx"
+# Compressed days older than this are deleted, 0 = keep them all
+LOG_KEEP_DAYS = int(os.getenv("BACKUP_LOG_KEEP_DAYS", "365"))
+
 
 def get_log_file(ts_utc: datetime) -> Path:
     local_ts = ts_utc.astimezone(LOCAL_TZ)
     return LOG_DIR / f"{local_ts.strftime('%Y-%m-%d')}.jsonl"
 
 
-def cleanup_logs(days=7):
-    cutoff = datetime.now(LOCAL_TZ) - timedelta(days=days)
+def _file_date(file: Path) -> datetime:
+    # YYYY-MM-DD.jsonl, YYYY-MM-DD.jsonl.gz
+    date_str = file.name.split(".")[0]
+    return datetime.strptime(date_str, "%Y-%m-%d").astimezone(LOCAL_TZ)
+
+
+def cleanup_logs(days=7, keep_days: int | None = None):
+    """
+    Compress the daily files older than `days` into YYYY-MM-DD.jsonl.gz, which
+    backup_log_query still reads, and delete compressed days older than
+    `keep_days` (BACKUP_LOG_KEEP_DAYS, 0 = never).
+    """
+    keep_days = LOG_KEEP_DAYS if keep_days is None else keep_days
+    now = datetime.now(LOCAL_TZ)
+    cutoff = now - timedelta(days=days)
 
     for file in LOG_DIR.glob("*.jsonl"):
-        date_str = file.stem
-        file_date = datetime.strptime(date_str, "%Y-%m-%d").astimezone(LOCAL_TZ)
+        if _file_date(file) < cutoff:
+            archive_log_file(file)
 
-        if file_date < cutoff:
-            file.unlink(missing_ok=True)
+    if keep_days:
+        keep_cutoff = now - timedelta(days=keep_days)
+        for file in LOG_DIR.glob(f"*.jsonl{ARCHIVE_SUFFIX}"):
+            if _file_date(file) < keep_cutoff:
+                file.unlink(missing_ok=True)
+
+
+def archive_log_file(file: Path):
+    """
+    Gzip a daily log file and drop it with its index. Lines appended to a day that
+    was already compressed are added as another gzip member.
+    """
+    archive = file.with_name(f"{file.name}{ARCHIVE_SUFFIX}")
+    tmp = archive.with_name(f"{archive.name}.tmp")
+
+    with open(tmp, "wb") as out:
+        if archive.exists():
+            out.write(archive.read_bytes())
+        with open(file, "rb") as src, gzip.GzipFile(
+            filename=file.name, mode="wb", fileobj=out
+        ) as gz:
+            while chunk := src.read(1024 * 1024):
+                gz.write(chunk)
+        out.flush()
+        os.fsync(out.fileno())
+
+    os.replace(tmp, archive)
+    file.unlink(missing_ok=True)
+    file.with_name(f"{file.name}{INDEX_SUFFIX}").unlink(missing_ok=True)
 
 
 def log_execution(entry: dict):
@@ -41,31 +93,40 @@ def log_execution(entry: dict):
         os.fsync(f.fileno())
 
 
-def build_log_entry(start_time: datetime, status: str, duration: float, error=None):
-    return {
+def build_log_entry(
+    start_time: datetime,
+    status: str,
+    duration: float,
+    error=None,
+    destinations: dict | None = None,
+    stages: list[dict] | None = None,
+):
+    entry = {
         "timestamp": start_time.timestamp(),
-        "status": status,  # "success" | "failure"
+        "status": status,  # "success" | "failure" | "missed" | "overlap"
         "duration": round(duration, 3),
         "error": error,
     }
 
+    # Per-destination outcome of the upload: {"name": "success" | "failure: ..."}
+    if destinations is not None:
+        entry["destinations"] = {
+            name: "success" if dest_error is None else f"failure: {dest_error}"
+            for name, dest_error in destinations.items()
+        }
 
-def read_log_file(path: Path):
-    entries = []
-    corrupted = 0
-
-    if not path.exists():
-        return entries, corrupted
+    # Spans of the run stages (see backup_metrics.stage), in the order they ended
+    if stages:
+        entry["stages"] = stages
 
-    with open(path, "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
+        archive = next((s for s in reversed(stages) if s["name"] == "archive"), {})
+        # Archives streamed into the upload (or given as is) are measured there
+        uploaded = [s["bytes_out"] for s in stages if s["name"] == "upload"]
+        size = archive.get("bytes_out") or next(filter(None, uploaded), None)
 
-            try:
-                entries.append(json.loads(line))
-            except json.JSONDecodeError:
-                corrupted += 1
+        if size:
+            entry["archive_size"] = size
+            if archive.get("bytes_in"):
+                entry["compression_ratio"] = round(archive["bytes_in"] / size, 3)
 
-    return entries, corrupted
+    return entry
@@ -0,0 +1,240 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+from backup_profile import trace
+
+load_dotenv()
+
+# Prometheus node_exporter textfile collector target (e.g.
+# /var/lib/node_exporter/textfile_collector/outline_backup.prom), empty = off
+METRICS_TEXTFILE = os.getenv("BACKUP_METRICS_TEXTFILE", "")
+
+METRIC_PREFIX = "outline_backup"
+
+_stages = []
+_stages_lock = threading.Lock()
+
+
+def reset_stages():
+    """
+    Forget the stages recorded so far (start of a run).
+    """
+    with _stages_lock:
+        _stages.clear()
+
+
+def recorded_stages() -> list[dict]:
+    with _stages_lock:
+        return list(_stages)
+
+
+@contextmanager
+def stage(name: str, target: str | None = None):
+    """
+    Record a stage of the run as a span: start, duration and, when the body sets
+    them on the yielded dict, the bytes read ("bytes_in") and written
+    ("bytes_out"). Throughput and compression ratio are derived from those.
+
+    Arguments:
+        name (str): Stage name (dump_db, copy_volume, archive, upload, ...).
+        target (str | None): Destination the stage works on, if any.
+
+    Yields:
+        dict: The span, for the body to fill in bytes_in / bytes_out.
+    """
+    span = {
+        "name": name,
+        "target": target,
+        "start": round(time.time(), 3),
+        "bytes_in": None,
+        "bytes_out": None,
+    }
+    started = time.perf_counter()
+    status = "success"
+
+    try:
+        # Also on the --profile timeline
+        with trace(name, cat="stage", target=target) as args:
+            try:
+                yield span
+            finally:
+                args.update(bytes_in=span["bytes_in"], bytes_out=span["bytes_out"])
+    except BaseException:
+        status = "failure"
+        raise
+    finally:
+        duration = time.perf_counter() - started
+        span["duration"] = round(duration, 3)
+        span["status"] = status
+
+        # Throughput of what the stage consumed, or produced when input is unknown
+        processed = (
+            span["bytes_in"] if span["bytes_in"] is not None else span["bytes_out"]
+        )
+        span["mb_per_s"] = (
+            round(processed / duration / 1e6, 3)
+            if processed is not None and duration > 0
+            else None
+        )
+        span["ratio"] = (
+            round(span["bytes_in"] / span["bytes_out"], 3)
+            if span["bytes_in"] and span["bytes_out"]
+            else None
+        )
+
+        with _stages_lock:
+            _stages.append(span)
+
+
+def tree_size(path: Path | str) -> int:
+    """
+    Total size of the regular files under `path`.
+    """
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except FileNotFoundError:
+                pass
+    return total
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels) -> str:
+    pairs = [
+        f'{key}="{_escape(value)}"'
+        for key, value in labels.items()
+        if value is not None
+    ]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def format_prometheus(entry: dict) -> str:
+    """
+    Prometheus text exposition of a log entry (see build_log_entry) and its stages.
+    """
+    metrics = {}
+
+    def add(name: str, kind: str, help_text: str, value, **labels):
+        if value is None:
+            return
+        metric = metrics.setdefault(
+            f"{METRIC_PREFIX}_{name}", {"type": kind, "help": help_text, "samples": {}}
+        )
+        # A stage run twice (retries) keeps its last value
+        metric["samples"][_labels(**labels)] = value
+
+    add(
+        "last_run_timestamp_seconds",
+        "gauge",
+        "Start of the last backup run.",
+        entry["timestamp"],
+    )
+    add(
+        "last_run_success",
+        "gauge",
+        "1 if the last backup run succeeded.",
+        int(entry["status"] == "success"),
+    )
+    add(
+        "last_run_duration_seconds",
+        "gauge",
+        "Duration of the last backup run.",
+        entry["duration"],
+    )
+    add(
+        "archive_size_bytes",
+        "gauge",
+        "Size of the last archive.",
+        entry.get("archive_size"),
+    )
+
+    for span in entry.get("stages") or []:
+        labels = {"stage": span["name"], "target": span.get("target")}
+        add(
+            "stage_duration_seconds",
+            "gauge",
+            "Duration of a stage of the last run.",
+            span["duration"],
+            **labels,
+        )
+        add(
+            "stage_success",
+            "gauge",
+            "1 if the stage succeeded in the last run.",
+            int(span["status"] == "success"),
+            **labels,
+        )
+        add(
+            "stage_bytes",
+            "gauge",
+            "Bytes read (in) or written (out) by a stage of the last run.",
+            span["bytes_in"],
+            direction="in",
+            **labels,
+        )
+        add(
+            "stage_bytes",
+            "gauge",
+            "Bytes read (in) or written (out) by a stage of the last run.",
+            span["bytes_out"],
+            direction="out",
+            **labels,
+        )
+        add(
+            "stage_throughput_bytes_per_second",
+            "gauge",
+            "Throughput of a stage of the last run.",
+            None if span["mb_per_s"] is None else span["mb_per_s"] * 1e6,
+            **labels,
+        )
+        add(
+            "stage_compression_ratio",
+            "gauge",
+            "Bytes in / bytes out of a stage of the last run.",
+            span["ratio"],
+            **labels,
+        )
+
+    lines = []
+    for name, metric in metrics.items():
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        for labels, value in metric["samples"].items():
+            lines.append(f"{name}{labels} {value}")
+
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus_textfile(entry: dict, path: Path | str | None = None):
+    """
+    Export a log entry for the node_exporter textfile collector. The file is
+    replaced atomically so the collector never reads a partial one. Does nothing
+    when no path is configured (BACKUP_METRICS_TEXTFILE).
+
+    Arguments:
+        entry (dict): Log entry built by build_log_entry.
+        path (Path | str | None): Target .prom file, defaults to METRICS_TEXTFILE.
+    """
+    path = path or METRICS_TEXTFILE
+    if not path:
+        return
+
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        tmp.write_text(format_prometheus(entry), encoding="utf-8")
+        os.replace(tmp, path)
+    except OSError as e:
+        # Metrics are best effort, the run itself is already logged
+        tmp.unlink(missing_ok=True)
+        print(f"Could not write metrics to {path}: {e}")
@@ -0,0 +1,238 @@
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+PROFILE_DIR = Path("./profiles")
+# Seconds between memory samples on the timeline
+PROFILE_SAMPLE_INTERVAL = 0.1
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+try:
+    import resource
+except ImportError:
+    # Windows: no peak RSS nor child process usage
+    resource = None
+
+
+def _peak_rss_mb() -> float | None:
+    if resource is None:
+        return None
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3, 1)
+
+
+class Profiler:
+    """
+    Collects a Chrome trace (chrome://tracing, Perfetto) of a run: one complete
+    event per stage, traced block and child process, plus memory counters sampled
+    in the background.
+    """
+
+    def __init__(self):
+        self.events = []
+        self.threads = {}
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+        self.origin = time.perf_counter()
+        self.started_at = datetime.now(timezone.utc)
+
+        self.stop_sampling = threading.Event()
+        self.sampler = threading.Thread(target=self._sample, daemon=True)
+
+    def start(self):
+        tracemalloc.start()
+        self.sampler.start()
+
+    def stop(self):
+        self.stop_sampling.set()
+        self.sampler.join()
+        tracemalloc.stop()
+
+    def micros(self, perf: float) -> float:
+        return round((perf - self.origin) * 1e6, 1)
+
+    def add(self, event: dict):
+        thread = threading.current_thread()
+        event.setdefault("pid", self.pid)
+        event.setdefault("tid", thread.ident)
+        with self.lock:
+            self.threads.setdefault(thread.ident, thread.name)
+            self.events.append(event)
+
+    def _sample(self):
+        while not self.stop_sampling.wait(PROFILE_SAMPLE_INTERVAL):
+            self.add(
+                {
+                    "name": "memory",
+                    "ph": "C",
+                    "ts": self.micros(time.perf_counter()),
+                    "args": {
+                        "rss_mb": _current_rss_mb(),
+                        "py_heap_mb": round(
+                            tracemalloc.get_traced_memory()[0] / 1e6, 1
+                        ),
+                    },
+                }
+            )
+
+    def write(self, path: Path):
+        metadata = [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": self.pid,
+                "tid": tid,
+                "args": {"name": name},
+            }
+            for tid, name in self.threads.items()
+        ]
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "traceEvents": metadata + self.events,
+                    "displayTimeUnit": "ms",
+                    "otherData": {"started_at": self.started_at.isoformat()},
+                },
+                f,
+                separators=(",", ":"),
+            )
+
+
+_profiler: Profiler | None = None
+# Seconds each thread spent blocked on child processes (see `blocked`)
+_local = threading.local()
+
+
+def start_profiling():
+    global _profiler
+    _profiler = Profiler()
+    _profiler.start()
+
+
+def stop_profiling(path: Path | str | None = None) -> Path | None:
+    """
+    Stop profiling and write the trace.
+
+    Arguments:
+        path (Path | str | None): Trace file, defaults to
+            PROFILE_DIR/<UTC start time>.trace.json.
+
+    Returns:
+        Path | None: The trace file, None when profiling was not started.
+    """
+    global _profiler
+    profiler, _profiler = _profiler, None
+    if profiler is None:
+        return None
+
+    profiler.stop()
+    stamp = profiler.started_at.strftime("%Y%m%d-%H%M%S")
+    path = Path(path) if path else PROFILE_DIR / f"{stamp}.trace.json"
+    profiler.write(path)
+    return path
+
+
+def _current_rss_mb() -> float | None:
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return round(int(f.read().split()[1]) * _PAGE_SIZE / 1e6, 1)
+    except (OSError, IndexError, ValueError):
+        # Peak instead of current where /proc is missing
+        return _peak_rss_mb()
+
+
+def _blocked_seconds() -> float:
+    return getattr(_local, "blocked", 0.0)
+
+
+@contextmanager
+def trace(name: str, cat: str = "python", **args):
+    """
+    Record the body as a complete event on the timeline: wall time, CPU time of
+    this thread, time it spent blocked on child processes, peak RSS and peak
+    Python heap so far. Does nothing unless profiling.
+
+    Arguments:
+        name (str): Event name.
+        cat (str): Event category (stage, subprocess, wait, python).
+        **args: Extra event arguments.
+
+    Yields:
+        dict: The event arguments, for the body to add to (bytes moved, ...).
+    """
+    profiler = _profiler
+    if profiler is None:
+        yield args
+        return
+
+    started = time.perf_counter()
+    cpu = time.thread_time()
+    blocked = _blocked_seconds()
+
+    try:
+        yield args
+    finally:
+        ended = time.perf_counter()
+        args.update(
+            wall_ms=round((ended - started) * 1e3, 3),
+            cpu_ms=round((time.thread_time() - cpu) * 1e3, 3),
+            blocked_ms=round((_blocked_seconds() - blocked) * 1e3, 3),
+            peak_rss_mb=_peak_rss_mb(),
+            peak_py_heap_mb=round(tracemalloc.get_traced_memory()[1] / 1e6, 1),
+        )
+        profiler.add(
+            {
+                "name": name,
+                "cat": cat,
+                "ph": "X",
+                "ts": profiler.micros(started),
+                "dur": profiler.micros(ended) - profiler.micros(started),
+                "args": args,
+            }
+        )
+
+
+@contextmanager
+def blocked(name: str, cmd: list[str] | None = None):
+    """
+    Trace time spent waiting for a child process (subprocess.run, proc.wait()),
+    counted as blocked time of the enclosing traces, with the CPU time and peak
+    RSS of the children reaped meanwhile.
+
+    Arguments:
+        name (str): Event name.
+        cmd (list[str] | None): Command waited for.
+    """
+    if _profiler is None:
+        yield
+        return
+
+    started = time.perf_counter()
+    children = resource.getrusage(resource.RUSAGE_CHILDREN) if resource else None
+
+    with trace(name, cat="wait", cmd=" ".join(cmd) if cmd else None) as args:
+        try:
+            yield
+        finally:
+            _local.blocked = _blocked_seconds() + time.perf_counter() - started
+
+            if children is not None:
+                after = resource.getrusage(resource.RUSAGE_CHILDREN)
+                args["child_cpu_ms"] = round(
+                    (
+                        after.ru_utime
+                        + after.ru_stime
+                        - children.ru_utime
+                        - children.ru_stime
+                    )
+                    * 1e3,
+                    3,
+                )
+                args["child_peak_rss_mb"] = round(after.ru_maxrss / 1e3, 1)
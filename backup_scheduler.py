@@ -0,0 +1,232 @@
+import os
+import random
+import threading
+import time
+import traceback
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable
+
+from dotenv import load_dotenv
+
+from backup_logger import LOCAL_TZ
+
+load_dotenv()
+
+# Cron expressions (minute hour day month weekday) in local time (LOCAL_TZ)
+BACKUP_SCHEDULE = os.getenv("BACKUP_SCHEDULE", "0 1-22 * * *")
+DAILY_REPORT_SCHEDULE = os.getenv("DAILY_REPORT_SCHEDULE", "30 23 * * *")
+# Random delay (seconds) added to each backup slot
+BACKUP_SCHEDULE_JITTER = float(os.getenv("BACKUP_SCHEDULE_JITTER", "120"))
+# A slot is still run this many seconds late, later it is logged as missed
+BACKUP_MISFIRE_GRACE = float(os.getenv("BACKUP_MISFIRE_GRACE", "300"))
+
+BACKUP_DAEMON_LOCK = Path(os.getenv("BACKUP_DAEMON_LOCK", "./backups/.daemon.lock"))
+BACKUP_RUN_LOCK = Path(os.getenv("BACKUP_RUN_LOCK", "./backups/.backup.lock"))
+
+# Longest sleep between checks, so suspend / clock jumps are noticed
+_MAX_SLEEP = 60
+
+
+class CronSchedule:
+    """
+    Standard 5-field cron expression: minute hour day-of-month month day-of-week,
+    each `*`, a number, a range `a-b`, a step `*/n` or `a-b/n`, or a comma list of
+    those. Like cron, a job matches either day field when both are restricted.
+    Weekdays are 0-6 from Sunday (7 is Sunday too).
+    """
+
+    FIELDS = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+    def __init__(self, expr: str):
+        parts = expr.split()
+        if len(parts) != 5:
+            raise ValueError(f"Cron expression needs 5 fields, got '{expr}'")
+
+        self.expr = expr
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            self._parse(part, low, high)
+            for part, (low, high) in zip(parts, self.FIELDS)
+        )
+        self.weekdays = {day % 7 for day in weekdays}
+        self.any_day = parts[2] == "*"
+        self.any_weekday = parts[4] == "*"
+
+    @staticmethod
+    def _parse(part: str, low: int, high: int) -> set[int]:
+        values = set()
+        for item in part.split(","):
+            spec, _, step = item.partition("/")
+            try:
+                step = int(step) if step else 1
+                if spec == "*":
+                    start, end = low, high
+                elif "-" in spec:
+                    start, end = (int(v) for v in spec.split("-", 1))
+                else:
+                    start = end = int(spec)
+            except ValueError:
+                raise ValueError(f"Invalid cron field: '{part}'") from None
+
+            if not low <= start <= end <= high or step < 1:
+                raise ValueError(f"Cron field out of range {low}-{high}: '{part}'")
+            values.update(range(start, end + 1, step))
+
+        return values
+
+    def _day_matches(self, dt: datetime) -> bool:
+        day = dt.day in self.days
+        # isoweekday: Monday 1 .. Sunday 7
+        weekday = dt.isoweekday() % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next_after(self, dt: datetime) -> datetime:
+        """
+        First matching minute strictly after `dt`, in LOCAL_TZ.
+        """
+        dt = dt.astimezone(LOCAL_TZ).replace(second=0, microsecond=0)
+        dt += timedelta(minutes=1)
+        limit = dt + timedelta(days=5 * 366)
+
+        while dt < limit:
+            if dt.month not in self.months:
+                dt = (dt.replace(day=1) + timedelta(days=32)).replace(
+                    day=1, hour=0, minute=0
+                )
+            elif not self._day_matches(dt):
+                dt = (dt + timedelta(days=1)).replace(hour=0, minute=0)
+            elif dt.hour not in self.hours:
+                dt = (dt + timedelta(hours=1)).replace(minute=0)
+            elif dt.minute not in self.minutes:
+                dt += timedelta(minutes=1)
+            else:
+                return dt
+
+        raise ValueError(f"Cron expression never matches: '{self.expr}'")
+
+    def count_between(self, start: datetime, end: datetime) -> int:
+        """
+        Number of slots in (start, end].
+        """
+        count = 0
+        slot = self.next_after(start)
+        while slot <= end:
+            count += 1
+            slot = self.next_after(slot)
+        return count
+
+
+@dataclass
+class Job:
+    """
+    A scheduled function. `on_skip(slot, status, reason)` is called for slots that
+    were not run: "missed" (too late) or "overlap" (previous run still going).
+    """
+
+    name: str
+    schedule: CronSchedule
+    func: Callable[[], None]
+    jitter: float = 0.0
+    on_skip: Callable[[datetime, str, str], None] | None = None
+
+    slot: datetime | None = None
+    run_at: float = 0.0
+    thread: threading.Thread | None = field(default=None, repr=False)
+    started: datetime | None = None
+
+    def plan(self, after: datetime):
+        self.slot = self.schedule.next_after(after)
+        self.run_at = self.slot.timestamp() + random.uniform(0, self.jitter)
+
+    @property
+    def running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+
+class Scheduler:
+    """
+    Runs jobs on their cron schedules, each in its own thread so a slow job does
+    not hold the others back. A job still running at its next slot skips that
+    slot; slots that passed while the process could not act (suspended, clock
+    jump) are skipped too. Both are reported through the job's on_skip.
+    """
+
+    def __init__(self, jobs: list[Job], misfire_grace: float | None = None):
+        self.jobs = jobs
+        self.misfire_grace = (
+            BACKUP_MISFIRE_GRACE if misfire_grace is None else misfire_grace
+        )
+        self.stop_event = threading.Event()
+
+    def run(self):
+        """
+        Block until stop() is called, then wait for the running jobs.
+        """
+        now = datetime.now(LOCAL_TZ)
+        for job in self.jobs:
+            job.plan(now)
+            print(f"Scheduled {job.name} ({job.schedule.expr}): next at {job.slot}")
+
+        while not self.stop_event.is_set():
+            job = min(self.jobs, key=lambda j: j.run_at)
+            delay = job.run_at - time.time()
+            if delay > 0:
+                self.stop_event.wait(min(delay, _MAX_SLEEP))
+                continue
+
+            self._fire(job)
+
+        for job in self.jobs:
+            if job.running:
+                print(f"Waiting for {job.name} to finish...")
+                job.thread.join()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _skip(self, job: Job, slot: datetime, status: str, reason: str):
+        print(f"Skipped {job.name} at {slot}: {reason}")
+        if job.on_skip is not None:
+            try:
+                job.on_skip(slot, status, reason)
+            except Exception:
+                traceback.print_exc()
+
+    def _fire(self, job: Job):
+        now = datetime.now(LOCAL_TZ)
+        slot = job.slot
+
+        # Every slot but the latest one that passed was missed
+        while (later := job.schedule.next_after(slot)) <= now:
+            self._skip(job, slot, "missed", "scheduler was not running on time")
+            slot = later
+
+        late = now.timestamp() - max(job.run_at, slot.timestamp())
+        if late > self.misfire_grace:
+            self._skip(job, slot, "missed", f"{late:.0f}s late")
+        elif job.running:
+            self._skip(
+                job,
+                slot,
+                "overlap",
+                f"previous run still in progress (started {job.started})",
+            )
+        else:
+            job.started = now
+            job.thread = threading.Thread(
+                target=self._run_job, args=(job,), name=job.name
+            )
+            job.thread.start()
+
+        job.plan(slot)
+
+    @staticmethod
+    def _run_job(job: Job):
+        try:
+            job.func()
+        except Exception:
+            # The daemon outlives a failing run; its error is already notified
+            traceback.print_exc()
@@ -0,0 +1,476 @@
+"""
+Benchmark the backup pipeline (create, upload, download, restore) with local
+stand-ins: a synthetic volume, a fake docker/pg_dump (benchmarks/bin) and an
+in-process SFTP server. Results are written as JSON; pass a previous results
+file with --baseline to flag regressions.
+
+Linux only (sudo/docker are replaced through PATH, RSS is read from /proc).
+
+Usage:
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --codecs gzip zstd --large-size 512
+    python benchmarks/run_benchmarks.py --baseline benchmarks/results/old.json
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+BENCH_DIR = Path(__file__).resolve().parent
+REPO_ROOT = BENCH_DIR.parent
+RESULTS_VERSION = 1
+MB = 1024 * 1024
+
+CODECS = ["gzip", "pigz", "zstd", "none", "seekable"]
+BACKUP_MODES = ["work_dir", "streaming", "mirror", "mirror_warm"]
+RESTORE_MODES = ["extract", "streaming"]
+
+
+class Sampler:
+    """
+    Track wall time, peak RSS (this process and its children) and peak extra
+    disk usage of the filesystem holding `disk_path` while a stage runs.
+    """
+
+    def __init__(self, disk_path: Path, interval: float = 0.05):
+        self.disk_path = disk_path
+        self.interval = interval
+
+    def __enter__(self):
+        self.peak_rss = 0
+        self.disk_base = shutil.disk_usage(self.disk_path).used
+        self.peak_disk = 0
+
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self._sample, daemon=True)
+        self.start = time.perf_counter()
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.wall = time.perf_counter() - self.start
+        self.stop.set()
+        self.thread.join()
+
+    def _sample(self):
+        while True:
+            self.peak_rss = max(self.peak_rss, _tree_rss(os.getpid()))
+            used = shutil.disk_usage(self.disk_path).used - self.disk_base
+            self.peak_disk = max(self.peak_disk, used)
+
+            if self.stop.wait(self.interval):
+                break
+
+
+def _tree_rss(pid: int) -> int:
+    """
+    Resident memory of a process and all of its descendants, in bytes.
+    """
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            rss = int(f.read().split()[1]) * resource.getpagesize()
+    except (FileNotFoundError, ProcessLookupError):
+        return 0  # exited while sampling
+
+    children = []
+    try:
+        for task in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{task}/children") as f:
+                children.extend(int(child) for child in f.read().split())
+    except (FileNotFoundError, ProcessLookupError):
+        pass  # exited, or kernel without /proc/<pid>/task/<tid>/children
+
+    return rss + sum(_tree_rss(child) for child in children)
+
+
+def _directory_size(path: Path) -> int:
+    return sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+
+
+def generate_volume(
+    volume_dir: Path,
+    small_files: int,
+    small_size: int,
+    large_files: int,
+    large_size: int,
+    seed: int,
+):
+    """
+    Fill a synthetic upload volume: many small files spread over nested
+    directories plus a few large ones, about half compressible.
+    """
+    rng = random.Random(seed)
+
+    def content(size: int) -> bytes:
+        noise = rng.randbytes(size // 2)
+        return noise + noise[:64] * ((size - len(noise)) // 64 + 1)
+
+    for i in range(small_files):
+        path = volume_dir / "uploads" / f"{i % 97:02d}" / f"{i % 13}" / f"file_{i}.bin"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content(small_size)[:small_size])
+
+    block = content(MB)[:MB]
+    for i in range(large_files):
+        path = volume_dir / "large" / f"attachment_{i}.bin"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as f:
+            for _ in range(large_size // MB):
+                f.write(block)
+
+
+class Benchmark:
+    def __init__(self, args, work: Path):
+        self.args = args
+        self.work = work
+        self.results = []
+
+        self.volumes = work / "volumes"
+        self.backup_root = work / "backups"
+        self.remote_root = work / "remote"
+        self.downloads = work / "downloads"
+        for path in (self.volumes, self.backup_root, self.remote_root, self.downloads):
+            path.mkdir(parents=True)
+
+    def record(self, stage: str, codec: str, mode: str, sampler: Sampler, size: int):
+        result = {
+            "stage": stage,
+            "codec": codec,
+            "mode": mode,
+            "wall_s": round(sampler.wall, 3),
+            "bytes": size,
+            "mb_s": round(size / MB / sampler.wall, 2) if sampler.wall else None,
+            "peak_rss_mb": round(sampler.peak_rss / MB, 1),
+            "peak_disk_mb": round(sampler.peak_disk / MB, 1),
+        }
+        self.results.append(result)
+        _report(
+            f"{stage:<9} {codec:<9} {mode:<12} {result['wall_s']:>8.2f}s "
+            f"{result['mb_s'] or 0:>9.1f} MB/s  rss {result['peak_rss_mb']:>7.1f} MB  "
+            f"disk {result['peak_disk_mb']:>8.1f} MB"
+        )
+
+    def setup(self):
+        os.environ.update(
+            {
+                "PATH": f"{BENCH_DIR / 'bin'}{os.pathsep}{os.environ['PATH']}",
+                "BENCH_VOLUMES": str(self.volumes),
+                "BENCH_DUMP_SIZE": str(self.args.dump_size * MB),
+                "SQL_USER": "outline",
+                "SQL_DBNAME": "outline",
+                "BACKUP_MIRROR_DIR": str(self.work / "mirror"),
+                "DEBUG": "True",
+                "BACKUP_DESTINATIONS": "",
+                # Failures are raised here, do not page the alerts channel
+                "DISCORD_BACKUP_ALERTS_URL": "",
+            }
+        )
+
+        from sftp_server import LocalSFTPServer
+
+        server = LocalSFTPServer(self.remote_root)
+        os.environ.update(
+            {
+                "FTP_HOST": "127.0.0.1",
+                "FTP_PORT": str(server.port),
+                "FTP_USERNAME": "bench",
+                "FTP_PASSWORD": "bench",
+            }
+        )
+
+        _report("Generating synthetic volume...")
+        generate_volume(
+            self.volumes / "source",
+            self.args.small_files,
+            self.args.small_size * 1024,
+            self.args.large_files,
+            self.args.large_size * MB,
+            self.args.seed,
+        )
+        self.input_size = (
+            _directory_size(self.volumes / "source") + self.args.dump_size * MB
+        )
+
+    def run_backups(self, codec: str) -> Path:
+        from outline_backup import OutlineBackup
+
+        archive = None
+        for mode in self.args.modes:
+            backup = OutlineBackup(
+                "source",
+                backup_root=self.backup_root,
+                streaming=mode == "streaming",
+                codec=codec,
+                mirror=mode.startswith("mirror"),
+            )
+            if mode == "mirror":
+                shutil.rmtree(backup.mirror_dir, ignore_errors=True)
+                backup.mirror_state_path.unlink(missing_ok=True)
+
+            with Sampler(self.work) as sampler:
+                path = backup.create_backup()
+            self.record("backup", codec, mode, sampler, self.input_size)
+
+            # Keep one archive per codec for the transfer and restore stages
+            if archive is None:
+                archive = path.rename(
+                    self.work / f"archive_{codec}{backup.codec.suffix}"
+                )
+            else:
+                path.unlink()
+
+        return archive
+
+    def run_transfers(self, codec: str, archive: Path):
+        from backup_helper import BackupHelperSFTP
+
+        size = archive.stat().st_size
+        for channels in self.args.channels:
+            mode = f"{channels}ch"
+            remote_dir = f"bench/{codec}_{mode}"
+            (self.remote_root / remote_dir).mkdir(parents=True)
+
+            helper = BackupHelperSFTP()
+            helper.channels = channels
+            with Sampler(self.work) as sampler:
+                helper.upload_backup(local_archive=archive, remote_dir=remote_dir)
+            self.record("upload", codec, mode, sampler, size)
+
+            local_dir = self.downloads / f"{codec}_{mode}"
+            with Sampler(self.work) as sampler:
+                helper.download_backup(remote_dir=remote_dir, local_dir=local_dir)
+            self.record("download", codec, mode, sampler, size)
+
+            helper.close()
+            shutil.rmtree(local_dir)
+            shutil.rmtree(self.remote_root / remote_dir)
+
+    def run_fan_out(self, codec: str, archive: Path):
+        """
+        One upload to two SFTP directories and a local directory at once.
+        """
+        from backup_catalog import RetentionPolicy
+        from backup_destinations import Destination, fan_out_upload
+
+        remote_dir = f"bench/{codec}_fanout"
+        destinations = [
+            Destination(f"sftp{i}", "sftp", f"{remote_dir}/{i}", RetentionPolicy())
+            for i in range(2)
+        ]
+        destinations.append(
+            Destination("local", "local", str(self.work / "local"), RetentionPolicy())
+        )
+
+        with Sampler(self.work) as sampler:
+            results = fan_out_upload(archive, destinations)
+        if any(results.values()):
+            raise RuntimeError(f"Fan-out upload failed: {results}")
+        self.record("upload", codec, "fanout", sampler, archive.stat().st_size)
+
+        shutil.rmtree(self.remote_root / remote_dir)
+        shutil.rmtree(self.work / "local")
+
+    def run_pipe_upload(self, codec: str):
+        from backup_destinations import load_destinations
+        from outline_backup import OutlineBackup
+        from sftp_backup import REMOTE_BACKUP_DIR, _upload_while_creating
+
+        backup = OutlineBackup(
+            "source", backup_root=self.backup_root, streaming=True, codec=codec
+        )
+        with Sampler(self.work) as sampler:
+            results = _upload_while_creating(
+                backup, load_destinations(REMOTE_BACKUP_DIR)
+            )
+        if any(results.values()):
+            raise RuntimeError(f"Pipe upload failed: {results}")
+        self.record("backup", codec, "pipe_upload", sampler, self.input_size)
+
+    def run_restores(self, codec: str, archive: Path):
+        from outline_backup import OutlineBackup
+
+        for mode in RESTORE_MODES:
+            backup = OutlineBackup(
+                "restored",
+                restore_archive_path=archive,
+                streaming=mode == "streaming",
+                codec=codec,
+            )
+            with Sampler(self.work) as sampler:
+                backup.restore_backup()
+            self.record("restore", codec, mode, sampler, self.input_size)
+
+    def run(self):
+        self.setup()
+
+        for codec in self.args.codecs:
+            if codec in ("pigz", "zstd") and not shutil.which(codec):
+                _report(f"Skipping {codec}: not installed")
+                continue
+
+            archive = self.run_backups(codec)
+            if self.args.pipe_upload:
+                self.run_pipe_upload(codec)
+            self.run_transfers(codec, archive)
+            self.run_fan_out(codec, archive)
+            self.run_restores(codec, archive)
+            archive.unlink()
+
+
+def _report(message: str):
+    print(message, file=sys.stderr, flush=True)
+
+
+def _git_revision() -> str | None:
+    result = subprocess.run(
+        ["git", "rev-parse", "--short", "HEAD"],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+    )
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+def compare(results: list[dict], baseline_path: Path, threshold: float) -> int:
+    """
+    Print wall-time changes against a previous results file.
+
+    Returns:
+        int: Number of stages slower than the baseline by more than `threshold`.
+    """
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+
+    previous = {(r["stage"], r["codec"], r["mode"]): r for r in baseline["results"]}
+    regressions = 0
+
+    _report(f"\nCompared to {baseline_path} ({baseline.get('revision')}):")
+    for result in results:
+        old = previous.get((result["stage"], result["codec"], result["mode"]))
+        if old is None:
+            continue
+
+        change = (result["wall_s"] - old["wall_s"]) / old["wall_s"]
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        _report(
+            f"{result['stage']:<9} {result['codec']:<9} {result['mode']:<12} "
+            f"{old['wall_s']:>8.2f}s -> {result['wall_s']:>8.2f}s ({change:+.0%}){flag}"
+        )
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--codecs", nargs="+", choices=CODECS, default=CODECS)
+    parser.add_argument(
+        "--modes", nargs="+", choices=BACKUP_MODES, default=BACKUP_MODES
+    )
+    parser.add_argument(
+        "--channels",
+        nargs="+",
+        type=int,
+        default=[1, 4],
+        help="SFTP channel counts to benchmark transfers with.",
+    )
+    parser.add_argument(
+        "--no-pipe-upload",
+        dest="pipe_upload",
+        action="store_false",
+        help="Skip the upload-while-creating benchmark.",
+    )
+    parser.add_argument("--small-files", type=int, default=2000)
+    parser.add_argument("--small-size", type=int, default=32, help="KiB per file.")
+    parser.add_argument("--large-files", type=int, default=2)
+    parser.add_argument("--large-size", type=int, default=128, help="MiB per file.")
+    parser.add_argument("--dump-size", type=int, default=64, help="MiB.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--work-dir", help="Scratch directory (default: a temporary directory)."
+    )
+    parser.add_argument(
+        "--output",
+        help="Results file (default: benchmarks/results/<timestamp>_<revision>.json).",
+    )
+    parser.add_argument("--baseline", help="Previous results file to compare with.")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.10,
+        help="Relative slowdown reported as a regression (default: 0.10).",
+    )
+    parser.add_argument(
+        "--verbose", action="store_true", help="Show the pipeline's own output."
+    )
+    args = parser.parse_args()
+
+    if platform.system() != "Linux":
+        parser.error("benchmarks need Linux (fake sudo/docker on PATH, /proc)")
+
+    sys.path.insert(0, str(BENCH_DIR))
+    sys.path.insert(0, str(REPO_ROOT))
+
+    output_path = Path(args.output).resolve() if args.output else None
+    baseline_path = Path(args.baseline).resolve() if args.baseline else None
+
+    # Run inside the scratch directory so relative paths used by the pipeline
+    # (./restores, logs) never touch the repository
+    with TemporaryDirectory(prefix="outline_bench_", dir=args.work_dir) as tmp:
+        work = Path(tmp)
+        os.chdir(work)
+
+        benchmark = Benchmark(args, work)
+        output = contextlib.nullcontext()
+        if not args.verbose:
+            output = contextlib.redirect_stdout(open(os.devnull, "w"))
+
+        with output:
+            benchmark.run()
+
+    revision = _git_revision()
+    results = {
+        "version": RESULTS_VERSION,
+        "created": datetime.now(timezone.utc).isoformat(),
+        "revision": revision,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "params": {
+            key: value
+            for key, value in vars(args).items()
+            if key not in ("output", "baseline", "work_dir", "verbose")
+        },
+        "input_bytes": benchmark.input_size,
+        "results": benchmark.results,
+    }
+
+    if output_path is None:
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output_path = BENCH_DIR / "results" / f"{stamp}_{revision or 'unknown'}.json"
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    _report(f"\nResults written to {output_path}")
+
+    if baseline_path and compare(benchmark.results, baseline_path, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
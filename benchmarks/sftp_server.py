@@ -0,0 +1,141 @@
+import os
+import socket
+import threading
+
+import paramiko
+from paramiko import (
+    AUTH_SUCCESSFUL,
+    OPEN_SUCCEEDED,
+    SFTP_OK,
+    SFTPAttributes,
+    SFTPHandle,
+    SFTPServer,
+    SFTPServerInterface,
+)
+
+
+class _Server(paramiko.ServerInterface):
+    def check_auth_password(self, username, password):
+        return AUTH_SUCCESSFUL
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_channel_request(self, kind, chanid):
+        return OPEN_SUCCEEDED
+
+
+class _Handle(SFTPHandle):
+    def stat(self):
+        try:
+            return SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+
+    def chattr(self, attr):
+        return SFTP_OK
+
+
+def _errno(func):
+    def wrapper(*args):
+        try:
+            result = func(*args)
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+        return SFTP_OK if result is None else result
+
+    return wrapper
+
+
+class _LocalSFTP(SFTPServerInterface):
+    """
+    Serve a local directory, remote paths are resolved under `root`.
+    """
+
+    root = None
+
+    def _path(self, path):
+        return self.root + self.canonicalize(path)
+
+    @_errno
+    def list_folder(self, path):
+        path = self._path(path)
+        out = []
+        for name in os.listdir(path):
+            attr = SFTPAttributes.from_stat(os.stat(os.path.join(path, name)))
+            attr.filename = name
+            out.append(attr)
+        return out
+
+    @_errno
+    def stat(self, path):
+        return SFTPAttributes.from_stat(os.stat(self._path(path)))
+
+    lstat = stat
+
+    @_errno
+    def open(self, path, flags, attr):
+        path = self._path(path)
+        fd = os.open(path, flags | getattr(os, "O_BINARY", 0), 0o644)
+
+        if flags & os.O_WRONLY:
+            mode = "ab" if flags & os.O_APPEND else "wb"
+        elif flags & os.O_RDWR:
+            mode = "a+b" if flags & os.O_APPEND else "r+b"
+        else:
+            mode = "rb"
+
+        handle = _Handle(flags)
+        handle.filename = path
+        handle.readfile = handle.writefile = os.fdopen(fd, mode)
+        return handle
+
+    @_errno
+    def remove(self, path):
+        os.remove(self._path(path))
+
+    @_errno
+    def rename(self, oldpath, newpath):
+        os.replace(self._path(oldpath), self._path(newpath))
+
+    posix_rename = rename
+
+    @_errno
+    def mkdir(self, path, attr):
+        os.mkdir(self._path(path))
+
+    @_errno
+    def rmdir(self, path):
+        os.rmdir(self._path(path))
+
+    def chattr(self, path, attr):
+        return SFTP_OK
+
+
+class LocalSFTPServer:
+    """
+    In-process SFTP server on 127.0.0.1 (any user/password) serving `root`.
+    Runs on daemon threads until the process exits.
+    """
+
+    def __init__(self, root):
+        _LocalSFTP.root = str(root)
+        self.host_key = paramiko.RSAKey.generate(2048)
+
+        self.sock = socket.socket()
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.listen(16)
+        self.port = self.sock.getsockname()[1]
+
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            conn, _ = self.sock.accept()
+            # Like sshd: without it, small replies wait for delayed ACKs
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            transport = paramiko.Transport(conn)
+            transport.add_server_key(self.host_key)
+            transport.set_subsystem_handler("sftp", SFTPServer, _LocalSFTP)
+            transport.start_server(server=_Server())
@@ -0,0 +1,165 @@
+import os
+import sqlite3
+import time
+from pathlib import Path
+from typing import Iterable
+
+from dotenv import load_dotenv
+
+from document_cache import DOCUMENT_CACHE_PATH
+
+load_dotenv()
+
+# Seconds between full comments.list syncs, which also drop deleted threads
+COMMENTS_FULL_SYNC_INTERVAL = int(
+    os.getenv("OUTLINE_COMMENTS_FULL_SYNC", str(7 * 24 * 3600))
+)
+
+
+class CommentIndex:
+    """
+    Local index of comment threads (top-level comments) per document and whether
+    they are resolved, stored next to the document cache. It is updated from the
+    comments changed since the last sync: comments.list sorted by updatedAt,
+    newest first, read down to the stored watermark.
+    """
+
+    def __init__(
+        self, path: Path | str | None = None, full_sync_interval: int | None = None
+    ):
+        self.path = Path(path or DOCUMENT_CACHE_PATH)
+        self.full_sync_interval = (
+            COMMENTS_FULL_SYNC_INTERVAL
+            if full_sync_interval is None
+            else full_sync_interval
+        )
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(self.path)
+        created = not self.db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' "
+            "AND name = 'comment_threads'"
+        ).fetchone()
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS comment_threads (id TEXT PRIMARY KEY, "
+            "document_id TEXT NOT NULL, resolved INTEGER NOT NULL, updated_at TEXT)"
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS comment_sync (key TEXT PRIMARY KEY, value TEXT)"
+        )
+        if created:
+            # A watermark left by the former open_threads index does not cover
+            # the new table: start with a full sync
+            self.db.execute("DELETE FROM comment_sync")
+            self.db.execute("DROP TABLE IF EXISTS open_threads")
+        self.db.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _get(self, key: str) -> str | None:
+        row = self.db.execute(
+            "SELECT value FROM comment_sync WHERE key = ?", (key,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _set(self, key: str, value: str):
+        self.db.execute(
+            "INSERT OR REPLACE INTO comment_sync (key, value) VALUES (?, ?)",
+            (key, value),
+        )
+
+    @property
+    def watermark(self) -> str | None:
+        """
+        Newest comment updatedAt (ISO 8601) already applied.
+        """
+        return self._get("watermark")
+
+    def needs_full_sync(self) -> bool:
+        last_full = self._get("last_full_sync")
+        return (
+            self.watermark is None
+            or last_full is None
+            or time.time() - float(last_full) > self.full_sync_interval
+        )
+
+    def apply(self, comments: Iterable[dict], full: bool = False) -> int:
+        """
+        Update the threads from comments.list payloads, consumed as they come.
+        A thread only takes a payload at least as new as the one it has, so the
+        listing order does not matter.
+
+        Arguments:
+            comments (Iterable[dict]): Comments changed since the watermark (every
+                comment for a full sync).
+            full (bool): `comments` is the whole workspace, threads not in it are
+                dropped.
+
+        Returns:
+            int: Number of comments read.
+
+        If reading `comments` fails, a full sync is rolled back. Incremental
+        changes are kept but the watermark stays, so the next sync reads them again.
+        """
+        count = 0
+        newest = ""
+
+        try:
+            if full:
+                self.db.execute("DELETE FROM comment_threads")
+
+            for comment in comments:
+                count += 1
+                updated_at = comment.get("updatedAt") or ""
+                newest = max(newest, updated_at)
+
+                if comment.get("parentCommentId"):
+                    continue
+
+                self.db.execute(
+                    """
+                    INSERT INTO comment_threads (id, document_id, resolved, updated_at)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT (id) DO UPDATE SET
+                        document_id = excluded.document_id,
+                        resolved = excluded.resolved,
+                        updated_at = excluded.updated_at
+                    WHERE excluded.updated_at >= comment_threads.updated_at
+                    """,
+                    (
+                        comment["id"],
+                        comment["documentId"],
+                        int(bool(comment.get("resolvedAt"))),
+                        updated_at,
+                    ),
+                )
+        except BaseException:
+            if full:
+                self.db.rollback()
+            else:
+                self.db.commit()
+            raise
+
+        if newest > (self.watermark or ""):
+            self._set("watermark", newest)
+        if full:
+            self._set("last_full_sync", str(time.time()))
+
+        self.db.commit()
+        return count
+
+    def open_documents(self) -> list[str]:
+        """
+        Ids of the documents with at least one open thread.
+        """
+        rows = self.db.execute(
+            "SELECT DISTINCT document_id FROM comment_threads WHERE resolved = 0"
+        )
+        return [row[0] for row in rows]
+
+    def close(self):
+        self.db.close()
@@ -1,52 +1,66 @@
 from datetime import datetime, timedelta, timezone
 
-from backup_logger import cleanup_logs, get_log_file, read_log_file
-from discord_notifications import send_message_to_webhook
+from backup_log_query import query_logs, summarize
+from backup_logger import cleanup_logs
+from backup_scheduler import BACKUP_SCHEDULE, CronSchedule
+from discord_notifications import flush_spool, send_message_to_webhook
 
 
 def load_last_24h():
     now = datetime.now(timezone.utc)
-    yesterday = now - timedelta(days=1)
+    return query_logs(now - timedelta(days=1), now)
 
-    file = get_log_file(yesterday)
 
-    corrupted_total = 0
+def _format_seconds(seconds: float | None) -> str:
+    return "-" if seconds is None else f"{seconds:.0f}s"
 
-    entries, corrupted = read_log_file(file)
-    corrupted_total += corrupted
 
-    # Filter strictly by time window
-    entries = [e for e in entries]
+def analyze(entries, expected: int):
+    # Slots the scheduler logged as skipped are not runs
+    missed = sum(1 for e in entries if e["status"] == "missed")
+    overlap = sum(1 for e in entries if e["status"] == "overlap")
 
-    return entries, corrupted_total
-
-
-def analyze(entries):
-    EXPECTED = 22
-
-    total = len(entries)
+    total = len(entries) - missed - overlap
     success = sum(1 for e in entries if e["status"] == "success")
     failures = total - success
-    missing = EXPECTED - total
+    # Slots with no trace at all (daemon/cron down, crash before logging)
+    missing = expected - total - missed - overlap
 
     return {
         "total": total,
         "success": success,
         "failures": failures,
+        "missed": missed,
+        "overlap": overlap,
         "missing": max(0, missing),
     }
 
 
 def daily_report():
+    # Alerts that could not be delivered when they happened
+    flush_spool()
+
     entries, corrupted = load_last_24h()
-    stats = analyze(entries)
+    now = datetime.now(timezone.utc)
+    expected = CronSchedule(BACKUP_SCHEDULE).count_between(now - timedelta(days=1), now)
+    stats = analyze(entries, expected)
+    day = summarize(entries)
+
+    week = summarize(query_logs(now - timedelta(days=7), now)[0])
+    week_rate = "-" if week["success_rate"] is None else f"{week['success_rate']:.1%}"
 
     desc = (
         f"**Total:** {stats['total']}\n"
         f"✅ **Exito:** {stats['success']}\n"
         f"❌ **Fallos:** {stats['failures']}\n"
+        f"⏭️ **Perdidas (fuera de tiempo):** {stats['missed']}\n"
+        f"🔁 **Omitidas (otra en curso):** {stats['overlap']}\n"
         f"⚠️ **Faltan:** {stats['missing']}\n"
-        f"🧨 **Lineas corruptas (del log):** {corrupted}"
+        f"🧨 **Lineas corruptas (del log):** {corrupted}\n"
+        f"⏱️ **Duracion p50/p95/max:** {_format_seconds(day['duration_p50'])} / "
+        f"{_format_seconds(day['duration_p95'])} / "
+        f"{_format_seconds(day['duration_max'])}\n"
+        f"📈 **Exito 7 dias:** {week_rate} ({week['total']} ejecuciones)"
     )
 
     send_message_to_webhook(
@@ -1,36 +1,421 @@
+import atexit
 import json
 import os
+import threading
+import time
 import traceback
+import uuid
+from datetime import datetime, timezone
 from functools import wraps
+from pathlib import Path
+from queue import Empty, Queue
+from typing import Iterable, Iterator
 
 import requests
 from dotenv import load_dotenv
 
+from file_lock import FileLock
+from rate_limiter import RateLimiter, get_limiter, send_request
+
 load_dotenv()
 
+# Webhook pacing: sustained messages per second and burst (Discord allows about
+# 30 messages a minute per channel; its rate limit headers take over from there)
+DISCORD_WEBHOOK_RATE = float(os.getenv("DISCORD_WEBHOOK_RATE", "0.5"))
+DISCORD_WEBHOOK_BURST = int(os.getenv("DISCORD_WEBHOOK_BURST", "5"))
+# Seconds per webhook request, and attempts after the first one
+DISCORD_WEBHOOK_TIMEOUT = float(os.getenv("DISCORD_WEBHOOK_TIMEOUT", "10"))
+DISCORD_WEBHOOK_RETRIES = int(os.getenv("DISCORD_WEBHOOK_RETRIES", "3"))
+# Repeats of an alert (same title) within this many seconds are sent as one summary
+DISCORD_COALESCE_WINDOW = float(os.getenv("DISCORD_COALESCE_WINDOW", "300"))
+# Longest a process waits at exit for queued alerts, the rest is spooled
+DISCORD_SHUTDOWN_TIMEOUT = float(os.getenv("DISCORD_SHUTDOWN_TIMEOUT", "30"))
+# Undelivered messages, retried on the next run and by daily_report
+NOTIFICATION_SPOOL = Path(
+    os.getenv("DISCORD_NOTIFICATION_SPOOL", "./logs/notifications.spool")
+)
+# Held while flushing the spool
+_SPOOL_FLUSH_LOCK = NOTIFICATION_SPOOL.with_name(f"{NOTIFICATION_SPOOL.name}.lock")
+
+# Discord webhook limits (characters), a payload over any of them gets a 400
+MAX_CONTENT = 2000
+MAX_EMBEDS = 10
+MAX_TITLE = 256
+MAX_DESCRIPTION = 4096
+MAX_EMBED_TOTAL = 6000
+
+_spool_lock = threading.Lock()
+_STOP = object()
+
+
+def discord_limiter(url: str) -> RateLimiter:
+    return get_limiter(url, DISCORD_WEBHOOK_RATE, DISCORD_WEBHOOK_BURST)
+
+
+def _split_long(lines: Iterable[str], limit: int) -> Iterator[str]:
+    for line in lines:
+        while len(line) > limit:
+            yield line[:limit]
+            line = line[limit:]
+        yield line
+
+
+def plan_messages(
+    lines: Iterable[str] | str,
+    embed_title: str,
+    content: str = "",
+    embed_color=0x00FF00,
+) -> list[dict]:
+    """
+    Pack lines, in order, into the fewest webhook payloads within Discord's limits
+    (MAX_EMBEDS per message, MAX_DESCRIPTION per embed, MAX_EMBED_TOTAL for the
+    titles and descriptions of a message). Single pass: each embed and message
+    takes as many lines as fit, which is optimal when the order is kept. Lines
+    longer than a description are split.
+
+    Arguments:
+        lines (Iterable[str] | str): Description lines, or one (multi-line) text.
+        embed_title (str): Title of every embed.
+        content (str): Message text above the embeds (mentions), on every message.
+        embed_color: Embed color.
+
+    Returns:
+        list[dict]: Payloads for send_messages().
+    """
+    if isinstance(lines, str):
+        lines = lines.split("\n")
+
+    title = embed_title[:MAX_TITLE]
+    content = content[:MAX_CONTENT]
+
+    payloads = []
+    embeds, total = [], 0  # current message and its embed characters
+    parts, length = None, 0  # lines of the current embed
+
+    def close_embed():
+        embeds.append(
+            {"title": title, "description": "\n".join(parts), "color": embed_color}
+        )
+
+    for line in _split_long(lines, MAX_DESCRIPTION):
+        if parts is not None:
+            extra = len(line) + 1  # newline
+            if length + extra <= MAX_DESCRIPTION and total + extra <= MAX_EMBED_TOTAL:
+                parts.append(line)
+                length += extra
+                total += extra
+                continue
+            close_embed()
+
+        cost = len(title) + len(line)
+        if len(embeds) == MAX_EMBEDS or total + cost > MAX_EMBED_TOTAL:
+            payloads.append({"content": content, "embeds": embeds})
+            embeds, total = [], 0
+
+        parts, length = [line], len(line)
+        total += cost
+
+    if parts is not None:
+        close_embed()
+    if embeds or not payloads:
+        payloads.append({"content": content, "embeds": embeds})
+
+    return payloads
+
+
+def validate_payload(payload: dict):
+    """
+    Raises:
+        ValueError: The payload would be rejected by Discord (400).
+    """
+    embeds = payload.get("embeds", [])
+    if len(payload.get("content") or "") > MAX_CONTENT:
+        raise ValueError(f"Message content longer than {MAX_CONTENT} characters")
+    if len(embeds) > MAX_EMBEDS:
+        raise ValueError(f"More than {MAX_EMBEDS} embeds in one message")
+    if not embeds and not payload.get("content"):
+        raise ValueError("Message without content or embeds")
+
+    total = 0
+    for embed in embeds:
+        title, description = embed.get("title") or "", embed.get("description") or ""
+        if len(title) > MAX_TITLE:
+            raise ValueError(f"Embed title longer than {MAX_TITLE} characters")
+        if len(description) > MAX_DESCRIPTION:
+            raise ValueError(
+                f"Embed description longer than {MAX_DESCRIPTION} characters"
+            )
+        total += len(title) + len(description)
+
+    if total > MAX_EMBED_TOTAL:
+        raise ValueError(f"Embeds longer than {MAX_EMBED_TOTAL} characters in total")
+
+
+def send_messages(
+    url: str, payloads: list[dict], session: requests.Session | None = None
+) -> int:
+    """
+    Validate and send planned payloads in order, through the webhook's rate
+    limiter. Payloads that cannot be delivered are spooled.
+
+    Returns:
+        int: Number of payloads delivered.
+    """
+    for payload in payloads:
+        validate_payload(payload)
+
+    delivered = 0
+    for payload in payloads:
+        if _deliver(url, payload, session=session):
+            delivered += 1
+        else:
+            _spool(url, payload)
+    return delivered
+
+
+def _deliver(url: str, payload: dict, session: requests.Session | None = None) -> bool:
+    try:
+        response = send_request(
+            "POST",
+            url,
+            discord_limiter(url),
+            session=session,
+            max_retries=DISCORD_WEBHOOK_RETRIES,
+            headers={"Content-Type": "application/json"},
+            data=json.dumps(payload),
+            files=[],
+            timeout=DISCORD_WEBHOOK_TIMEOUT,
+        )
+        response.raise_for_status()
+        return True
+    except requests.exceptions.RequestException as e:
+        print(f"    Webhook delivery failed: {e}")
+        return False
+
+
+def _spool(url: str, payload: dict):
+    record = {
+        "url": url,
+        "payload": payload,
+        "spooled_at": datetime.now(timezone.utc).isoformat(),
+    }
+    NOTIFICATION_SPOOL.parent.mkdir(parents=True, exist_ok=True)
+    with _spool_lock, open(NOTIFICATION_SPOOL, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+
+def _spool_claims() -> list[Path]:
+    """
+    Claim files left by flushes that did not finish (process killed), oldest first.
+    """
+    claims = [
+        path
+        for path in NOTIFICATION_SPOOL.parent.glob(f"{NOTIFICATION_SPOOL.name}.*")
+        if path != _SPOOL_FLUSH_LOCK
+    ]
+
+    def age(path: Path) -> float:
+        try:
+            return path.stat().st_mtime
+        except FileNotFoundError:
+            # Just finished by a flush we are not synchronized with yet
+            return 0.0
+
+    return sorted(claims, key=age)
+
+
+def flush_spool() -> int:
+    """
+    Retry the spooled messages, oldest first. Stops at the first failure and keeps
+    the remaining messages for the next attempt. Only one flush runs at a time
+    (across processes and threads); messages of a flush that was interrupted are
+    picked up by the next one, so a message may be delivered twice.
+
+    Returns:
+        int: Number of messages delivered.
+    """
+    if not NOTIFICATION_SPOOL.exists() and not _spool_claims():
+        return 0
+
+    lock = FileLock(_SPOOL_FLUSH_LOCK)
+    if not lock.acquire():
+        # Another flush is running, it delivers what is spooled now
+        return 0
+
+    try:
+        # Under the lock, claims left over are from flushes that died
+        claims = _spool_claims()
+
+        # Claim the spool, messages spooled meanwhile go to a new file
+        claimed = NOTIFICATION_SPOOL.with_name(
+            f"{NOTIFICATION_SPOOL.name}.{os.getpid()}-{uuid.uuid4().hex}"
+        )
+        try:
+            os.replace(NOTIFICATION_SPOOL, claimed)
+            claims.append(claimed)
+        except FileNotFoundError:
+            pass
+
+        records = []
+        for claim in claims:
+            for line in claim.read_text(encoding="utf-8").splitlines():
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+
+        delivered = 0
+        for index, record in enumerate(records):
+            if not _deliver(record["url"], record["payload"]):
+                for pending in records[index:]:
+                    _spool(pending["url"], pending["payload"])
+                break
+            delivered += 1
+
+        for claim in claims:
+            claim.unlink()
+    finally:
+        lock.release()
+
+    if delivered:
+        print(f"Delivered {delivered} spooled notification(s)")
+    return delivered
+
+
+class NotificationDispatcher:
+    """
+    Deliver webhook messages on a background thread, so a slow or unreachable
+    webhook never holds up the caller. The first message with a given title is
+    sent right away; repeats within `window` seconds are counted and sent as one
+    summary when the window ends. Messages that cannot be delivered are spooled.
+    """
+
+    def __init__(self, window: float | None = None):
+        self.window = DISCORD_COALESCE_WINDOW if window is None else window
+        self.queue = Queue()
+        # (url, content, title) -> {"url", "payloads", "count", "until"}
+        self.repeats = {}
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def submit(self, url: str, payloads: list[dict]):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+        self.queue.put((url, payloads, time.monotonic()))
+
+    def _run(self):
+        # Whatever a previous run could not deliver goes first
+        flush_spool()
+
+        while True:
+            until = min((r["until"] for r in self.repeats.values()), default=None)
+            timeout = None if until is None else max(0.0, until - time.monotonic())
+            try:
+                item = self.queue.get(timeout=timeout)
+            except Empty:
+                item = None
+
+            if item is _STOP:
+                self._send_repeats(force=True)
+                return
+            if item is not None:
+                self._handle(*item)
+                if not self.queue.empty():
+                    # Queued repeats first, they may belong to an expiring window
+                    continue
+            self._send_repeats()
+
+    def _handle(self, url: str, payloads: list[dict], submitted: float):
+        first = payloads[0]
+        key = (url, first["content"], first["embeds"][0]["title"])
+
+        # Compared by submit time: a slow delivery must not shorten the window
+        repeat = self.repeats.get(key)
+        if repeat is not None and submitted < repeat["until"]:
+            repeat["count"] += 1
+            repeat["payloads"] = payloads
+            return
+
+        self.repeats[key] = {
+            "url": url,
+            "payloads": payloads,
+            "count": 0,
+            "until": submitted + self.window,
+        }
+        send_messages(url, payloads)
+
+    def _send_repeats(self, force: bool = False):
+        now = time.monotonic()
+        for key, repeat in list(self.repeats.items()):
+            if not force and now < repeat["until"]:
+                continue
+
+            del self.repeats[key]
+            if repeat["count"]:
+                payloads = json.loads(json.dumps(repeat["payloads"]))
+                embed = payloads[0]["embeds"][0]
+                suffix = f" (repeated {repeat['count']}x)"
+                embed["title"] = embed["title"][: MAX_TITLE - len(suffix)] + suffix
+                send_messages(repeat["url"], payloads)
+
+    def close(self, timeout: float | None = None):
+        """
+        Send what is queued, waiting at most `timeout` seconds; anything left after
+        that is spooled.
+        """
+        if self.thread is None:
+            return
+
+        self.queue.put(_STOP)
+        self.thread.join(DISCORD_SHUTDOWN_TIMEOUT if timeout is None else timeout)
+        if not self.thread.is_alive():
+            return
+
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except Empty:
+                break
+            if item is not _STOP:
+                url, payloads, _ = item
+                for payload in payloads:
+                    _spool(url, payload)
+
+
+_dispatcher = NotificationDispatcher()
+atexit.register(_dispatcher.close)
+
+
+def notify(content, embed_title, embed_description="", embed_color=0x00FF00):
+    """
+    Queue an alert for DISCORD_BACKUP_ALERTS_URL without waiting for it.
+    """
+    url = os.getenv("DISCORD_BACKUP_ALERTS_URL")
+    if not url:
+        print("    DISCORD_BACKUP_ALERTS_URL is not set, alert not sent")
+        return
+
+    _dispatcher.submit(
+        url, plan_messages(embed_description, embed_title, content, embed_color)
+    )
+
 
 def send_message_to_webhook(
     content, embed_title, embed_description="", embed_color=0x00FF00
 ):
-    request_headers = {"Content-Type": "application/json"}
-
+    """
+    Send a message to DISCORD_BACKUP_ALERTS_URL and wait for it; it is spooled if
+    it cannot be delivered.
+    """
     url = os.getenv("DISCORD_BACKUP_ALERTS_URL")
-    payload = {
-        "content": content,
-        "embeds": [
-            {
-                "title": embed_title,
-                "description": embed_description,
-                "color": embed_color,
-            }
-        ],
-    }
+    if not url:
+        print("    DISCORD_BACKUP_ALERTS_URL is not set, message not sent")
+        return
 
-    requests.post(
-        url,
-        headers=request_headers,
-        data=json.dumps(payload),
-        files=[],
+    send_messages(
+        url, plan_messages(embed_description, embed_title, content, embed_color)
     )
 
 
@@ -57,7 +442,7 @@ def notify_on_failure(func):
                 except Exception as cleanup_error:
                     context += f"\nCleanup failed: {cleanup_error}\n"
 
-            send_message_to_webhook(
+            notify(
                 content="🚨 Backup system failure",
                 embed_title=str(e),
                 embed_description=f"{context}\n```{error_trace[:1500]}```",
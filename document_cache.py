@@ -0,0 +1,125 @@
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DOCUMENT_CACHE_PATH = Path(
+    os.getenv("OUTLINE_CACHE_PATH", "./cache/outline_documents.sqlite3")
+)
+# Entries older than this are fetched again even if nothing shows a change
+DOCUMENT_CACHE_TTL = int(os.getenv("OUTLINE_CACHE_TTL", str(7 * 24 * 3600)))
+# Least recently used entries beyond this are evicted
+DOCUMENT_CACHE_MAX_ENTRIES = int(os.getenv("OUTLINE_CACHE_MAX_ENTRIES", "5000"))
+
+
+class DocumentCache:
+    """
+    On-disk (SQLite) cache of document metadata: id -> title, url, updatedAt.
+
+    Entry: {"id", "title", "url", "updated_at"}
+    `updated_at` is the newest updatedAt seen for the document (ISO 8601), an
+    entry is stale once a comment or document payload shows a newer one.
+    """
+
+    def __init__(
+        self,
+        path: Path | str | None = None,
+        ttl: int | None = None,
+        max_entries: int | None = None,
+    ):
+        self.path = Path(path or DOCUMENT_CACHE_PATH)
+        self.ttl = DOCUMENT_CACHE_TTL if ttl is None else ttl
+        self.max_entries = max_entries or DOCUMENT_CACHE_MAX_ENTRIES
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(self.path)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS documents (
+                id TEXT PRIMARY KEY,
+                title TEXT NOT NULL,
+                url TEXT NOT NULL,
+                updated_at TEXT,
+                fetched_at REAL NOT NULL,
+                used_at REAL NOT NULL
+            )
+            """)
+        self.db.execute(
+            "CREATE INDEX IF NOT EXISTS documents_used ON documents (used_at)"
+        )
+        self.db.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get_many(self, ids: list[str]) -> dict[str, dict]:
+        """
+        Cached entries for the given ids, skipping expired ones. Marks the returned
+        entries as used (LRU).
+        """
+        now = time.time()
+        self.db.execute("DELETE FROM documents WHERE fetched_at < ?", (now - self.ttl,))
+
+        entries = {}
+        # Stay under SQLite's bound parameter limit
+        for start in range(0, len(ids), 500):
+            batch = ids[start : start + 500]
+            marks = ",".join("?" * len(batch))
+            rows = self.db.execute(
+                f"SELECT id, title, url, updated_at FROM documents WHERE id IN ({marks})",
+                batch,
+            )
+            for doc_id, title, url, updated_at in rows:
+                entries[doc_id] = {
+                    "id": doc_id,
+                    "title": title,
+                    "url": url,
+                    "updated_at": updated_at,
+                }
+
+        self.db.executemany(
+            "UPDATE documents SET used_at = ? WHERE id = ?",
+            [(now, doc_id) for doc_id in entries],
+        )
+        self.db.commit()
+        return entries
+
+    def put_many(self, entries: list[dict]):
+        now = time.time()
+        self.db.executemany(
+            """
+            INSERT OR REPLACE INTO documents
+                (id, title, url, updated_at, fetched_at, used_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            [
+                (e["id"], e["title"], e["url"], e["updated_at"], now, now)
+                for e in entries
+            ],
+        )
+        self.db.execute(
+            """
+            DELETE FROM documents WHERE id NOT IN (
+                SELECT id FROM documents ORDER BY used_at DESC LIMIT ?
+            )
+            """,
+            (self.max_entries,),
+        )
+        self.db.commit()
+
+    @staticmethod
+    def is_stale(entry: dict, updated_at: str | None) -> bool:
+        """
+        Whether `updated_at` (from a comment or document payload) is newer than
+        what the entry was fetched with.
+        """
+        return bool(updated_at) and updated_at > (entry["updated_at"] or "")
+
+    def close(self):
+        self.db.close()
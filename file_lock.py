@@ -0,0 +1,54 @@
+import os
+from pathlib import Path
+
+
+class FileLock:
+    """
+    Non-blocking exclusive lock on a file (flock, msvcrt on Windows), released on
+    close or when the process dies. The holder's pid is written into the file.
+    """
+
+    def __init__(self, path: Path | str):
+        self.path = Path(path)
+        self.file = None
+
+    def acquire(self) -> bool:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.file = open(self.path, "a+")
+        try:
+            _lock(self.file)
+        except OSError:
+            self.file.close()
+            self.file = None
+            return False
+
+        self.file.seek(0)
+        self.file.truncate()
+        self.file.write(str(os.getpid()))
+        self.file.flush()
+        return True
+
+    def holder(self) -> str:
+        try:
+            return self.path.read_text().strip() or "unknown"
+        except OSError:
+            return "unknown"
+
+    def release(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+try:
+    import fcntl
+
+    def _lock(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+except ImportError:
+    import msvcrt
+
+    def _lock(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
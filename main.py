@@ -1,46 +1,73 @@
 import json
 import os
-import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Iterator
 from urllib.parse import urljoin
 
 import requests
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
 
-load_dotenv()
-
-
-def chunk_embeds_by_total_size(embed_descriptions: list[str], max_total=5000):
-    batches = []
-    current_batch = []
-    current_total = 0
-
-    for desc in embed_descriptions:
-        desc_len = len(desc)
-
-        # if adding this embed exceeds total limit → new batch
-        if current_total + desc_len > max_total:
-            batches.append(current_batch)
-            current_batch = []
-            current_total = 0
-
-        current_batch.append(desc)
-        current_total += desc_len
+from comment_index import CommentIndex
+from discord_notifications import plan_messages, send_messages
+from document_cache import DocumentCache
+from rate_limiter import get_limiter, send_request
 
-    if current_batch:
-        batches.append(current_batch)
+load_dotenv()
 
-    return batches
+# Parallel documents.info lookups, also the size of the keep-alive connection pool
+OUTLINE_API_CONCURRENCY = int(os.getenv("OUTLINE_API_CONCURRENCY", "8"))
+# Seconds to wait for the Outline API (connect and read)
+OUTLINE_API_TIMEOUT = float(os.getenv("OUTLINE_API_TIMEOUT", "30"))
+# Outline API pacing shared by every request: sustained requests per second and
+# burst, adapted to the RateLimit-* headers and 429 responses
+OUTLINE_API_RATE = float(os.getenv("OUTLINE_API_RATE", "10"))
+OUTLINE_API_BURST = int(os.getenv("OUTLINE_API_BURST", "10"))
+# Items per page for list endpoints (Outline's maximum)
+PAGE_SIZE = 100
 
 
 class OutlineAPIClient:
-    def __init__(self):
-        self.base_url = os.getenv("OUTLINE_URL")
+    def __init__(
+        self,
+        base_url: str | None = None,
+        api_key: str | None = None,
+        concurrency: int | None = None,
+        cache: DocumentCache | None = None,
+        comment_index: CommentIndex | None = None,
+    ):
+        self.base_url = base_url or os.getenv("OUTLINE_URL")
         self.disord_notification_url = os.getenv("DISCORD_NOTIFICATION_URL")
-        self.api_key = os.getenv("OUTLINE_API_KEY")
+        self.api_key = api_key or os.getenv("OUTLINE_API_KEY")
         self.docs_urls = None
         self.target_notification_id = os.getenv("TARGET_NOTIFICATION_ID")
         self.formatted_urls = dict()
+        # Newest comment updatedAt per document id, seen while listing comments
+        self.doc_updated_at = dict()
+        self.cache = cache or DocumentCache()
+        self.comment_index = comment_index or CommentIndex()
+
+        # One keep-alive session for every call instead of a handshake per request
+        self.concurrency = concurrency or OUTLINE_API_CONCURRENCY
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=max(self.concurrency, 1))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.limiter = get_limiter(
+            self.base_url or "", OUTLINE_API_RATE, OUTLINE_API_BURST
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.session.close()
+        self.cache.close()
+        self.comment_index.close()
 
     def _generate_headers(self):
         headers = {
@@ -63,7 +90,15 @@ class OutlineAPIClient:
         body = self._generate_body(data)
 
         try:
-            response = requests.post(url, headers=headers, data=body)
+            response = send_request(
+                "POST",
+                url,
+                self.limiter,
+                session=self.session,
+                headers=headers,
+                data=body,
+                timeout=OUTLINE_API_TIMEOUT,
+            )
             response.raise_for_status()
             print(f"    URL responded with: {response.status_code}")
             return response.json()
@@ -76,66 +111,171 @@ class OutlineAPIClient:
         headers = self._generate_headers()
 
         try:
-            response = requests.get(url, headers=headers, params=params)
+            response = send_request(
+                "GET",
+                url,
+                self.limiter,
+                session=self.session,
+                headers=headers,
+                params=params,
+                timeout=OUTLINE_API_TIMEOUT,
+            )
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
             print(f"Request failed: {e}")
             return None
 
-    def fetch_resolved_comment_doc_ids(self):
-        """Not finished"""
-        path = "/api/comments.list"
-
-        while path:
-            result = self.post(endpoint=path)
-
-            comments = result.get("data", [])
-            for comment in comments:
-                if comment.get("resolvedAt"):  # Check if resolvedAt is not null
-                    print(f"{self.base_url}/doc/{comment.get('documentId')}")
+    def _paginate(self, path: str, data: dict | None = None) -> Iterator[dict]:
+        """
+        Items of a paginated endpoint, following `nextPath`. The next page is
+        requested in the background while the current one is consumed, so no more
+        than two pages are held at a time.
+
+        Raises:
+            RuntimeError: A page request failed (after retries).
+        """
+        data = {"limit": PAGE_SIZE, **(data or {})}
+
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            page = pool.submit(self.post, path, data)
+            while page is not None:
+                result = page.result()
+                if result is None:
+                    raise RuntimeError(f"Request failed: {path}")
+
+                items = result.get("data") or []
+                path = result.get("pagination", {}).get("nextPath")
+                page = pool.submit(self.post, path, data) if items and path else None
+
+                yield from items
+
+    def iter_comments(self, **filters) -> Iterator[dict]:
+        """
+        Comments of the workspace, filtered / sorted by comments.list parameters
+        (documentId, collectionId, sort, direction).
+        """
+        return self._paginate("/api/comments.list", filters)
+
+    def iter_documents(self, **filters) -> Iterator[dict]:
+        """
+        Documents, filtered / sorted by documents.list parameters (collectionId,
+        parentDocumentId, sort, direction).
+        """
+        return self._paginate("/api/documents.list", filters)
+
+    def iter_collections(self, **filters) -> Iterator[dict]:
+        return self._paginate("/api/collections.list", filters)
 
-            path = result.get("pagination", {}).get("nextPath")
+    def fetch_resolved_comment_doc_ids(self):
+        docs_urls = {
+            f"{self.base_url}/doc/{comment.get('documentId')}"
+            for comment in self.iter_comments()
+            if comment.get("resolvedAt")
+        }
+        for doc_url in sorted(docs_urls):
+            print(doc_url)
 
-            time.sleep(0.1)
+        return sorted(docs_urls)
 
     def fetch_document_info(self, document_id: str):
         path = "/api/documents.info"
         result = self.post(endpoint=path, data={"id": document_id})
         return result
 
-    def fetch_unresolved_comment_doc_ids(self):
-        path = "/api/comments.list"
-
-        docs_urls = []
+    def fetch_documents_info(self, document_ids: list[str]) -> dict[str, dict | None]:
+        """
+        documents.info for many documents at once, `concurrency` requests in flight
+        over the pooled session.
 
-        while path:
-            result = self.post(endpoint=path)
+        Returns:
+            dict[str, dict | None]: Document id -> response, None if the call failed.
+        """
+        if not document_ids:
+            return {}
 
-            comments = result.get("data", []) if result else None
-            if not comments:
-                break
+        workers = max(1, min(self.concurrency, len(document_ids)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = pool.map(self.fetch_document_info, document_ids)
+            return dict(zip(document_ids, results))
 
-            for comment in comments:
-                if not comment.get("resolvedAt") and not comment.get("parentCommentId"):
-                    docs_urls.append(f"{self.base_url}/doc/{comment.get('documentId')}")
-
-            path = result.get("pagination", {}).get("nextPath")
-
-            time.sleep(0.1)
+    def fetch_unresolved_comment_doc_ids(self):
+        """
+        Sync the open thread index with the comments changed since the last run
+        (all comments on the first run and every OUTLINE_COMMENTS_FULL_SYNC
+        seconds) and return the URLs of the documents with open threads.
+        """
+        full = self.comment_index.needs_full_sync()
+        watermark = None if full else self.comment_index.watermark
+
+        def changed_comments():
+            # Newest first, so the listing stops at the first comment already applied
+            for comment in self.iter_comments(sort="updatedAt", direction="DESC"):
+                updated_at = comment.get("updatedAt") or ""
+                if watermark and updated_at < watermark:
+                    return
+
+                doc_id = comment.get("documentId")
+                if updated_at > self.doc_updated_at.get(doc_id, ""):
+                    self.doc_updated_at[doc_id] = updated_at
+                yield comment
 
-        self.docs_urls = list(set(docs_urls))
+        try:
+            count = self.comment_index.apply(changed_comments(), full=full)
+            print(f"Comments: {count} {'listed' if full else 'changed'}")
+        except RuntimeError as e:
+            print(f"    Comment sync incomplete, continuing from the last one: {e}")
+
+        self.docs_urls = [
+            f"{self.base_url}/doc/{doc_id}"
+            for doc_id in self.comment_index.open_documents()
+        ]
         return self.docs_urls
 
     def map_id_title(self):
         title_url_map = dict()
-        for doc_url in self.docs_urls:
-            doc_url: str
-            doc_id = doc_url.rsplit("/", maxsplit=1)[-1]
+        doc_ids = {
+            doc_url.rsplit("/", maxsplit=1)[-1]: doc_url for doc_url in self.docs_urls
+        }
+
+        # Only documents that are not cached, expired, or show newer activity
+        cached = self.cache.get_many(list(doc_ids))
+        stale = [
+            doc_id
+            for doc_id in doc_ids
+            if doc_id not in cached
+            or DocumentCache.is_stale(cached[doc_id], self.doc_updated_at.get(doc_id))
+        ]
+        print(
+            f"Document titles: {len(doc_ids) - len(stale)} cached, {len(stale)} to fetch"
+        )
+
+        fetched = []
+        for doc_id, document_data in self.fetch_documents_info(stale).items():
+            if not document_data:
+                print(f"    Skipping document without info: {doc_id}")
+                cached.pop(doc_id, None)
+                continue
 
-            document_data = self.fetch_document_info(document_id=doc_id)
-            document_title = document_data.get("data", {}).get("title", {})
-            title_url_map.update({document_title: f"[{document_title}]({doc_url})"})
+            data = document_data.get("data", {})
+            updated_at = max(
+                data.get("updatedAt") or "", self.doc_updated_at.get(doc_id, "")
+            )
+            entry = {
+                "id": doc_id,
+                "title": data.get("title", ""),
+                "url": doc_ids[doc_id],
+                "updated_at": updated_at or None,
+            }
+            cached[doc_id] = entry
+            fetched.append(entry)
+        self.cache.put_many(fetched)
+
+        for entry in cached.values():
+            document_title = entry["title"]
+            title_url_map.update(
+                {document_title: f"[{document_title}]({entry['url']})"}
+            )
 
         self.formatted_urls = dict(sorted(title_url_map.items()))
 
@@ -148,87 +288,33 @@ class OutlineAPIClient:
         except Exception as e:
             print(f"Failed to save to TXT: {e}")
 
-    def get_webhook_data(self):
-        headers = {"Content-Type": "application/json"}
-        files = {}
-
-        webhook_data = {
-            "url": self.disord_notification_url,
-            "files": files,
-            "headers": headers,
-        }
-        return webhook_data
-
     def send_message_to_webhook(
-        self, content, embed_title, embed_descriptions=None, embed_color=0x00FF00
+        self, content, embed_title, lines=None, embed_color=0x00FF00
     ):
-
-        # Ensure embed_descriptions is always a list
-        if isinstance(embed_descriptions, str):
-            embed_descriptions = [embed_descriptions]
-        elif not embed_descriptions:
-            embed_descriptions = [""]
-
-        # Build the list of embeds
-        embeds = []
-        for desc in embed_descriptions:
-            embeds.append(
-                {"title": embed_title, "description": desc, "color": embed_color}
-            )
-
-        webhook_data = self.get_webhook_data()
-        payload = {"content": content, "embeds": embeds}
-
-        response = requests.post(
-            webhook_data["url"],
-            headers=webhook_data["headers"],
-            json=payload,
-            files=webhook_data["files"],
+        """
+        Send lines to DISCORD_NOTIFICATION_URL packed into as few messages as
+        Discord's limits allow.
+        """
+        payloads = plan_messages(lines or [""], embed_title, content, embed_color)
+        delivered = send_messages(
+            self.disord_notification_url, payloads, session=self.session
         )
+        print(f"Webhook messages delivered: {delivered}/{len(payloads)}")
 
-        print(f"Webhook status code: {response.status_code}")
-        try:
-            response.raise_for_status()
-        except requests.exceptions.RequestException as e:
-            print(f"    Webhook request failed: {e}")
-            print(f"    Response content: {response.text}")
-
-    def format_doc_ids_as_markdown(self, max_length=2048):
-        chunks = []
-        current_chunk = ""
-        current_length = 0
-
-        for idx, (_, doc_id) in enumerate(self.formatted_urls.items(), start=1):
-            line = f"{idx}. {doc_id}\n"
-            # if adding this line would exceed the limit, start a new chunk
-            if current_length + len(line) > max_length:
-                chunks.append(current_chunk.strip())
-                current_chunk = ""
-                current_length = 0
-
-            current_chunk += line
-            current_length += len(line)
-
-        # append the last chunk if not empty
-        if current_chunk.strip():
-            chunks.append(current_chunk.strip())
-
-        return chunks
+    def format_doc_ids_as_markdown(self) -> list[str]:
+        return [
+            f"{idx}. {doc_link}"
+            for idx, doc_link in enumerate(self.formatted_urls.values(), start=1)
+        ]
 
 
 if __name__ == "__main__":
-    api_client = OutlineAPIClient()
-
-    api_client.fetch_unresolved_comment_doc_ids()
-    if api_client.docs_urls:
-        api_client.map_id_title()
-        embeds_descriptions = api_client.format_doc_ids_as_markdown()
-        batches = chunk_embeds_by_total_size(embeds_descriptions)
-
-        for batch in batches:
+    with OutlineAPIClient() as api_client:
+        api_client.fetch_unresolved_comment_doc_ids()
+        if api_client.docs_urls:
+            api_client.map_id_title()
             api_client.send_message_to_webhook(
                 f"<@&{api_client.target_notification_id}>",
                 "**Documents with unresolved comments**",
-                batch,
+                api_client.format_doc_ids_as_markdown(),
             )
-            time.sleep(1)
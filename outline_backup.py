@@ -1,19 +1,44 @@
+import json
 import os
 import platform
+import posixpath
 import shutil
 import stat
 import subprocess
 import tarfile
+from contextlib import ExitStack, contextmanager
 from datetime import datetime
 from pathlib import Path
-from tempfile import TemporaryDirectory
+from tempfile import TemporaryDirectory, TemporaryFile
+from typing import BinaryIO, Callable
 
 from dotenv import load_dotenv
 
+from backup_chunks import (
+    MANIFEST_VERSION,
+    ChunkReader,
+    ChunkWriter,
+    entry_to_member,
+    member_to_entry,
+    read_manifest,
+    write_manifest,
+)
+from backup_codecs import (
+    CHECKSUM_SUFFIX,
+    get_codec,
+    open_archive_reader,
+    open_archive_writer,
+)
+from backup_metrics import stage, tree_size
+from backup_profile import blocked, trace
 from discord_notifications import notify_on_failure
+from seekable_archive import SeekableArchive
 
 load_dotenv()
 
+# State of the last mirror sync (see _sync_mirror), stored in the mirror
+MIRROR_STATE_NAME = ".mirror-state.json"
+
 
 class OutlineBackup:
     def __init__(
@@ -21,6 +46,10 @@ class OutlineBackup:
         outline_volume: str,
         restore_archive_path: Path | str | None = None,
         backup_root: Path | str = Path("./backups"),
+        streaming: bool = False,
+        codec: str | None = None,
+        db_jobs: int | None = None,
+        mirror: bool = False,
     ):
         self.outline_volume = outline_volume
         self.backup_root = Path(backup_root).resolve()
@@ -29,11 +58,34 @@ class OutlineBackup:
         self.SQL_USER = os.getenv("SQL_USER")
         self.SQL_DBNAME = os.getenv("SQL_DBNAME")
 
+        # Archive compression (gzip | pigz | zstd | none), defaults to BACKUP_CODEC
+        self.codec = get_codec(codec)
+
         self.work_dir = self.backup_root / f"{outline_volume}_{self.timestamp}"
         self.archive_path = (
-            self.backup_root / f"{outline_volume}_{self.timestamp}.tar.gz"
+            self.backup_root / f"{outline_volume}_{self.timestamp}{self.codec.suffix}"
         )
 
+        # More than one job switches pg_dump/pg_restore to parallel directory format
+        self.db_jobs = db_jobs or int(os.getenv("PG_DUMP_JOBS", "1"))
+        self.container_dump_dir = f"/tmp/{outline_volume}_db_{self.timestamp}"
+
+        # Stream the dump and volume straight into the archive (no work_dir copy)
+        self.streaming = streaming
+
+        # Archive media from a persistent, incrementally synced copy of the volume
+        if mirror and streaming:
+            raise ValueError("Mirror backups are not supported in streaming mode")
+        self.mirror = mirror
+        self.mirror_dir = (
+            Path(
+                os.getenv("BACKUP_MIRROR_DIR") or self.backup_root / "mirror"
+            ).resolve()
+            / outline_volume
+        )
+        # Kept inside the mirror, so it goes away with it
+        self.mirror_state_path = self.mirror_dir / MIRROR_STATE_NAME
+
         # Restore variable
         self.restore_archive_path = restore_archive_path
 
@@ -46,47 +98,278 @@ class OutlineBackup:
         if self.restore_archive_path is not None:
             archive_path = Path(self.restore_archive_path)
             archive_path.unlink(missing_ok=True)
+        else:
+            # Partially written archive from a failed backup run
+            self.archive_path.unlink(missing_ok=True)
+            Path(f"{self.archive_path}{CHECKSUM_SUFFIX}").unlink(missing_ok=True)
 
-    def _run(self, cmd: list[str], **kwargs):
+    def _command(self, cmd: list[str]) -> list[str]:
         if platform.system() != "Windows":
             cmd = ["sudo"] + cmd
+        return cmd
 
-        result = subprocess.run(cmd, capture_output=True, text=True, **kwargs)
+    def _run(self, cmd: list[str], **kwargs):
+        cmd = self._command(cmd)
+
+        with blocked(cmd[1] if cmd[0] == "sudo" else cmd[0], cmd):
+            result = subprocess.run(cmd, capture_output=True, text=True, **kwargs)
 
         if result.returncode != 0:
             raise RuntimeError(f"Command failed:\n{' '.join(cmd)}\n\n{result.stderr}")
 
         return result
 
-    def _dump_db(self, dump_path: Path):
-        print("Dumping database...")
+    @contextmanager
+    def _read_pipe(self, cmd: list[str], label: str):
+        """
+        Run a command and yield its stdout as a pipe. stderr goes to a file so a
+        chatty command cannot block on a full pipe.
+        """
+        with TemporaryFile() as err, trace(label, cat="subprocess"):
+            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=err)
+            try:
+                yield proc.stdout
+                # Drain trailing padding so the command can exit cleanly
+                while proc.stdout.read(1024 * 1024):
+                    pass
+            finally:
+                proc.stdout.close()
+                with blocked(f"{label} (wait)", cmd):
+                    returncode = proc.wait()
+
+            if returncode != 0:
+                err.seek(0)
+                raise RuntimeError(
+                    f"{label} failed:\n{' '.join(cmd)}\n\n{err.read().decode()}"
+                )
 
+    @contextmanager
+    def _write_pipe(self, cmd: list[str], label: str):
+        """
+        Run a command and yield its stdin as a pipe.
+        """
+        with TemporaryFile() as err, trace(label, cat="subprocess"):
+            proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=err)
+            try:
+                yield proc.stdin
+            finally:
+                proc.stdin.close()
+                with blocked(f"{label} (wait)", cmd):
+                    returncode = proc.wait()
+
+            if returncode != 0:
+                err.seek(0)
+                raise RuntimeError(
+                    f"{label} failed:\n{' '.join(cmd)}\n\n{err.read().decode()}"
+                )
+
+    @contextmanager
+    def _volume_tar_source(self):
+        """
+        Yield a stream-mode tar reader over the volume contents (tar runs in busybox).
+        """
         cmd = [
             "docker",
-            "compose",
-            "exec",
-            "-T",
-            "postgres",
-            "pg_dump",
-            "-U",
-            self.SQL_USER,
-            "-d",
-            self.SQL_DBNAME,
-            "-F",
-            "c",
-            "-Z",
-            "9",
+            "run",
+            "--rm",
+            "-v",
+            f"{self.outline_volume}:/volume-data:ro",
+            "busybox",
+            "tar",
+            "-cf",
+            "-",
+            "-C",
+            "/volume-data",
+            ".",
         ]
 
-        with open(dump_path, "wb") as f:
-            result = subprocess.run(cmd, stdout=f, stderr=subprocess.PIPE)
+        with self._read_pipe(self._command(cmd), "Volume stream") as stdout:
+            with tarfile.open(fileobj=stdout, mode="r|") as src:
+                yield src
+
+    @contextmanager
+    def _volume_tar_sink(self, clean: bool = True):
+        """
+        Yield a stream-mode tar writer that is extracted into the volume.
+
+        Arguments:
+            clean (bool): Empty the volume first (full restore) instead of
+                extracting over the existing files.
+        """
+        # Clean + extract, busybox tar running as root keeps the original UID/GID
+        extract = "tar -xf - -C /volume-data"
+        cmd = [
+            "docker",
+            "run",
+            "-i",
+            "--rm",
+            "-v",
+            f"{self.outline_volume}:/volume-data",
+            "busybox",
+            "sh",
+            "-c",
+            f"rm -rf /volume-data/* && {extract}" if clean else extract,
+        ]
+
+        with self._write_pipe(self._command(cmd), "Volume restore") as stdin:
+            with tarfile.open(fileobj=stdin, mode="w|") as tar:
+                yield tar
+
+    def _pg_exec(self, args: list[str]) -> list[str]:
+        return ["docker", "compose", "exec", "-T", "postgres", *args]
+
+    def _run_pg(self, args: list[str], label: str):
+        with blocked(label, self._pg_exec(args)):
+            result = subprocess.run(
+                self._pg_exec(args), stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+            )
+
+        if result.returncode != 0:
+            raise RuntimeError(f"{label} failed:\n{result.stderr.decode()}")
+
+    @property
+    def _dump_compression(self) -> str:
+        # A parallel archive codec compresses the dump anyway; do it only once
+        return "0" if self.codec.parallel else "9"
+
+    def _dump_db_cmd(self) -> list[str]:
+        return self._pg_exec(
+            [
+                "pg_dump",
+                "-U",
+                self.SQL_USER,
+                "-d",
+                self.SQL_DBNAME,
+                "-F",
+                "c",
+                "-Z",
+                self._dump_compression,
+            ]
+        )
+
+    def _dump_db_to(self, f) -> int:
+        """
+        Run pg_dump writing straight into an open binary file.
+
+        Returns:
+            int: Size of the dump in bytes.
+        """
+        with blocked("pg_dump", self._dump_db_cmd()):
+            result = subprocess.run(
+                self._dump_db_cmd(), stdout=f, stderr=subprocess.PIPE
+            )
 
         if result.returncode != 0:
             raise RuntimeError(f"DB dump failed:\n{result.stderr.decode()}")
 
-        if dump_path.stat().st_size == 0:
+        size = f.tell()
+        if size == 0:
             raise RuntimeError("DB dump is empty (silent failure)")
 
+        return size
+
+    def _dump_db(self, dump_path: Path):
+        print("Dumping database...")
+
+        with stage("dump_db") as span, open(dump_path, "wb") as f:
+            span["bytes_out"] = self._dump_db_to(f)
+
+    @contextmanager
+    def _container_dump_dir(self):
+        """
+        Scratch directory inside the postgres container for directory-format dumps,
+        removed on exit.
+        """
+        try:
+            yield self.container_dump_dir
+        finally:
+            subprocess.run(
+                self._pg_exec(["rm", "-rf", self.container_dump_dir]),
+                capture_output=True,
+            )
+
+    def _dump_db_parallel(self, dump_dir: str):
+        print(f"Dumping database (directory format, {self.db_jobs} jobs)...")
+
+        # The dump stays in the container, its size is not known here
+        with stage("dump_db"):
+            self._run_pg(
+                [
+                    "pg_dump",
+                    "-U",
+                    self.SQL_USER,
+                    "-d",
+                    self.SQL_DBNAME,
+                    "-F",
+                    "d",
+                    "-j",
+                    str(self.db_jobs),
+                    "-Z",
+                    self._dump_compression,
+                    "-f",
+                    dump_dir,
+                ],
+                "DB dump",
+            )
+
+            # Counterpart of the empty-file check: an empty or corrupted directory dump
+            # has no readable TOC
+            self._run_pg(["pg_restore", "-l", dump_dir], "DB dump check")
+
+    def _pack_db_dir(self, tar: tarfile.TarFile, dump_dir: str):
+        """
+        Stream a directory-format dump out of the container into db/outline_db/.
+        """
+        cmd = self._pg_exec(["tar", "-cf", "-", "-C", dump_dir, "."])
+
+        with self._read_pipe(cmd, "DB dump stream") as stdout:
+            with tarfile.open(fileobj=stdout, mode="r|") as src:
+                for member in src:
+                    name = posixpath.normpath(member.name.lstrip("/"))
+                    member.name = posixpath.normpath(f"db/outline_db/{name}")
+
+                    fileobj = src.extractfile(member) if member.isreg() else None
+                    tar.addfile(member, fileobj)
+
+    @contextmanager
+    def _container_dump_sink(self, dump_dir: str):
+        """
+        Yield a stream-mode tar writer extracted into a dump directory inside the
+        postgres container.
+        """
+        cmd = self._pg_exec(
+            [
+                "sh",
+                "-c",
+                # Path as a positional argument: never parsed by the shell
+                'rm -rf "$1" && mkdir -p "$1" && tar -xf - -C "$1"',
+                "sh",
+                dump_dir,
+            ]
+        )
+
+        with self._write_pipe(cmd, "DB dump transfer") as stdin:
+            with tarfile.open(fileobj=stdin, mode="w|") as tar:
+                yield tar
+
+    def _restore_db_parallel_cmd(self, dump_dir: str) -> list[str]:
+        return self._pg_exec(
+            [
+                "pg_restore",
+                "-U",
+                self.SQL_USER,
+                "-d",
+                self.SQL_DBNAME,
+                "--clean",  # drop existing objects
+                "--if-exists",
+                "-F",
+                "d",
+                "-j",
+                str(self.db_jobs),
+                dump_dir,
+            ]
+        )
+
     def _copy_volume(self):
         print(f"Copying volume: {self.outline_volume}")
 
@@ -104,29 +387,300 @@ class OutlineBackup:
             "cp -a /volume-data/. /backup-data/ 2>/dev/null || true",
         ]
 
-        self._run(cmd)
+        with stage("copy_volume") as span:
+            self._run(cmd)
+
+            dump_path = self.work_dir / "outline_db.dump"
+            dump_size = dump_path.stat().st_size if dump_path.exists() else 0
+            span["bytes_out"] = tree_size(self.work_dir) - dump_size
+
+    def _scan_volume(self) -> dict[str, list]:
+        """
+        List every entry of the volume with the stat fields used to detect changes.
+
+        Returns:
+            dict[str, list]: Relative path -> [type, inode, size, mtime].
+        """
+        cmd = [
+            "docker",
+            "run",
+            "--rm",
+            "-v",
+            f"{self.outline_volume}:/volume-data:ro",
+            "busybox",
+            "sh",
+            "-c",
+            "cd /volume-data && find . -mindepth 1 -exec stat -c '%F:%i:%s:%Y:%n' {} +",
+        ]
+
+        entries = {}
+        for line in self._run(cmd).stdout.splitlines():
+            kind, inode, size, mtime, name = line.split(":", 4)
+            entries[posixpath.normpath(name)] = [
+                kind,
+                int(inode),
+                int(size),
+                int(mtime),
+            ]
+
+        return entries
+
+    def _run_on_mirror(self, script: str, paths: list[str], label: str):
+        """
+        Run a busybox script with the volume and the mirror mounted, feeding it
+        one relative path per line on stdin. A non-zero exit status fails the sync.
+        """
+        cmd = self._command(
+            [
+                "docker",
+                "run",
+                "-i",
+                "--rm",
+                "-v",
+                f"{self.outline_volume}:/volume-data:ro",
+                "-v",
+                f"{self.mirror_dir}:/mirror",
+                "busybox",
+                "sh",
+                "-c",
+                script,
+            ]
+        )
+
+        with blocked(label, cmd):
+            result = subprocess.run(
+                cmd, input="\n".join(paths) + "\n", capture_output=True, text=True
+            )
+
+        # Only the exit status counts: tar warns on stderr about harmless things
+        if result.returncode != 0:
+            raise RuntimeError(
+                f"{label} failed (exit code {result.returncode}):\n"
+                f"{' '.join(cmd)}\n\n{result.stderr}"
+            )
+
+    def _load_mirror_state(self) -> dict:
+        """
+        Volume scan of the last mirror sync, checked against the mirror itself:
+        the same entries must be there, regular files with the same size. Empty
+        (full resync) when the state is missing or the mirror was removed, pruned
+        or partly copied since.
+        """
+        try:
+            with open(self.mirror_state_path, "r", encoding="utf-8") as f:
+                previous = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+        present = {}
+        for root, dirs, files in os.walk(self.mirror_dir):
+            for name in dirs + files:
+                path = os.path.join(root, name)
+                rel = os.path.relpath(path, self.mirror_dir).replace(os.sep, "/")
+                if rel != MIRROR_STATE_NAME:
+                    present[rel] = os.lstat(path)
+
+        consistent = present.keys() == previous.keys() and all(
+            stat.S_ISREG(present[name].st_mode) and present[name].st_size == size
+            for name, (kind, _, size, _) in previous.items()
+            if kind.startswith("regular")
+        )
+        if not consistent:
+            print("Mirror does not match its last sync, resyncing everything")
+            return {}
+
+        return previous
+
+    def _sync_mirror(self):
+        """
+        Bring the local mirror of the volume up to date. Only entries whose type,
+        inode, size or mtime changed since the last sync are copied (rsync-style);
+        entries gone from the volume are removed from the mirror. A mirror that
+        does not match its state is rebuilt from scratch.
+        """
+        print(f"Syncing mirror of {self.outline_volume}: {self.mirror_dir}")
+
+        with stage("sync_mirror") as span:
+            self.mirror_dir.mkdir(parents=True, exist_ok=True)
+            previous = self._load_mirror_state()
+
+            current = self._scan_volume()
+            span["bytes_in"] = _regular_size(current.values())
+
+            if previous:
+                deleted = [name for name in previous if name not in current]
+            else:
+                # Full resync: start from an empty mirror
+                deleted = [
+                    name
+                    for name in os.listdir(self.mirror_dir)
+                    if name != MIRROR_STATE_NAME
+                ]
+            # Sorted, so parent directories are created before their contents
+            changed = sorted(
+                name for name, sig in current.items() if previous.get(name) != sig
+            )
+
+            if deleted:
+                self._run_on_mirror(
+                    "set -e; cd /mirror; "
+                    'while IFS= read -r f; do rm -rf "./$f"; done',
+                    deleted,
+                    "Mirror cleanup",
+                )
+
+            if changed:
+                self._run_on_mirror(
+                    "set -o pipefail; cd /volume-data && "
+                    "tar --no-recursion -cf - -T /dev/stdin | tar -xf - -C /mirror",
+                    changed,
+                    "Mirror sync",
+                )
+            span["bytes_out"] = _regular_size(current[name] for name in changed)
+
+            # Written last: after a failed sync the old state makes the next run
+            # redo the same deletions and copies (or all of them if it no longer
+            # matches). Written next to the mirror, never archived half-written.
+            tmp_state = self.mirror_dir.with_name(f"{self.outline_volume}.state.tmp")
+            with open(tmp_state, "w", encoding="utf-8") as f:
+                json.dump(current, f, separators=(",", ":"))
+            os.replace(tmp_state, self.mirror_state_path)
+
+            print(
+                f"Mirror synced: {len(changed)} changed, {len(deleted)} removed, "
+                f"{len(current) - len(changed)} unchanged"
+            )
+
+    def _stream_volume_into(self, tar: tarfile.TarFile):
+        """
+        Re-pack a tar stream of the volume (produced inside busybox) under media/.
+
+        Arguments:
+            tar (tarfile.TarFile): Archive being written.
+        """
+        print(f"Streaming volume: {self.outline_volume}")
+
+        with stage("stream_volume") as span, self._volume_tar_source() as src:
+            span["bytes_in"] = 0
+            for member in src:
+                member.name = self._media_arcname(member.name)
+                if member.islnk():
+                    member.linkname = self._media_arcname(member.linkname)
+
+                fileobj = src.extractfile(member) if member.isreg() else None
+                tar.addfile(member, fileobj)
+                if member.isreg():
+                    span["bytes_in"] += member.size
+
+    @staticmethod
+    def _media_arcname(name: str) -> str:
+        name = posixpath.normpath(name.lstrip("/"))
+        return "media" if name == "." else f"media/{name}"
+
+    def _write_streaming_archive(self, target: Path | BinaryIO):
+        self.backup_root.mkdir(parents=True, exist_ok=True)
+
+        # Dump and volume stream run inside the archive stage, with their own spans
+        with stage("archive") as span:
+            with open_archive_writer(target, self.codec) as tar:
+                # 1. Dump DB
+                if self.db_jobs > 1:
+                    with self._container_dump_dir() as dump_dir:
+                        self._dump_db_parallel(dump_dir)
+                        self._pack_db_dir(tar, dump_dir)
+                else:
+                    self._write_db_dump_into(tar)
+
+                # 2. Stream media volume
+                self._stream_volume_into(tar)
+                span["bytes_in"] = tar.offset
+
+            # Streamed into a pipe: the upload stages have the size
+            if isinstance(target, Path):
+                span["bytes_out"] = target.stat().st_size
+
+    def _write_db_dump_into(self, tar: tarfile.TarFile):
+        print("Dumping database...")
+
+        # Tar headers need the member size up front, so the (already compressed)
+        # dump goes to an anonymous temp file first.
+        with TemporaryFile(dir=self.backup_root) as dump:
+            with stage("dump_db") as span:
+                size = span["bytes_out"] = self._dump_db_to(dump)
+            dump.seek(0)
+
+            info = tarfile.TarInfo("db/outline_db.dump")
+            info.size = size
+            info.mtime = int(datetime.now().timestamp())
+            tar.addfile(info, dump)
+
+    def _create_backup_streaming(self) -> Path:
+        print(f"Creating archive: {self.archive_path}")
+        self._write_streaming_archive(self.archive_path)
+
+        print("Backup created successfully.")
+        return self.archive_path
+
+    @notify_on_failure
+    def stream_backup(self, out: BinaryIO):
+        """
+        Write a streaming backup archive into an open binary file or pipe,
+        without creating it on local disk (e.g. while it is being uploaded).
+
+        Arguments:
+            out (BinaryIO): Destination the compressed archive is written to.
+        """
+        print(f"Streaming archive: {self.archive_path.name}")
+        self._write_streaming_archive(out)
+
+        print("Backup created successfully.")
 
     @notify_on_failure
     def create_backup(self) -> Path:
+        if self.streaming:
+            return self._create_backup_streaming()
+
         self.work_dir.mkdir(parents=True, exist_ok=True)
 
         dump_path = self.work_dir / "outline_db.dump"
 
-        # 1. Dump DB
-        self._dump_db(dump_path)
+        with ExitStack() as stack:
+            # 1. Dump DB (directory dumps stay in the container until archived)
+            if self.db_jobs > 1:
+                dump_dir = stack.enter_context(self._container_dump_dir())
+                self._dump_db_parallel(dump_dir)
+            else:
+                self._dump_db(dump_path)
 
-        # 2. Copy media volume
-        self._copy_volume()
+            # 2. Copy media volume (or only what changed since the last mirror sync)
+            if self.mirror:
+                self._sync_mirror()
+            else:
+                self._copy_volume()
 
-        # 3. Create archive (single pass)
-        print(f"Creating archive: {self.archive_path}")
+            # 3. Create archive (single pass)
+            print(f"Creating archive: {self.archive_path}")
 
-        with tarfile.open(self.archive_path, "w:gz") as tar:
-            for item in self.work_dir.iterdir():
-                if item.name == "outline_db.dump":
-                    tar.add(item, arcname="db/outline_db.dump")
-                else:
-                    tar.add(item, arcname=f"media/{item.name}")
+            with stage("archive") as span:
+                with open_archive_writer(self.archive_path, self.codec) as tar:
+                    if self.db_jobs > 1:
+                        self._pack_db_dir(tar, dump_dir)
+
+                    for item in self.work_dir.iterdir():
+                        if item.name == "outline_db.dump":
+                            tar.add(item, arcname="db/outline_db.dump")
+                        elif not self.mirror:
+                            tar.add(item, arcname=f"media/{item.name}")
+
+                    if self.mirror:
+                        for item in self.mirror_dir.iterdir():
+                            if item.name != MIRROR_STATE_NAME:
+                                tar.add(item, arcname=f"media/{item.name}")
+
+                    # Uncompressed tar stream, i.e. what the codec compressed
+                    span["bytes_in"] = tar.offset
+
+                span["bytes_out"] = self.archive_path.stat().st_size
 
         # 4. Cleanup (handle docker permission garbage)
         def _on_rm_error(func, path, exc_info):
@@ -141,6 +695,87 @@ class OutlineBackup:
         print("Backup created successfully.")
         return self.archive_path
 
+    @notify_on_failure
+    def create_dedup_backup(self, known_chunks: set[str]) -> Path:
+        """
+        Chunk the DB dump and the volume into a content-addressed store. Only chunks
+        missing from `known_chunks` (already stored remotely) are written.
+
+        Arguments:
+            known_chunks (set[str]): Digests of the chunks the destination already has.
+
+        Returns:
+            Path: work_dir, holding manifest.json and the new chunks under chunks/.
+        """
+        if self.mirror:
+            raise ValueError("Mirror backups are not supported in dedup mode")
+
+        self.work_dir.mkdir(parents=True, exist_ok=True)
+        writer = ChunkWriter(self.work_dir / "chunks", known_chunks)
+
+        # 1. Dump DB straight into the chunker
+        print("Dumping database...")
+        with self._read_pipe(self._dump_db_cmd(), "DB dump") as stdout:
+            db_chunks = writer.write_stream(stdout)
+
+        db_size = writer.bytes_total
+        if db_size == 0:
+            raise RuntimeError("DB dump is empty (silent failure)")
+
+        # 2. Chunk media volume
+        print(f"Chunking volume: {self.outline_volume}")
+        media = []
+        with self._volume_tar_source() as src:
+            for member in src:
+                entry = member_to_entry(
+                    member, posixpath.normpath(member.name.lstrip("/"))
+                )
+                if member.islnk():
+                    entry["linkname"] = posixpath.normpath(member.linkname.lstrip("/"))
+                if member.isreg():
+                    entry["chunks"] = writer.write_stream(src.extractfile(member))
+
+                media.append(entry)
+
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "volume": self.outline_volume,
+            "created": datetime.now().timestamp(),
+            "chunk_size": writer.chunk_size,
+            "db": {"size": db_size, "chunks": db_chunks},
+            "media": media,
+        }
+        write_manifest(self.work_dir / "manifest.json", manifest)
+
+        print(
+            f"Dedup backup created: {writer.bytes_new} new of "
+            f"{writer.bytes_total} bytes."
+        )
+        return self.work_dir
+
+    def _restore_dedup(self, manifest_path: Path):
+        chunk_dir = manifest_path.parent / "chunks"
+        manifest = read_manifest(manifest_path)
+
+        # --- 1. Rebuild media volume from the manifest ---
+        print("Restoring media volume (clean overwrite)...")
+        with self._volume_tar_sink() as tar:
+            for entry in manifest["media"]:
+                member = entry_to_member(entry)
+                fileobj = (
+                    ChunkReader(chunk_dir, entry["chunks"]) if member.isreg() else None
+                )
+                tar.addfile(member, fileobj)
+
+        # --- 2. Restore database ---
+        print("Restoring database...")
+        with self._write_pipe(self._restore_db_cmd(), "DB restore") as stdin:
+            shutil.copyfileobj(
+                ChunkReader(chunk_dir, manifest["db"]["chunks"]), stdin, 1024 * 1024
+            )
+
+        print("Restore completed successfully.")
+
     def _restore_volume(self, media_dir: Path):
         print("Restoring media volume (clean overwrite)...")
         media_cmd = [
@@ -158,58 +793,288 @@ class OutlineBackup:
             "rm -rf /volume-data/* && cp -a /restore-data/. /volume-data/",
         ]
 
-        self._run(media_cmd)
+        with stage("restore_volume") as span:
+            span["bytes_in"] = tree_size(media_dir)
+            self._run(media_cmd)
+
+    def _restore_db_cmd(self) -> list[str]:
+        return self._pg_exec(
+            [
+                "pg_restore",
+                "-U",
+                self.SQL_USER,
+                "-d",
+                self.SQL_DBNAME,
+                "--clean",  # drop existing objects
+                "--if-exists",
+            ]
+        )
 
     def _restore_db(self, db_dump: Path):
         print("Restoring database...")
 
-        db_cmd = [
-            "docker",
-            "compose",
-            "exec",
-            "-T",
-            "postgres",
-            "pg_restore",
-            "-U",
-            self.SQL_USER,
-            "-d",
-            self.SQL_DBNAME,
-            "--clean",  # drop existing objects
-            "--if-exists",
-        ]
-
-        with open(db_dump, "rb") as f:
-            result = subprocess.run(db_cmd, stdin=f, stderr=subprocess.PIPE)
+        with stage("restore_db") as span, open(db_dump, "rb") as f:
+            span["bytes_in"] = db_dump.stat().st_size
+            with blocked("pg_restore", self._restore_db_cmd()):
+                result = subprocess.run(
+                    self._restore_db_cmd(), stdin=f, stderr=subprocess.PIPE
+                )
 
         if result.returncode != 0:
             raise RuntimeError(f"DB restore failed:\n{result.stderr.decode()}")
 
+    def _check_archive_parts(self, archive_path: Path):
+        """
+        Make sure the archive holds a database dump and media before anything is
+        overwritten. A seekable archive is checked from its index; any other one
+        is listed in full, which also catches truncation and corruption.
+        """
+        names = None
+        with open(archive_path, "rb") as f:
+            try:
+                names = [
+                    entry["name"] for entry in SeekableArchive.from_file(f).entries
+                ]
+            except (RuntimeError, OSError):
+                # Not seekable (or its footer is damaged): list it
+                pass
+
+        if names is None:
+            print(f"Checking archive: {archive_path}")
+            with stage("check_archive"), open_archive_reader(archive_path) as src:
+                names = [member.name for member in src]
+
+        names = [posixpath.normpath(name.lstrip("/")) for name in names]
+
+        if not any(name == "media" or name.startswith("media/") for name in names):
+            raise RuntimeError("Missing media directory in backup")
+
+        if not any(
+            name in ("db/outline_db.dump", "db/outline_db")
+            or name.startswith("db/outline_db/")
+            for name in names
+        ):
+            raise RuntimeError("Missing database dump in backup")
+
+    def _restore_streaming(self, archive_path: Path):
+        """
+        Single pass over the archive: db/outline_db.dump is piped into pg_restore and
+        media/ is re-packed into a tar stream extracted inside busybox. Each sink is
+        started on its first member, and pg_restore keeps working on the dump while
+        the media members are streamed. The archive is checked first, since both
+        sinks are destructive (clean restore) from their first member on.
+        """
+        self._check_archive_parts(archive_path)
+
+        print(f"Streaming restore from {archive_path}")
+        with ExitStack() as sinks, open_archive_reader(archive_path) as src:
+            media_sink = None
+            # Directory-format dump: copied into the container, then pg_restore -j
+            dump_dir = dump_files = None
+
+            for member in src:
+                name = posixpath.normpath(member.name.lstrip("/"))
+
+                if name == "db/outline_db" or name.startswith("db/outline_db/"):
+                    if dump_dir is None:
+                        print(f"Restoring database ({self.db_jobs} jobs)...")
+                        dump_dir = sinks.enter_context(self._container_dump_dir())
+                        dump_files = sinks.enter_context(ExitStack())
+                        dump_sink = dump_files.enter_context(
+                            self._container_dump_sink(dump_dir)
+                        )
+
+                    member.name = posixpath.relpath(name, "db/outline_db")
+                    fileobj = src.extractfile(member) if member.isreg() else None
+                    dump_sink.addfile(member, fileobj)
+                    continue
+
+                # Any other member means the dump directory is complete
+                if dump_files is not None:
+                    dump_files.close()
+                    dump_files = None
+                    self._start_db_restore_parallel(sinks, dump_dir)
+
+                if name == "db/outline_db.dump":
+                    print("Restoring database...")
+                    # pg_restore is only waited for (and checked) when the stack exits
+                    db = sinks.enter_context(
+                        self._write_pipe(self._restore_db_cmd(), "DB restore")
+                    )
+                    shutil.copyfileobj(src.extractfile(member), db, 1024 * 1024)
+                    # EOF lets pg_restore finish while media keeps streaming
+                    db.close()
+
+                elif name == "media" or name.startswith("media/"):
+                    if media_sink is None:
+                        print("Restoring media volume (clean overwrite)...")
+                        media_sink = sinks.enter_context(self._volume_tar_sink())
+
+                    member.name = posixpath.relpath(name, "media")
+                    if member.islnk():
+                        member.linkname = posixpath.relpath(
+                            posixpath.normpath(member.linkname.lstrip("/")), "media"
+                        )
+
+                    fileobj = src.extractfile(member) if member.isreg() else None
+                    media_sink.addfile(member, fileobj)
+
+            if dump_files is not None:
+                dump_files.close()
+                self._start_db_restore_parallel(sinks, dump_dir)
+
+        print("Restore completed successfully.")
+
+    def _start_db_restore_parallel(self, stack: ExitStack, dump_dir: str):
+        """
+        Start pg_restore -j in the background; it is waited for (and checked) when
+        `stack` exits, so media can keep streaming meanwhile.
+        """
+        cmd = self._restore_db_parallel_cmd(dump_dir)
+        stack.enter_context(self._write_pipe(cmd, "DB restore")).close()
+
+    def _restore_db_dir(self, db_dir: Path):
+        self._restore_db_dir_from(lambda tar: tar.add(db_dir, arcname="."))
+
+    def _restore_db_dir_from(self, fill: Callable[[tarfile.TarFile], None]):
+        """
+        Copy a directory-format dump into the container (`fill` writes its files
+        into the given tar stream) and run a parallel pg_restore on it.
+        """
+        print(f"Restoring database ({self.db_jobs} jobs)...")
+
+        with stage("restore_db"), self._container_dump_dir() as dump_dir:
+            with self._container_dump_sink(dump_dir) as tar:
+                fill(tar)
+
+            cmd = self._restore_db_parallel_cmd(dump_dir)
+            with blocked("pg_restore", cmd):
+                restore = subprocess.run(cmd, stderr=subprocess.PIPE)
+
+        if restore.returncode != 0:
+            raise RuntimeError(f"DB restore failed:\n{restore.stderr.decode()}")
+
+    @notify_on_failure
+    def restore_selected(self, archive: SeekableArchive, only: str):
+        """
+        Restore part of a seekable archive, reading only the frames that hold it.
+
+        Arguments:
+            archive (SeekableArchive): Archive opened for ranged reads.
+            only (str): "db", or "media/<path>" for a file or directory of the volume.
+                Media is extracted over the volume without cleaning it.
+        """
+        only = posixpath.normpath(only.strip("/"))
+
+        if only == "db":
+            self._restore_selected_db(archive)
+        elif only == "media" or only.startswith("media/"):
+            self._restore_selected_media(archive, only)
+        else:
+            raise ValueError(f"Unsupported restore target: {only} (db or media/<path>)")
+
+        print("Restore completed successfully.")
+
+    def _restore_selected_db(self, archive: SeekableArchive):
+        dump = archive.select(lambda name: name == "db/outline_db.dump")
+        if dump:
+            print("Restoring database...")
+            with self._write_pipe(self._restore_db_cmd(), "DB restore") as stdin:
+                shutil.copyfileobj(archive.open_member(dump[0]), stdin, 1024 * 1024)
+            return
+
+        entries = archive.select(
+            lambda name: name == "db/outline_db" or name.startswith("db/outline_db/")
+        )
+        if not entries:
+            raise RuntimeError("Missing database dump in backup")
+
+        def fill(tar: tarfile.TarFile):
+            for entry in entries:
+                member = archive.to_member(entry)
+                member.name = posixpath.relpath(entry["name"], "db/outline_db")
+                fileobj = archive.open_member(entry) if member.isreg() else None
+                tar.addfile(member, fileobj)
+
+        self._restore_db_dir_from(fill)
+
+    def _restore_selected_media(self, archive: SeekableArchive, only: str):
+        # Parent directories are included so their ownership/modes are restored too
+        parents = set()
+        parent = only
+        while parent:
+            parents.add(parent)
+            parent = posixpath.dirname(parent)
+
+        entries = archive.select(
+            lambda name: name in parents or name.startswith(f"{only}/")
+        )
+        if not any(e["name"] == only for e in entries):
+            raise RuntimeError(f"Not found in backup: {only}")
+
+        print(f"Restoring {only} into volume {self.outline_volume}...")
+        with self._volume_tar_sink(clean=False) as tar:
+            for entry in entries:
+                member = archive.to_member(entry)
+                member.name = posixpath.relpath(entry["name"], "media")
+                if member.islnk():
+                    member.linkname = posixpath.relpath(member.linkname, "media")
+
+                fileobj = archive.open_member(entry) if member.isreg() else None
+                tar.addfile(member, fileobj)
+
     @notify_on_failure
     def restore_backup(self):
         archive_path = Path(self.restore_archive_path)
         if not archive_path.is_file():
             raise FileNotFoundError(archive_path)
 
+        # Downloaded dedup manifest (chunks live next to it)
+        if archive_path.suffix == ".json":
+            self._restore_dedup(archive_path)
+            return
+
+        if self.streaming:
+            with stage("restore_streaming") as span:
+                span["bytes_in"] = archive_path.stat().st_size
+                self._restore_streaming(archive_path)
+            return
+
         with TemporaryDirectory(prefix="restore_") as tmp:
             temp_dir = Path(tmp)
 
             print(f"Extracting backup from {archive_path}")
-            with tarfile.open(archive_path, "r:gz") as tar:
-                tar.extractall(path=temp_dir)
+            with stage("extract") as span:
+                with open_archive_reader(archive_path) as tar:
+                    tar.extractall(path=temp_dir)
+                    span["bytes_out"] = tar.offset
+                span["bytes_in"] = archive_path.stat().st_size
 
             media_dir = temp_dir / "media"
             db_dump = temp_dir / "db" / "outline_db.dump"
+            db_dir = temp_dir / "db" / "outline_db"
 
             if not media_dir.exists():
                 raise RuntimeError("Missing media directory in backup")
 
-            if not db_dump.exists():
+            if not db_dump.exists() and not db_dir.is_dir():
                 raise RuntimeError("Missing database dump in backup")
 
             # --- 1. Restore media (clean volume first) ---
             self._restore_volume(media_dir=media_dir)
 
             # --- 2. Restore database ---
-            self._restore_db(db_dump=db_dump)
+            if db_dir.is_dir():
+                self._restore_db_dir(db_dir=db_dir)
+            else:
+                self._restore_db(db_dump=db_dump)
 
             print("Restore completed successfully.")
+
+
+def _regular_size(signatures) -> int:
+    """
+    Total size of the regular files among volume scan signatures
+    ([type, inode, size, mtime], see _scan_volume).
+    """
+    return sum(size for kind, _, size, _ in signatures if kind.startswith("regular"))
@@ -12,14 +12,17 @@ fi
 OUTLINE_VOLUME="${OUTLINE_VOLUME:?OUTLINE_VOLUME is required}"
 SQL_USER="${SQL_USER:?SQL_USER is required}"
 SQL_DBNAME="${SQL_DBNAME:?SQL_DBNAME is required}"
+PG_DUMP_JOBS="${PG_DUMP_JOBS:-1}"
 
 TIMESTAMP=$(date +%Y%m%d_%H%M%S)
 BACKUP_ROOT="./backups"
 WORK_DIR="${BACKUP_ROOT}/${OUTLINE_VOLUME}_${TIMESTAMP}"
 ARCHIVE_PATH="${BACKUP_ROOT}/${OUTLINE_VOLUME}_${TIMESTAMP}.tar.gz"
 STAGE_DIR=""
+CONTAINER_DUMP_DIR="/tmp/${OUTLINE_VOLUME}_db_${TIMESTAMP}"
 
 cleanup() {
+    [ "${PG_DUMP_JOBS}" -gt 1 ] && docker compose exec -T postgres rm -rf "${CONTAINER_DUMP_DIR}" 2>/dev/null || true
     [ -d "${WORK_DIR}" ] && sudo rm -rf "${WORK_DIR}" 2>/dev/null || true
     [ -n "${STAGE_DIR}" ] && [ -d "${STAGE_DIR}" ] && sudo rm -rf "${STAGE_DIR}" 2>/dev/null || true
 }
@@ -28,16 +31,38 @@ trap cleanup EXIT
 mkdir -p "${WORK_DIR}"
 
 # 1. Dump DB
-echo "Dumping database..."
-docker compose exec -T postgres pg_dump \
-    -U "${SQL_USER}" \
-    -d "${SQL_DBNAME}" \
-    -F c \
-    -Z 9 > "${WORK_DIR}/outline_db.dump"
-
-if [ ! -s "${WORK_DIR}/outline_db.dump" ]; then
-    echo "ERROR: DB dump is empty (silent failure)" >&2
-    exit 1
+if [ "${PG_DUMP_JOBS}" -gt 1 ]; then
+    # Directory format, dumped in parallel inside the container then copied out
+    echo "Dumping database (directory format, ${PG_DUMP_JOBS} jobs)..."
+    docker compose exec -T postgres pg_dump \
+        -U "${SQL_USER}" \
+        -d "${SQL_DBNAME}" \
+        -F d \
+        -j "${PG_DUMP_JOBS}" \
+        -Z 9 \
+        -f "${CONTAINER_DUMP_DIR}"
+
+    # An empty or corrupted directory dump has no readable TOC
+    if ! docker compose exec -T postgres pg_restore -l "${CONTAINER_DUMP_DIR}" > /dev/null; then
+        echo "ERROR: DB dump is unreadable (silent failure)" >&2
+        exit 1
+    fi
+
+    mkdir -p "${WORK_DIR}/outline_db"
+    docker compose exec -T postgres tar -cf - -C "${CONTAINER_DUMP_DIR}" . \
+        | tar -xf - -C "${WORK_DIR}/outline_db"
+else
+    echo "Dumping database..."
+    docker compose exec -T postgres pg_dump \
+        -U "${SQL_USER}" \
+        -d "${SQL_DBNAME}" \
+        -F c \
+        -Z 9 > "${WORK_DIR}/outline_db.dump"
+
+    if [ ! -s "${WORK_DIR}/outline_db.dump" ]; then
+        echo "ERROR: DB dump is empty (silent failure)" >&2
+        exit 1
+    fi
 fi
 
 # 2. Copy volume
@@ -53,7 +78,11 @@ echo "Creating archive: ${ARCHIVE_PATH}"
 STAGE_DIR="$(mktemp -d)"
 mkdir -p "${STAGE_DIR}/db" "${STAGE_DIR}/media"
 
-mv "${WORK_DIR}/outline_db.dump" "${STAGE_DIR}/db/"
+if [ -d "${WORK_DIR}/outline_db" ]; then
+    mv "${WORK_DIR}/outline_db" "${STAGE_DIR}/db/"
+else
+    mv "${WORK_DIR}/outline_db.dump" "${STAGE_DIR}/db/"
+fi
 sudo cp -rp "${WORK_DIR}/." "${STAGE_DIR}/media/"
 
 mkdir -p "${BACKUP_ROOT}"
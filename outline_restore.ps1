@@ -37,7 +37,8 @@ try {
     New-Item -ItemType Directory -Force -Path $TempDir | Out-Null
 
     Write-Host "Extracting backup from $ArchivePath..."
-    tar -xzf $ArchivePath -C $TempDir
+    # bsdtar detects gzip / zstd / plain tar on its own
+    tar -xf $ArchivePath -C $TempDir
     if ($LASTEXITCODE -ne 0) { throw "tar extraction failed with exit code $LASTEXITCODE" }
 
     $MediaDir = Join-Path $TempDir "media"
@@ -12,11 +12,14 @@ fi
 OUTLINE_VOLUME="${OUTLINE_VOLUME:?OUTLINE_VOLUME is required}"
 SQL_USER="${SQL_USER:?SQL_USER is required}"
 SQL_DBNAME="${SQL_DBNAME:?SQL_DBNAME is required}"
+PG_DUMP_JOBS="${PG_DUMP_JOBS:-1}"
 
 TEMP_DIR=""
+CONTAINER_DUMP_DIR="/tmp/${OUTLINE_VOLUME}_db_restore_$$"
 
 cleanup() {
     [ -n "${TEMP_DIR}" ] && [ -d "${TEMP_DIR}" ] && sudo rm -rf "${TEMP_DIR}" 2>/dev/null || true
+    docker compose exec -T postgres rm -rf "${CONTAINER_DUMP_DIR}" 2>/dev/null || true
 }
 trap cleanup EXIT
 
@@ -28,17 +31,23 @@ echo "Downloaded: ${ARCHIVE_PATH}"
 # 2. Extract archive
 TEMP_DIR="$(mktemp -d -t restore_XXXXXX)"
 echo "Extracting backup from ${ARCHIVE_PATH}..."
-sudo tar -xzf "${ARCHIVE_PATH}" -C "${TEMP_DIR}"
+case "${ARCHIVE_PATH}" in
+    *.tar.zst) DECOMPRESS="zstd -dc" ;;
+    *.tar.gz) DECOMPRESS="$(command -v pigz >/dev/null && echo "pigz -dc" || echo "gzip -dc")" ;;
+    *) DECOMPRESS="cat" ;;
+esac
+${DECOMPRESS} "${ARCHIVE_PATH}" | sudo tar -xf - -C "${TEMP_DIR}"
 
 MEDIA_DIR="${TEMP_DIR}/media"
 DB_DUMP="${TEMP_DIR}/db/outline_db.dump"
+DB_DIR="${TEMP_DIR}/db/outline_db"
 
 if [ ! -d "${MEDIA_DIR}" ]; then
     echo "ERROR: Missing media directory in backup" >&2
     exit 1
 fi
 
-if [ ! -f "${DB_DUMP}" ]; then
+if [ ! -f "${DB_DUMP}" ] && [ ! -d "${DB_DIR}" ]; then
     echo "ERROR: Missing database dump in backup" >&2
     exit 1
 fi
@@ -52,12 +61,27 @@ sudo docker run --rm \
     sh -c "cp -a /restore-data/. /volume-data/"
 
 # 4. Restore database
-echo "Restoring database..."
-docker compose exec -T postgres pg_restore \
-    -U "${SQL_USER}" \
-    -d "${SQL_DBNAME}" \
-    --clean \
-    --if-exists < "${DB_DUMP}"
+if [ -d "${DB_DIR}" ]; then
+    # Directory-format dump: copy it into the container and restore in parallel
+    echo "Restoring database (${PG_DUMP_JOBS} jobs)..."
+    sudo tar -cf - -C "${DB_DIR}" . | docker compose exec -T postgres \
+        sh -c "mkdir -p '${CONTAINER_DUMP_DIR}' && tar -xf - -C '${CONTAINER_DUMP_DIR}'"
+    docker compose exec -T postgres pg_restore \
+        -U "${SQL_USER}" \
+        -d "${SQL_DBNAME}" \
+        --clean \
+        --if-exists \
+        -F d \
+        -j "${PG_DUMP_JOBS}" \
+        "${CONTAINER_DUMP_DIR}"
+else
+    echo "Restoring database..."
+    docker compose exec -T postgres pg_restore \
+        -U "${SQL_USER}" \
+        -d "${SQL_DBNAME}" \
+        --clean \
+        --if-exists < "${DB_DUMP}"
+fi
 
 # Cleanup downloaded archive (only reached on success)
 rm -f "${ARCHIVE_PATH}"
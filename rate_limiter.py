@@ -0,0 +1,226 @@
+import email.utils
+import os
+import random
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlsplit
+
+import requests
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Attempts after the first one for 429, 5xx and connection errors
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "5"))
+# Backoff without Retry-After: random delay up to base * 2^attempt, capped
+HTTP_BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", "0.5"))
+HTTP_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", "30"))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# A throttled limiter never drops below this fraction of its configured rate
+_MIN_RATE_FACTOR = 1 / 16
+
+
+class RateLimiter:
+    """
+    Token bucket shared by every caller of one host: `rate` requests per second on
+    average, bursts of up to `burst`. The rate adapts to the server: it is halved
+    on a 429 and recovers step by step on success, and it follows the
+    RateLimit-* / X-RateLimit-* headers so the remaining quota is spread over the
+    rest of the window.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = max(burst, 1)
+
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now: float):
+        # `updated` is in the future while blocked: tokens accrue from the unblock
+        if now > self.updated:
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+
+    def acquire(self):
+        """
+        Block until a request may be sent.
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+
+                wait = self.blocked_until - now
+                if wait <= 0:
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+    def block(self, seconds: float):
+        """
+        Send nothing for `seconds` (Retry-After, exhausted quota).
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.blocked_until = max(self.blocked_until, now + seconds)
+            self.tokens = 0.0
+            self.updated = max(now, self.blocked_until)
+
+    def throttle(self, retry_after: float):
+        with self.lock:
+            self.rate = max(self.max_rate * _MIN_RATE_FACTOR, self.rate / 2)
+        self.block(retry_after)
+
+    def observe(self, headers):
+        """
+        Adapt to a successful response and its rate limit headers.
+        """
+        remaining = _number(
+            headers.get("RateLimit-Remaining") or headers.get("X-RateLimit-Remaining")
+        )
+        reset = _reset_seconds(
+            headers.get("X-RateLimit-Reset-After") or headers.get("RateLimit-Reset")
+        )
+
+        if remaining is not None and reset is not None:
+            if remaining < 1:
+                self.block(reset)
+                return
+            with self.lock:
+                # Spread what is left of the quota over the rest of the window
+                self.rate = min(
+                    self.max_rate,
+                    max(
+                        self.max_rate * _MIN_RATE_FACTOR, remaining / max(reset, 0.001)
+                    ),
+                )
+            return
+
+        with self.lock:
+            # Additive increase back towards the configured rate
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 10)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(url: str, rate: float, burst: int = 1) -> RateLimiter:
+    """
+    The process-wide limiter for the host of `url`, created with `rate` and
+    `burst` on first use.
+    """
+    host = urlsplit(url).netloc
+    with _limiters_lock:
+        if host not in _limiters:
+            _limiters[host] = RateLimiter(rate, burst)
+        return _limiters[host]
+
+
+def backoff_delay(attempt: int) -> float:
+    # Full jitter: concurrent callers do not retry in lockstep
+    return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * 2**attempt))
+
+
+def send_request(
+    method: str,
+    url: str,
+    limiter: RateLimiter,
+    session: requests.Session | None = None,
+    max_retries: int | None = None,
+    **kwargs,
+) -> requests.Response:
+    """
+    Send a request through `limiter`, retrying 429, 5xx and connection errors with
+    jittered backoff (or the delay the server asked for in Retry-After).
+
+    Returns:
+        requests.Response: The last response; the caller checks its status.
+    """
+    session = session or requests
+    max_retries = HTTP_MAX_RETRIES if max_retries is None else max_retries
+
+    for attempt in range(max_retries + 1):
+        limiter.acquire()
+        try:
+            response = session.request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt == max_retries:
+                raise
+            delay = backoff_delay(attempt)
+            print(f"    Request failed ({e}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+            continue
+
+        if response.status_code not in RETRY_STATUSES or attempt == max_retries:
+            if response.ok:
+                limiter.observe(response.headers)
+            return response
+
+        retry_after = _retry_after(response)
+        if response.status_code == 429:
+            delay = retry_after if retry_after is not None else backoff_delay(attempt)
+            print(f"    Rate limited, retrying in {delay:.1f}s")
+            # Every caller of the host waits, not only this one
+            limiter.throttle(delay)
+        else:
+            delay = retry_after if retry_after is not None else backoff_delay(attempt)
+            print(f"    Server error {response.status_code}, retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+    return response
+
+
+def _number(value) -> float | None:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _reset_seconds(value: str | None) -> float | None:
+    """
+    Seconds until a rate limit window resets: delta seconds, an epoch timestamp or
+    an HTTP / ISO 8601 date.
+    """
+    if value is None:
+        return None
+
+    seconds = _number(value)
+    if seconds is not None:
+        # Large values are epoch timestamps rather than deltas
+        return max(0.0, seconds - time.time()) if seconds > 1e9 else seconds
+
+    try:
+        reset = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        try:
+            reset = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+
+    return max(0.0, reset.timestamp() - time.time())
+
+
+def _retry_after(response: requests.Response) -> float | None:
+    delay = _reset_seconds(response.headers.get("Retry-After"))
+    if delay is not None:
+        return delay
+
+    # Discord also puts it in the JSON body
+    try:
+        return _number(response.json().get("retry_after"))
+    except (ValueError, AttributeError):
+        return None
@@ -0,0 +1,271 @@
+import bisect
+import gzip
+import io
+import json
+import struct
+import tarfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Callable, Iterator
+
+from backup_chunks import entry_to_member, member_to_entry
+
+FRAME_SIZE = 4 * 1024 * 1024
+INDEX_NAME = ".outline-index.json"
+INDEX_VERSION = 1
+
+# Trailing empty gzip member whose FEXTRA field points at the index frames.
+# gzip/tar ignore it (it decompresses to nothing), readers find it at a fixed size.
+_FOOTER_ID = b"OI"
+_FOOTER_PAYLOAD = struct.Struct("<QQ")
+_FOOTER_SIZE = 10 + 2 + 4 + _FOOTER_PAYLOAD.size + 2 + 8
+
+
+def _footer(index_offset: int, index_length: int) -> bytes:
+    payload = _FOOTER_PAYLOAD.pack(index_offset, index_length)
+    extra = _FOOTER_ID + struct.pack("<H", len(payload)) + payload
+    header = b"\x1f\x8b\x08\x04" + b"\x00" * 4 + b"\x00\xff"
+    # Empty final deflate block, then CRC32 and size of the (empty) content
+    return header + struct.pack("<H", len(extra)) + extra + b"\x03\x00" + b"\x00" * 8
+
+
+def _parse_footer(data: bytes) -> tuple[int, int]:
+    if (
+        len(data) != _FOOTER_SIZE
+        or data[:4] != b"\x1f\x8b\x08\x04"
+        or data[12:14] != _FOOTER_ID
+    ):
+        raise RuntimeError("Archive is not seekable (no index footer)")
+    return _FOOTER_PAYLOAD.unpack(data[16 : 16 + _FOOTER_PAYLOAD.size])
+
+
+class _FrameWriter:
+    """
+    Buffer the tar stream and write it as independent gzip members (frames).
+    Frames are compressed on a thread pool (zlib releases the GIL) and written
+    in order. The concatenation is a regular multi-member .gz file.
+    """
+
+    def __init__(self, out: BinaryIO, threads: int, frame_size=FRAME_SIZE, level=6):
+        self.out = out
+        self.frame_size = frame_size
+        self.level = level
+
+        self.buffer = bytearray()
+        self.u_offset = 0  # uncompressed offset of the buffer start
+        self.c_offset = 0  # bytes written to `out`
+        # [compressed offset, compressed length, uncompressed offset, length]
+        self.frames = []
+
+        self.pool = ThreadPoolExecutor(max_workers=threads)
+        self.pending = deque()
+        self.max_pending = threads * 2
+
+    def write(self, data) -> int:
+        self.buffer += data
+        while len(self.buffer) >= self.frame_size:
+            self._submit(self.frame_size)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.u_offset + len(self.buffer)
+
+    def flush_frame(self) -> list[int] | None:
+        """
+        Close the current frame and wait until every frame is written.
+
+        Returns:
+            list[int] | None: The last frame written, if any.
+        """
+        if self.buffer:
+            self._submit(len(self.buffer))
+        while self.pending:
+            self._write_next()
+        return self.frames[-1] if self.frames else None
+
+    def close(self):
+        self.pool.shutdown()
+
+    def _submit(self, size: int):
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+
+        future = self.pool.submit(gzip.compress, data, self.level, mtime=0)
+        self.pending.append((future, self.u_offset, size))
+        self.u_offset += size
+
+        while len(self.pending) > self.max_pending:
+            self._write_next()
+
+    def _write_next(self):
+        future, u_offset, size = self.pending.popleft()
+        compressed = future.result()
+
+        self.out.write(compressed)
+        self.frames.append([self.c_offset, len(compressed), u_offset, size])
+        self.c_offset += len(compressed)
+
+
+class SeekableTarFile(tarfile.TarFile):
+    """
+    Tar writer producing a seekable .tar.gz: independently compressed frames, a
+    trailing index member (frame table + member metadata/offsets) and a footer
+    pointing at it. Still extracts with `tar -xzf` (the index shows up as a file).
+    """
+
+    def __init__(self, out: BinaryIO, threads: int = 1, **kwargs):
+        self.frame_writer = _FrameWriter(out, threads)
+        self.index_entries = []
+        super().__init__(fileobj=self.frame_writer, mode="w", **kwargs)
+
+    def addfile(self, tarinfo, fileobj=None):
+        super().addfile(tarinfo, fileobj)
+
+        entry = member_to_entry(tarinfo, tarinfo.name)
+        del entry["chunks"]
+        # Data ends at self.offset, padded to whole blocks
+        padded = -(-entry["size"] // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+        entry["offset"] = self.offset - padded
+        self.index_entries.append(entry)
+
+    def __exit__(self, type, value, traceback):
+        try:
+            return super().__exit__(type, value, traceback)
+        finally:
+            self.frame_writer.close()
+
+    def close(self):
+        if self.closed:
+            return
+
+        try:
+            self.frame_writer.flush_frame()
+
+            index = json.dumps(
+                {
+                    "version": INDEX_VERSION,
+                    "frames": self.frame_writer.frames,
+                    "members": self.index_entries,
+                },
+                separators=(",", ":"),
+            ).encode()
+            info = tarfile.TarInfo(INDEX_NAME)
+            info.size = len(index)
+            # A large index spans several frames: point at the first one
+            index_offset = self.frame_writer.c_offset
+            # Bypass our addfile: the index does not index itself
+            tarfile.TarFile.addfile(self, info, io.BytesIO(index))
+
+            # End-of-archive blocks, then the footer covering everything since
+            super().close()
+            self.frame_writer.flush_frame()
+            self.frame_writer.out.write(
+                _footer(index_offset, self.frame_writer.c_offset - index_offset)
+            )
+        finally:
+            self.frame_writer.close()
+
+
+class SeekableArchive:
+    """
+    Random access to a seekable archive through a `read_range(offset, length)`
+    callable, so only the frames holding the requested members are fetched
+    (locally or e.g. with ranged SFTP reads).
+    """
+
+    # Fetch at most this many frames per read while streaming a member
+    FRAMES_PER_READ = 8
+
+    def __init__(self, read_range: Callable[[int, int], bytes], size: int):
+        self.read_range = read_range
+
+        index_offset, index_length = _parse_footer(
+            read_range(size - _FOOTER_SIZE, _FOOTER_SIZE)
+        )
+        raw = gzip.decompress(read_range(index_offset, index_length))
+        with tarfile.open(fileobj=io.BytesIO(raw), mode="r:") as tar:
+            member = tar.next()
+            if member is None or member.name != INDEX_NAME:
+                raise RuntimeError("Archive index frame is corrupted")
+            index = json.load(tar.extractfile(member))
+
+        if index.get("version") != INDEX_VERSION:
+            raise RuntimeError(f"Unsupported index version: {index.get('version')}")
+
+        self.frames = index["frames"]
+        self.frame_starts = [frame[2] for frame in self.frames]
+        self.entries = index["members"]
+
+    @classmethod
+    def from_file(cls, f: BinaryIO) -> "SeekableArchive":
+        def read_range(offset: int, length: int) -> bytes:
+            f.seek(offset)
+            return f.read(length)
+
+        f.seek(0, io.SEEK_END)
+        return cls(read_range, f.tell())
+
+    def select(self, predicate: Callable[[str], bool]) -> list[dict]:
+        return [e for e in self.entries if predicate(e["name"])]
+
+    def iter_data(self, entry: dict) -> Iterator[bytes]:
+        """
+        Yield the content of a regular-file member, fetching only its frames.
+        """
+        start, end = entry["offset"], entry["offset"] + entry["size"]
+        if start == end:
+            return
+
+        first = bisect.bisect_right(self.frame_starts, start) - 1
+        last = bisect.bisect_right(self.frame_starts, end - 1) - 1
+
+        for batch in range(first, last + 1, self.FRAMES_PER_READ):
+            frames = self.frames[batch : min(batch + self.FRAMES_PER_READ, last + 1)]
+
+            # Consecutive frames are contiguous, one ranged read covers them all
+            c_start = frames[0][0]
+            c_end = frames[-1][0] + frames[-1][1]
+            raw = self.read_range(c_start, c_end - c_start)
+
+            for c_offset, c_length, u_offset, u_length in frames:
+                data = gzip.decompress(
+                    raw[c_offset - c_start : c_offset - c_start + c_length]
+                )
+                yield data[max(start - u_offset, 0) : end - u_offset]
+
+    def open_member(self, entry: dict) -> BinaryIO:
+        return _IterReader(self.iter_data(entry))
+
+    @staticmethod
+    def to_member(entry: dict) -> tarfile.TarInfo:
+        return entry_to_member(entry)
+
+
+class _IterReader(io.RawIOBase):
+    def __init__(self, chunks: Iterator[bytes]):
+        self.chunks = chunks
+        self.buffer = b""
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            data = self.buffer + b"".join(self.chunks)
+            self.buffer = b""
+            return data
+
+        # Fill the whole request: tarfile takes a short read for end of data
+        parts = [self.buffer]
+        available = len(self.buffer)
+        while available < size:
+            try:
+                chunk = next(self.chunks)
+            except StopIteration:
+                break
+            parts.append(chunk)
+            available += len(chunk)
+
+        data = b"".join(parts)
+        out, self.buffer = data[:size], data[size:]
+        return out
@@ -1,13 +1,31 @@
 import argparse
 import os
+import shutil
+import signal
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from pathlib import Path
 
 from dotenv import load_dotenv
 
+from backup_codecs import CHECKSUM_SUFFIX
+from backup_destinations import Destination, fan_out_upload, load_destinations
 from backup_helper import BackupHelperSFTP
 from backup_logger import build_log_entry, log_execution
+from backup_metrics import recorded_stages, reset_stages, write_prometheus_textfile
+from backup_profile import start_profiling, stop_profiling
+from backup_scheduler import (
+    BACKUP_DAEMON_LOCK,
+    BACKUP_RUN_LOCK,
+    BACKUP_SCHEDULE,
+    BACKUP_SCHEDULE_JITTER,
+    DAILY_REPORT_SCHEDULE,
+    CronSchedule,
+    Job,
+    Scheduler,
+)
+from file_lock import FileLock
 from outline_backup import OutlineBackup
 
 load_dotenv()
@@ -19,10 +37,13 @@ REMOTE_BACKUP_DIR = (
     / "outline_backups"
     / ("compressed" if not DEBUG else "debug_compressed")
 )
+REMOTE_DEDUP_DIR = (
+    Path("home") / "outline_backups" / ("dedup" if not DEBUG else "debug_dedup")
+)
+PIPE_CHUNK_SIZE = 1024 * 1024
 
 
 def download() -> Path:
-    sftp_helper = BackupHelperSFTP()
     local_restore_dir = Path("./restores")
     local_restore_dir.mkdir(parents=True, exist_ok=True)
 
@@ -30,10 +51,10 @@ def download() -> Path:
     # allowing shell scripts to capture it cleanly via $(...) / $(...).
     _stdout, sys.stdout = sys.stdout, sys.stderr
     try:
-        latest_backup = sftp_helper.download_backup(
-            remote_dir=REMOTE_BACKUP_DIR, local_dir=local_restore_dir
-        )
-        sftp_helper.close()
+        with BackupHelperSFTP() as sftp_helper:
+            latest_backup = sftp_helper.download_backup(
+                remote_dir=REMOTE_BACKUP_DIR, local_dir=local_restore_dir
+            )
     finally:
         sys.stdout = _stdout
 
@@ -41,58 +62,266 @@ def download() -> Path:
     return latest_backup
 
 
-def restore(outline_volume: str):
-    sftp_helper = BackupHelperSFTP()
+def verify():
+    with BackupHelperSFTP() as sftp_helper:
+        sftp_helper.verify_backup(remote_dir=REMOTE_BACKUP_DIR)
+
+
+def restore(
+    outline_volume: str,
+    dedup: bool = False,
+    streaming: bool = False,
+    db_jobs: int | None = None,
+    only: str | None = None,
+):
+    if only:
+        restore_selected(outline_volume, only, db_jobs=db_jobs)
+        return
+
     local_restore_dir = Path("./restores")
     local_restore_dir.mkdir(parents=True, exist_ok=True)
 
-    latest_backup = sftp_helper.download_backup(
-        remote_dir=REMOTE_BACKUP_DIR, local_dir=local_restore_dir
-    )
-    sftp_helper.close()
+    with BackupHelperSFTP() as sftp_helper:
+        if dedup:
+            latest_backup = sftp_helper.download_dedup_backup(
+                remote_dir=REMOTE_DEDUP_DIR, local_dir=local_restore_dir
+            )
+        else:
+            latest_backup = sftp_helper.download_backup(
+                remote_dir=REMOTE_BACKUP_DIR, local_dir=local_restore_dir
+            )
 
-    backup = OutlineBackup(outline_volume, restore_archive_path=latest_backup)
+    backup = OutlineBackup(
+        outline_volume,
+        restore_archive_path=latest_backup,
+        streaming=streaming,
+        db_jobs=db_jobs,
+    )
     backup.restore_backup()
 
     # Cleanup downloaded restore file
     latest_backup.unlink(missing_ok=True)
+    if dedup:
+        shutil.rmtree(local_restore_dir / "chunks", ignore_errors=True)
+
+    print("Restore completed.")
+
+
+def _upload_while_creating(
+    backup: OutlineBackup, destinations: list[Destination]
+) -> dict[str, str | None]:
+    """
+    Stream the archive through a pipe into the uploads, so creation and upload
+    overlap and the archive never lands on local disk.
+
+    Returns:
+        dict[str, str | None]: Destination name -> error message, None on success.
+    """
+    read_fd, write_fd = os.pipe()
+
+    def produce():
+        with open(write_fd, "wb") as writer:
+            backup.stream_backup(writer)
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        with open(read_fd, "rb") as reader:
+            producer = pool.submit(produce)
+
+            def chunks():
+                while chunk := reader.read(PIPE_CHUNK_SIZE):
+                    yield chunk
+                # EOF also happens when the producer dies: never commit a
+                # truncated archive, re-raise its error before the rename
+                producer.result()
+
+            try:
+                results = fan_out_upload(
+                    chunks(), destinations, remote_name=backup.archive_path.name
+                )
+            finally:
+                # Unblocks the producer if the uploads failed midway
+                reader.close()
+
+        # Once every destination failed, the producer only died of the closed pipe
+        if not all(results.values()):
+            producer.result()
+
+    return results
+
+
+def _check_uploads(results: dict[str, str | None]):
+    failed = {name: error for name, error in results.items() if error}
+    if failed:
+        raise RuntimeError(
+            "Upload failed for "
+            + "; ".join(f"{name}: {error}" for name, error in failed.items())
+        )
+
+
+def restore_selected(outline_volume: str, only: str, db_jobs: int | None = None):
+    """
+    Restore only the DB or one media path from the latest (seekable) backup,
+    reading just the needed byte ranges over SFTP.
+    """
+    with BackupHelperSFTP() as sftp_helper:
+        archive = sftp_helper.open_seekable_backup(remote_dir=REMOTE_BACKUP_DIR)
+
+        backup = OutlineBackup(outline_volume, db_jobs=db_jobs)
+        backup.restore_selected(archive, only)
 
     print("Restore completed.")
 
 
-def backup(outline_volume: str, archive_path: str | None = None):
+def backup(
+    outline_volume: str,
+    archive_path: str | None = None,
+    streaming: bool = False,
+    codec: str | None = None,
+    dedup: bool = False,
+    pipe_upload: bool = False,
+    db_jobs: int | None = None,
+    mirror: bool = False,
+):
     start_time = datetime.now(timezone.utc)
     status = "success"
     error = None
+    uploads = None
+    reset_stages()
+
+    # Cron, the daemon and manual runs all take the same lock
+    run_lock = FileLock(BACKUP_RUN_LOCK)
+    if not run_lock.acquire():
+        reason = f"another backup run is in progress (pid {run_lock.holder()})"
+        print(f"Skipping backup: {reason}")
+        log_execution(build_log_entry(start_time, "overlap", 0.0, reason))
+        return
 
     try:
+        if dedup:
+            with BackupHelperSFTP() as sftp_helper:
+                # Only chunks the remote store does not have yet are written and
+                # uploaded
+                known_chunks = sftp_helper.list_remote_chunks(REMOTE_DEDUP_DIR)
+                backup = OutlineBackup(outline_volume, mirror=mirror)
+                backup_dir = backup.create_dedup_backup(known_chunks)
+
+                try:
+                    sftp_helper.upload_dedup_backup(
+                        local_dir=backup_dir, remote_dir=REMOTE_DEDUP_DIR
+                    )
+                finally:
+                    shutil.rmtree(backup_dir, ignore_errors=True)
+
+            print(f"Dedup backup created at: {REMOTE_DEDUP_DIR.as_posix()}")
+            return
+
+        if pipe_upload:
+            backup = OutlineBackup(
+                outline_volume,
+                streaming=True,
+                codec=codec,
+                db_jobs=db_jobs,
+                mirror=mirror,
+            )
+            uploads = _upload_while_creating(
+                backup, load_destinations(REMOTE_BACKUP_DIR)
+            )
+            _check_uploads(uploads)
+
+            print(f"Backup created: {backup.archive_path.name} ({', '.join(uploads)})")
+            return
+
         if archive_path:
             backup_path = Path(archive_path)
         else:
             # Step 1: Local backup via Python
-            backup = OutlineBackup(outline_volume)
+            backup = OutlineBackup(
+                outline_volume,
+                streaming=streaming,
+                codec=codec,
+                db_jobs=db_jobs,
+                mirror=mirror,
+            )
             backup_path = backup.create_backup()
 
-        # Step 2: Upload to SFTP
-        sftp_helper = BackupHelperSFTP()
-
-        sftp_helper.upload_backup(
-            local_archive=backup_path, remote_dir=REMOTE_BACKUP_DIR
-        )
+        # Step 2: Upload to every destination at once (SFTP hosts, local copies)
+        uploads = fan_out_upload(backup_path, load_destinations(REMOTE_BACKUP_DIR))
+        _check_uploads(uploads)
 
-        print(f"Backup created at: {(REMOTE_BACKUP_DIR / backup_path.name).as_posix()}")
+        print(f"Backup created: {backup_path.name} ({', '.join(uploads)})")
         backup_path.unlink(missing_ok=True)
+        Path(f"{backup_path}{CHECKSUM_SUFFIX}").unlink(missing_ok=True)
     except Exception as e:
         status = "failure"
         error = str(e)
     finally:
-        entry = build_log_entry(
-            start_time,
-            status,
-            (datetime.now(timezone.utc) - start_time).total_seconds(),
-            error,
+        try:
+            entry = build_log_entry(
+                start_time,
+                status,
+                (datetime.now(timezone.utc) - start_time).total_seconds(),
+                error,
+                destinations=uploads,
+                stages=recorded_stages(),
+            )
+            log_execution(entry)
+            write_prometheus_textfile(entry)
+        finally:
+            # The daemon keeps running: never leave the lock held
+            run_lock.release()
+
+
+def daemon(outline_volume: str, **backup_options):
+    """
+    Stay resident and run backups on BACKUP_SCHEDULE (plus up to
+    BACKUP_SCHEDULE_JITTER seconds) and the daily report on DAILY_REPORT_SCHEDULE,
+    reusing the imports, settings and pooled SFTP connections between runs.
+    Skipped slots are logged as "missed" / "overlap" entries. Stops on SIGTERM /
+    SIGINT after the running jobs finish.
+
+    Arguments:
+        outline_volume (str): Docker volume to back up.
+        **backup_options: Passed to backup() (codec, streaming, pipe_upload, ...).
+    """
+    from daily_report import daily_report
+
+    instance_lock = FileLock(BACKUP_DAEMON_LOCK)
+    if not instance_lock.acquire():
+        raise RuntimeError(
+            f"Backup daemon already running (pid {instance_lock.holder()})"
         )
-        log_execution(entry)
+
+    try:
+        # Connect once up front: bad credentials show now, not at the first slot
+        for destination in load_destinations(REMOTE_BACKUP_DIR):
+            if destination.kind == "sftp":
+                with destination.open() as target:
+                    target.connect()
+
+        def log_skipped(slot: datetime, status: str, reason: str):
+            log_execution(build_log_entry(slot, status, 0.0, reason))
+
+        scheduler = Scheduler(
+            [
+                Job(
+                    "backup",
+                    CronSchedule(BACKUP_SCHEDULE),
+                    lambda: backup(outline_volume, **backup_options),
+                    jitter=BACKUP_SCHEDULE_JITTER,
+                    on_skip=log_skipped,
+                ),
+                Job("daily_report", CronSchedule(DAILY_REPORT_SCHEDULE), daily_report),
+            ]
+        )
+
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *_: scheduler.stop())
+
+        print(f"Backup daemon started (pid {os.getpid()})")
+        scheduler.run()
+        print("Backup daemon stopped.")
+    finally:
+        instance_lock.release()
 
 
 if __name__ == "__main__":
@@ -109,19 +338,130 @@ if __name__ == "__main__":
         "--archive-path",
         help="Path to a pre-created archive to upload (skips local backup creation).",
     )
+    parser.add_argument(
+        "--streaming",
+        action="store_true",
+        help=(
+            "Stream the DB dump and volume straight into the archive on backup, "
+            "and archive members straight into pg_restore / the volume on restore."
+        ),
+    )
+    parser.add_argument(
+        "--pipe-upload",
+        action="store_true",
+        help="Upload the archive while it is being created (implies --streaming).",
+    )
+    parser.add_argument(
+        "--codec",
+        choices=["gzip", "pigz", "zstd", "none", "seekable"],
+        help="Archive compression codec (defaults to BACKUP_CODEC, then gzip).",
+    )
+    parser.add_argument(
+        "--db-jobs",
+        type=int,
+        help=(
+            "Parallel pg_dump/pg_restore jobs; more than 1 uses directory-format "
+            "dumps (defaults to PG_DUMP_JOBS, then 1)."
+        ),
+    )
+    parser.add_argument(
+        "--mirror",
+        action="store_true",
+        help=(
+            "Archive media from a persistent local mirror of the volume that is "
+            "updated incrementally (BACKUP_MIRROR_DIR, default backups/mirror). "
+            "Not available with --streaming / --pipe-upload / --dedup."
+        ),
+    )
+    parser.add_argument(
+        "--dedup",
+        action="store_true",
+        help="Use the chunked, deduplicated remote store (backup and restore).",
+    )
+    parser.add_argument(
+        "--only",
+        help=(
+            "With --restore: restore only 'db' or 'media/<path>' from the latest "
+            "backup using ranged reads (needs archives made with --codec seekable)."
+        ),
+    )
     parser.add_argument(
         "--download",
         action="store_true",
         help="Download the latest backup from SFTP and print its local path to stdout.",
     )
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help=(
+            "Check the latest remote backup against its recorded checksum, hashed "
+            "on the server when it supports it."
+        ),
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help=(
+            "Keep running and back up on BACKUP_SCHEDULE (cron syntax), sending the "
+            "daily report on DAILY_REPORT_SCHEDULE. Backup flags apply to every run."
+        ),
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="",
+        metavar="TRACE_FILE",
+        help=(
+            "Write a Chrome trace (chrome://tracing, ui.perfetto.dev) of the run: "
+            "stages, child processes, CPU vs blocked time, memory and bytes moved "
+            "(default file: profiles/<start time>.trace.json)."
+        ),
+    )
     args = parser.parse_args()
 
-    if args.restore:
-        restore(outline_volume)
-        exit(0)
+    if args.mirror and (args.streaming or args.pipe_upload or args.dedup):
+        parser.error(
+            "--mirror cannot be combined with --streaming, --pipe-upload or --dedup"
+        )
 
-    if args.download:
-        download()
-        exit(0)
+    if args.profile is not None:
+        start_profiling()
 
-    backup(outline_volume, archive_path=args.archive_path)
+    try:
+        if args.restore:
+            restore(
+                outline_volume,
+                dedup=args.dedup,
+                streaming=args.streaming,
+                db_jobs=args.db_jobs,
+                only=args.only,
+            )
+        elif args.download:
+            download()
+        elif args.verify:
+            verify()
+        elif args.daemon:
+            daemon(
+                outline_volume,
+                streaming=args.streaming,
+                codec=args.codec,
+                dedup=args.dedup,
+                pipe_upload=args.pipe_upload,
+                db_jobs=args.db_jobs,
+                mirror=args.mirror,
+            )
+        else:
+            backup(
+                outline_volume,
+                archive_path=args.archive_path,
+                streaming=args.streaming,
+                codec=args.codec,
+                dedup=args.dedup,
+                pipe_upload=args.pipe_upload,
+                db_jobs=args.db_jobs,
+                mirror=args.mirror,
+            )
+    finally:
+        if args.profile is not None:
+            # stderr: --download keeps stdout for the archive path
+            print(f"Profile written: {stop_profiling(args.profile)}", file=sys.stderr)
@@ -0,0 +1,99 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import main
+from comment_index import CommentIndex
+from document_cache import DocumentCache
+
+CONCURRENCY = 3
+
+
+class _StubOutline(BaseHTTPRequestHandler):
+    # Keep-alive, like the real API
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        stats = self.server.stats
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+
+        with stats["lock"]:
+            stats["in_flight"] += 1
+            stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+            stats["connections"].add(self.client_address)
+        try:
+            # Long enough for the calls to overlap
+            time.sleep(0.02)
+            if body["id"].startswith("missing"):
+                status, payload = 404, {"ok": False, "error": "not_found"}
+            else:
+                status, payload = 200, {"data": {"id": body["id"], "title": "Doc"}}
+        finally:
+            with stats["lock"]:
+                stats["in_flight"] -= 1
+
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def outline():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubOutline)
+    server.stats = {
+        "lock": threading.Lock(),
+        "in_flight": 0,
+        "max_in_flight": 0,
+        "connections": set(),
+    }
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(outline, tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "OUTLINE_API_CONCURRENCY", CONCURRENCY)
+    # Pacing is tested with the rate limiter, keep it out of the way here
+    monkeypatch.setattr(main, "OUTLINE_API_RATE", 1000.0)
+    monkeypatch.setattr(main, "OUTLINE_API_BURST", 1000)
+
+    client = main.OutlineAPIClient(
+        base_url=f"http://127.0.0.1:{outline.server_port}",
+        api_key="test",
+        cache=DocumentCache(tmp_path / "cache.db"),
+        comment_index=CommentIndex(tmp_path / "cache.db"),
+    )
+    yield client
+    client.close()
+
+
+def test_documents_info_bounded_concurrency_and_reuse(outline, client):
+    ids = [f"doc-{i}" for i in range(30)]
+    results = client.fetch_documents_info(ids)
+
+    assert list(results) == ids
+    assert all(results[i]["data"]["id"] == i for i in ids)
+
+    stats = outline.stats
+    assert 1 < stats["max_in_flight"] <= CONCURRENCY
+    # Keep-alive: one connection per worker, not one per request
+    assert len(stats["connections"]) <= CONCURRENCY
+
+
+def test_documents_info_failures_map_to_none(client):
+    results = client.fetch_documents_info(["doc-1", "missing-1", "doc-2"])
+
+    assert results["missing-1"] is None
+    assert results["doc-1"]["data"]["id"] == "doc-1"
+    assert results["doc-2"]["data"]["id"] == "doc-2"
@@ -0,0 +1,42 @@
+import io
+import os
+import tarfile
+
+from seekable_archive import FRAME_SIZE, SeekableArchive, SeekableTarFile
+
+
+def _write_archive(members: dict[str, bytes]) -> io.BytesIO:
+    out = io.BytesIO()
+    with SeekableTarFile(out, threads=2) as tar:
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    out.seek(0)
+    return out
+
+
+def test_member_across_frames_copies_through_addfile():
+    big = os.urandom(FRAME_SIZE + FRAME_SIZE // 2)
+    archive = SeekableArchive.from_file(
+        _write_archive({"small.txt": b"hello", "big.bin": big})
+    )
+
+    copy = io.BytesIO()
+    with tarfile.open(fileobj=copy, mode="w:") as tar:
+        for entry in archive.select(lambda name: True):
+            tar.addfile(archive.to_member(entry), archive.open_member(entry))
+
+    copy.seek(0)
+    with tarfile.open(fileobj=copy, mode="r:") as tar:
+        assert tar.extractfile("big.bin").read() == big
+        assert tar.extractfile("small.txt").read() == b"hello"
+
+
+def test_index_larger_than_a_frame():
+    members = {f"attachments/{i:06d}.txt": b"x" for i in range(40000)}
+    archive = SeekableArchive.from_file(_write_archive(members))
+
+    assert len(archive.entries) == len(members)
+    entry = archive.select(lambda name: name.endswith("039999.txt"))[0]
+    assert b"".join(archive.iter_data(entry)) == b"x"
@@ -0,0 +1,152 @@
+import hashlib
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+import paramiko
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "benchmarks"))
+
+from backup_helper import STATE_SUFFIX, BackupHelperSFTP  # noqa: E402
+from sftp_server import LocalSFTPServer  # noqa: E402
+
+BLOCK_SIZE = 64 * 1024
+
+
+@pytest.fixture(scope="module")
+def server(tmp_path_factory):
+    root = tmp_path_factory.mktemp("remote")
+    return root, LocalSFTPServer(root)
+
+
+@pytest.fixture
+def helper(server):
+    _, sftp_server = server
+    helper = BackupHelperSFTP(
+        host="127.0.0.1", port=sftp_server.port, username="u", password="p"
+    )
+    helper.block_size = BLOCK_SIZE
+    helper.channels = 3
+    helper.max_retries = 0
+    helper._init_connection()
+    yield helper
+    helper.close()
+
+
+@pytest.fixture
+def block_writes(monkeypatch):
+    """
+    Record the channel of every block write; `fail_after` drops the connection
+    once that many blocks were written.
+    """
+    writes = []
+    lock = threading.Lock()
+    state = {"fail_after": None}
+    real_open = paramiko.SFTPClient.open
+
+    def open_(self, filename, mode="r", bufsize=-1):
+        if mode == "r+b":
+            with lock:
+                if (
+                    state["fail_after"] is not None
+                    and len(writes) >= state["fail_after"]
+                ):
+                    state["fail_after"] = None
+                    raise EOFError("connection dropped")
+                writes.append(id(self))
+            # Keep every channel busy, so the blocks spread over all of them
+            time.sleep(0.01)
+        return real_open(self, filename, mode, bufsize)
+
+    monkeypatch.setattr(paramiko.SFTPClient, "open", open_)
+    return writes, state
+
+
+def _local_file(tmp_path: Path, blocks: int) -> Path:
+    path = tmp_path / "archive.tar.gz"
+    path.write_bytes(os.urandom(blocks * BLOCK_SIZE - 123))
+    return path
+
+
+def test_blocks_spread_over_channels(server, helper, block_writes, tmp_path):
+    root, _ = server
+    writes, _ = block_writes
+    local = _local_file(tmp_path, 12)
+
+    helper._put_resumable(local, "/multi.bin")
+
+    assert (root / "multi.bin").read_bytes() == local.read_bytes()
+    assert len(writes) == 12
+    assert len(set(writes)) == 3
+
+
+def test_resume_after_dropped_channel(server, helper, block_writes, tmp_path):
+    root, _ = server
+    writes, state = block_writes
+    local = _local_file(tmp_path, 10)
+    state_path = local.with_name(local.name + STATE_SUFFIX)
+
+    state["fail_after"] = 4
+    with pytest.raises(EOFError):
+        helper._put_resumable(local, "/resume.bin")
+    assert state_path.is_file()
+    sent = len(writes)
+
+    # Next attempt reconnects and only sends the blocks still missing
+    helper._reconnect()
+    helper._put_resumable(local, "/resume.bin")
+
+    assert (root / "resume.bin").read_bytes() == local.read_bytes()
+    assert len(writes) == 10
+    assert sent >= 4
+    assert not state_path.exists()
+
+
+def test_checksum_mismatch_detected(server, helper, tmp_path):
+    local = _local_file(tmp_path, 3)
+    # Sidecar written with the archive, disagreeing with its content
+    Path(f"{local}.sha256").write_text(f"{'0' * 64}  {local.name}\n")
+
+    helper.verify = "full"
+    with pytest.raises(RuntimeError, match="checksum mismatch"):
+        helper._put_resumable(local, "/mismatch.bin")
+    assert not local.with_name(local.name + STATE_SUFFIX).exists()
+
+
+def test_no_read_back_without_check_file(helper, tmp_path):
+    local = _local_file(tmp_path, 2)
+    helper._put_resumable(local, "/server.bin")
+
+    # The test server has no check-file: the default mode does not stream it back
+    assert helper._remote_sha256("/server.bin", stream=False) is None
+    assert helper._remote_sha256("/server.bin") is not None
+
+
+def test_reconnect_within_transfer(server, helper, block_writes, tmp_path):
+    root, _ = server
+    writes, state = block_writes
+    local = _local_file(tmp_path, 8)
+
+    helper.max_retries = 1
+    state["fail_after"] = 3
+    helper._put_resumable(local, "/reconnect.bin")
+
+    assert (root / "reconnect.bin").read_bytes() == local.read_bytes()
+    assert len(writes) == 8
+
+
+def test_streamed_upload_not_read_back(server, helper, monkeypatch):
+    root, _ = server
+
+    def read_back(*args, **kwargs):
+        raise AssertionError("remote file streamed back")
+
+    monkeypatch.setattr(paramiko.SFTPFile, "prefetch", read_back)
+    chunks = [os.urandom(1000) for _ in range(5)]
+    digest = helper._put_iter(iter(chunks), "/streamed.bin")
+
+    assert (root / "streamed.bin").read_bytes() == b"".join(chunks)
+    assert digest == hashlib.sha256(b"".join(chunks)).hexdigest()